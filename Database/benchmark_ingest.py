@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF取り込み（データベース構築）のベンチマーク
+各ビルダー・設定（ワーカー数、バッチサイズ、抽出モード）を実PDFと合成PDFで実行し、
+ページ/秒・工程別の時間・ピークメモリ・DBサイズをJSONで出力する。
+基準のJSONと比較して性能の低下を検出する。
+
+使い方:
+    python benchmark_ingest.py [出力JSON] [--baseline 基準JSON] [--synthetic-only]
+"""
+
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 設定
+CORPUS_DIR = r"c:/Users/baoma/TRD/Renesas"
+OUTPUT_PATH = r"c:/Users/baoma/TRD/benchmark_ingest.json"
+SYNTHETIC_PAGES = [50, 500]     # 合成PDFのページ数
+SYNTHETIC_TABLES_PER_PAGE = 1   # 合成PDFの1ページあたりの表の数
+SYNTHETIC_SEED = 850
+REPEAT = 1                      # 各設定の繰り返し回数（ページ/秒は中央値を採用）
+REGRESSION_THRESHOLD = 0.10     # 基準からこの割合以上悪化したら性能低下とみなす
+
+# (ビルダー名, コンストラクタ引数) の組み合わせ
+BUILDER_CONFIGS = [
+    ('standard', {}),
+    ('large', {'batch_size': 100}),
+    ('ultra', {'batch_size': 200, 'max_workers': 1}),
+    ('ultra', {'batch_size': 200, 'max_workers': 4}),
+    ('ultra', {'batch_size': 200, 'max_workers': 4, 'adaptive': True}),
+]
+
+# 抽出モード: nocache（キャッシュ無し）/ cold（空のキャッシュ）/ warm（キャッシュ済み）
+EXTRACTION_MODES = ['nocache', 'cold', 'warm']
+
+# ビルダー名 → (モジュール, クラス)
+BUILDERS = {
+    'standard': ('pdf_to_db', 'PDFDatabaseBuilder'),
+    'large': ('pdf_to_db_large', 'LargePDFDatabaseBuilder'),
+    'ultra': ('pdf_to_db_ultra_fast', 'UltraFastPDFDatabaseBuilder'),
+}
+
+# ビルダーのメソッド → 工程（フェーズ）
+PHASES = {
+    'setup_database': 'schema',
+    'create_schema': 'schema',
+    'extract_and_store': 'extract',
+    'extract_and_store_parallel': 'extract',
+    'create_fts_index': 'index',
+    'create_indexes': 'index',
+    'create_similarity_index': 'index',
+    'compress_text_storage': 'compress',
+    'finalize_for_publish': 'finalize',
+    'publish': 'publish',
+}
+
+# 抽出フェーズ内の細分化した工程（ワーカースレッドの合計時間）と索引作成（IngestPipeline.index）
+STAGES = ['open', 'cache', 'text', 'tables', 'json', 'insert', 'commit', 'sql', 'index']
+
+
+# ========== 合成PDF ==========
+
+SYNTHETIC_WORDS = [
+    'flash', 'memory', 'register', 'sequencer', 'command', 'erase', 'write', 'block', 'protection',
+    'interrupt', 'clock', 'reset', 'mode', 'status', 'error', 'access', 'address', 'data', 'area',
+    'boot', 'security', 'setting', 'operation', 'timing', 'cycle', 'buffer', 'check', 'lock',
+]
+SYNTHETIC_IDENTIFIERS = [
+    'FLMD0', 'FACI', 'FSTATR', 'FENTRYR', 'FCURAME', 'FPCKAR', 'FASTAT', 'FAEINT', 'TAUJ0.CMOR0',
+    'FFA1 0010H', 'PFCMD', 'FRESETR', 'FCMDR', 'FPESTAT', 'FBCCNT', 'FSADDR', 'FEADDR',
+]
+
+
+def _pdf_string(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _synthetic_page_content(rng: random.Random, page_num: int, tables_per_page: int) -> bytes:
+    """1ページ分のコンテンツストリーム（本文・表罫線・ヘッダ/フッタ）"""
+    ops = []
+
+    def text(x: float, y: float, s: str, size: int = 9):
+        ops.append(f"BT /F1 {size} Tf {x:.1f} {y:.1f} Td ({_pdf_string(s)}) Tj ET")
+
+    # ヘッダ/フッタ（全ページ共通の定型行）
+    text(50, 810, 'RH850/F1KM Synthetic Hardware Manual', 8)
+    text(50, 30, f'R01UH0000EJ0100 Rev.1.00  Page {page_num}', 8)
+
+    y = 780.0
+    text(50, y, f'{page_num}.{rng.randint(1, 9)} {rng.choice(SYNTHETIC_IDENTIFIERS)} {rng.choice(SYNTHETIC_WORDS)}', 12)
+    y -= 22
+    for _ in range(rng.randint(14, 22)):
+        words = [rng.choice(SYNTHETIC_WORDS) for _ in range(rng.randint(8, 13))]
+        if rng.random() < 0.5:
+            words.insert(rng.randrange(len(words)), rng.choice(SYNTHETIC_IDENTIFIERS))
+        text(50, y, ' '.join(words).capitalize() + '.')
+        y -= 13
+
+    # 罫線付きの表（pdfplumberのextract_tablesで検出される）
+    for _ in range(tables_per_page):
+        y -= 10
+        rows, cols, row_h, col_w = rng.randint(3, 6), 4, 16, 120
+        top, left = y, 50
+        bottom = top - rows * row_h
+        for r in range(rows + 1):
+            ops.append(f"{left} {top - r * row_h} m {left + cols * col_w} {top - r * row_h} l S")
+        for c in range(cols + 1):
+            ops.append(f"{left + c * col_w} {top} m {left + c * col_w} {bottom} l S")
+        for r in range(rows):
+            for c in range(cols):
+                cell = (['Bit', 'Name', 'R/W', 'Description'][c] if r == 0 else
+                        rng.choice(SYNTHETIC_IDENTIFIERS) if c == 1 else
+                        str(rng.randint(0, 31)) if c == 0 else
+                        rng.choice(['R', 'R/W', 'W']) if c == 2 else rng.choice(SYNTHETIC_WORDS))
+                text(left + c * col_w + 4, top - (r + 1) * row_h + 5, cell, 8)
+        y = bottom - 10
+
+    return '\n'.join(ops).encode('latin-1')
+
+
+def generate_synthetic_pdf(path: Path, pages: int, tables_per_page: int = 1, seed: int = 0) -> Path:
+    """
+    ベンチマーク用の合成PDFを作成（外部ライブラリ不要）
+
+    Args:
+        path: 出力先
+        pages: ページ数
+        tables_per_page: 1ページあたりの罫線付きの表の数
+        seed: 乱数シード（同じ値なら同じ内容）
+
+    Returns:
+        出力先のパス
+    """
+    rng = random.Random(seed)
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    }
+    kids = []
+    for page_num in range(1, pages + 1):
+        page_id, content_id = 2 + page_num * 2, 3 + page_num * 2
+        content = _synthetic_page_content(rng, page_num, tables_per_page)
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content)
+        objects[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        kids.append(b"%d 0 R" % page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b' '.join(kids), pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (obj_id, objects[obj_id])
+    xref_offset = len(out)
+    size = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for obj_id in range(1, size):
+        out += b"%010d 00000 n \n" % offsets[obj_id] if obj_id in offsets else b"0000000000 65535 f \n"
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref_offset)
+
+    path = Path(path)
+    path.write_bytes(bytes(out))
+    return path
+
+
+# ========== 計測 ==========
+
+class StageRecorder:
+    """
+    工程ごとの所要時間と呼び出し回数を集計する（スレッドセーフ）
+
+    工程が入れ子になった場合は内側の時間を外側から差し引く（排他時間）。
+    抽出フェーズ中の工程と、フェーズに関係なく 'index'（索引作成全体）を記録する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stages = {name: {'seconds': 0.0, 'calls': 0} for name in STAGES}
+        self.phases = {}
+        self.phase = None
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        if self.phase != 'extract' and name != 'index':
+            yield
+            return
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                entry = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+                entry['seconds'] += elapsed - children
+                entry['calls'] += 1
+
+    def timed(self, name: str, func):
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def timed_phase(self, name: str, func):
+        def wrapper(*args, **kwargs):
+            previous, self.phase = self.phase, name
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+                self.phase = previous
+        return wrapper
+
+
+def _sql_stage(sql: str) -> str:
+    return 'insert' if sql.lstrip()[:7].upper() in ('INSERT ', 'REPLACE') else 'sql'
+
+
+def _timed_sqlite(recorder: StageRecorder):
+    """executeの種類（INSERT/その他）とcommitの時間を記録する接続を返す sqlite3 の代替"""
+
+    class TimedCursor(sqlite3.Cursor):
+        def execute(self, sql, parameters=()):
+            with recorder.stage(_sql_stage(sql)):
+                return super().execute(sql, parameters)
+
+        def executemany(self, sql, seq_of_parameters):
+            with recorder.stage(_sql_stage(sql)):
+                return super().executemany(sql, seq_of_parameters)
+
+    class TimedConnection(sqlite3.Connection):
+        def cursor(self, factory=TimedCursor):
+            return super().cursor(factory)
+
+        def execute(self, sql, parameters=()):
+            return self.cursor().execute(sql, parameters)
+
+        def executemany(self, sql, seq_of_parameters):
+            return self.cursor().executemany(sql, seq_of_parameters)
+
+        def commit(self):
+            with recorder.stage('commit'):
+                return super().commit()
+
+    class TimedSqlite:
+        def __getattr__(self, name):
+            return getattr(sqlite3, name)
+
+        @staticmethod
+        def connect(database, *args, **kwargs):
+            kwargs.setdefault('factory', TimedConnection)
+            return sqlite3.connect(database, *args, **kwargs)
+
+    return TimedSqlite()
+
+
+def _timed_json(recorder: StageRecorder):
+    """dumps の時間を記録する json モジュールの代替"""
+
+    class TimedJson:
+        def __getattr__(self, name):
+            return getattr(json, name)
+
+    timed = TimedJson()
+    timed.dumps = recorder.timed('json', json.dumps)
+    return timed
+
+
+def instrument(module, builder, recorder: StageRecorder):
+    """ビルダーのモジュールとインスタンスに計測用のラッパーを差し込む"""
+    import pdfplumber.page
+    import extraction_cache
+    import ingest_pipeline
+
+    pdfplumber.page.Page.extract_text = recorder.timed('text', pdfplumber.page.Page.extract_text)
+    pdfplumber.page.Page.extract_tables = recorder.timed('tables', pdfplumber.page.Page.extract_tables)
+    extraction_cache.ExtractionCache.get = recorder.timed('cache', extraction_cache.ExtractionCache.get)
+    extraction_cache.CachedPDF._plumber = recorder.timed('open', extraction_cache.CachedPDF._plumber)
+    ingest_pipeline.IngestPipeline.index = recorder.timed('index', ingest_pipeline.IngestPipeline.index)
+
+    module.open_pdf = recorder.timed('open', module.open_pdf)
+    module.json = _timed_json(recorder)
+    module.sqlite3 = _timed_sqlite(recorder)
+
+    for method, phase in PHASES.items():
+        if hasattr(builder, method):
+            setattr(builder, method, recorder.timed_phase(phase, getattr(builder, method)))
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """このプロセスのピーク常駐メモリ（取得できない環境ではNone）"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        return None
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file()) if path.is_dir() else 0
+
+
+def _prefill_cache(pdf_path: str, cache_dir: str):
+    """warmモード用に抽出キャッシュを作っておく（計測対象外）"""
+    from extraction_cache import open_pdf
+    with open_pdf(pdf_path, cache_dir) as pdf:
+        pdf.metadata
+        pdf.outline
+        for page in pdf.pages:
+            page.extract_text()
+            page.extract_tables()
+            page.release()
+
+
+def run_one(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    1つの設定で1回構築して計測する（子プロセスで実行し、ピークメモリを設定ごとに分ける）
+
+    Args:
+        spec: {'builder', 'settings', 'mode', 'pdf_path', 'work_dir'}
+
+    Returns:
+        計測結果の辞書
+    """
+    import importlib
+
+    work_dir = Path(spec['work_dir'])
+    db_path = work_dir / 'bench.db'
+    cache_dir = str(work_dir / 'cache') if spec['mode'] != 'nocache' else None
+    if spec['mode'] == 'warm':
+        _prefill_cache(spec['pdf_path'], cache_dir)
+
+    module_name, class_name = BUILDERS[spec['builder']]
+    module = importlib.import_module(module_name)
+    builder = getattr(module, class_name)(spec['pdf_path'], str(db_path), cache_dir=cache_dir, **spec['settings'])
+
+    recorder = StageRecorder()
+    instrument(module, builder, recorder)
+
+    start = time.perf_counter()
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        builder.build()
+    elapsed = time.perf_counter() - start
+
+    conn = sqlite3.connect(db_path)
+    pages = conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+    conn.close()
+
+    return {
+        'elapsed': elapsed,
+        'pages': pages,
+        'pages_per_sec': pages / elapsed if elapsed > 0 else 0.0,
+        'stages': {name: {'seconds': round(v['seconds'], 4), 'calls': v['calls']}
+                   for name, v in recorder.stages.items()},
+        'phases': {name: round(seconds, 4) for name, seconds in recorder.phases.items()},
+        'peak_rss_bytes': peak_rss_bytes(),
+        'db_size_bytes': db_path.stat().st_size,
+        'similarity_index_bytes': _dir_size(db_path.with_suffix('.tfidf')),
+    }
+
+
+def _run_in_subprocess(spec: Dict[str, Any]) -> Dict[str, Any]:
+    proc = subprocess.run([sys.executable, str(Path(__file__).resolve()), '--run-one', json.dumps(spec)],
+                          capture_output=True, text=True, cwd=str(Path(__file__).resolve().parent))
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# ========== ベンチマーク本体 ==========
+
+def prepare_inputs(work_dir: Path, synthetic_only: bool = False) -> List[Dict[str, Any]]:
+    """ベンチマーク対象のPDF（実PDFと合成PDF）を列挙"""
+    inputs = []
+    if not synthetic_only and Path(CORPUS_DIR).is_dir():
+        for pdf_path in sorted(Path(CORPUS_DIR).glob('*.pdf')):
+            inputs.append({'name': pdf_path.stem, 'path': str(pdf_path), 'synthetic': False})
+
+    for pages in SYNTHETIC_PAGES:
+        pdf_path = generate_synthetic_pdf(work_dir / f'synthetic_{pages}.pdf', pages,
+                                          SYNTHETIC_TABLES_PER_PAGE, SYNTHETIC_SEED)
+        inputs.append({'name': f'synthetic_{pages}', 'path': str(pdf_path), 'synthetic': True})
+
+    for entry in inputs:
+        entry['bytes'] = Path(entry['path']).stat().st_size
+    return inputs
+
+
+def result_key(result: Dict[str, Any]) -> str:
+    """基準との突き合わせに使うキー"""
+    return f"{result['input']}|{result['builder']}|{json.dumps(result['settings'], sort_keys=True)}|{result['mode']}"
+
+
+def run_benchmarks(inputs: List[Dict[str, Any]], work_dir: Path) -> List[Dict[str, Any]]:
+    """全ての入力・ビルダー設定・抽出モードの組み合わせを実行"""
+    results = []
+    total = len(inputs) * len(BUILDER_CONFIGS) * len(EXTRACTION_MODES)
+    count = 0
+
+    for entry in inputs:
+        for builder, settings in BUILDER_CONFIGS:
+            for mode in EXTRACTION_MODES:
+                count += 1
+                label = f"{entry['name']} / {builder} {settings} / {mode}"
+                runs = []
+                for repeat in range(REPEAT):
+                    run_dir = work_dir / f'run_{count}_{repeat}'
+                    run_dir.mkdir()
+                    try:
+                        runs.append(_run_in_subprocess({'builder': builder, 'settings': settings, 'mode': mode,
+                                                        'pdf_path': entry['path'], 'work_dir': str(run_dir)}))
+                    except Exception as e:
+                        print(f"[警告] {label} の実行に失敗しました: {e}")
+                    finally:
+                        shutil.rmtree(run_dir, ignore_errors=True)
+                if not runs:
+                    continue
+
+                # 繰り返した場合はページ/秒が中央値の回を代表とする
+                runs.sort(key=lambda r: r['pages_per_sec'])
+                result = dict(runs[len(runs) // 2])
+                result.update({'input': entry['name'], 'input_bytes': entry['bytes'], 'synthetic': entry['synthetic'],
+                               'builder': builder, 'settings': settings, 'mode': mode,
+                               'pages_per_sec_runs': [round(r['pages_per_sec'], 2) for r in runs]})
+                results.append(result)
+                print(f"[{count}/{total}] {label}: {result['pages_per_sec']:.1f}ページ/秒"
+                      f"（{result['elapsed']:.2f}秒）")
+    return results
+
+
+def compare_with_baseline(results: List[Dict[str, Any]], baseline: Dict[str, Any],
+                          threshold: float = REGRESSION_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    基準の結果と比較し、悪化した項目を返す
+
+    Args:
+        results: 今回の結果
+        baseline: 基準のJSON（このスクリプトの出力）
+        threshold: 悪化とみなす割合
+
+    Returns:
+        [{'key', 'metric', 'baseline', 'current', 'change'}] のリスト
+    """
+    base = {result_key(r): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        previous = base.get(result_key(result))
+        if previous is None:
+            continue
+        checks = [('pages_per_sec', -1), ('peak_rss_bytes', 1), ('db_size_bytes', 1)]
+        for metric, direction in checks:
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * direction > threshold:
+                regressions.append({'key': result_key(result), 'metric': metric,
+                                    'baseline': old, 'current': new, 'change': round(change, 4)})
+    return regressions
+
+
+def print_summary(results: List[Dict[str, Any]]):
+    """結果の一覧を表示"""
+    print(f"\n{'='*70}")
+    print("取り込みベンチマーク結果")
+    print(f"{'='*70}")
+    for r in results:
+        stages = ', '.join(f"{name} {v['seconds']:.2f}s" for name, v in r['stages'].items() if v['calls'])
+        rss = f"{r['peak_rss_bytes'] / 1024 / 1024:.0f}MB" if r['peak_rss_bytes'] else '-'
+        print(f"{r['input']} / {r['builder']} {r['settings']} / {r['mode']}")
+        print(f"  {r['pages_per_sec']:.1f}ページ/秒  {r['elapsed']:.2f}秒  ピークRSS {rss}  "
+              f"DB {r['db_size_bytes'] / 1024:.0f}KB")
+        print(f"  フェーズ: {', '.join(f'{k} {v:.2f}s' for k, v in r['phases'].items())}")
+        print(f"  工程内訳: {stages}")
+    print(f"{'='*70}")
+
+
+def _option(name: str) -> Optional[str]:
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return None
+
+
+def main():
+    """メイン関数（引数: [出力JSON] [--baseline 基準JSON] [--synthetic-only]）"""
+    if '--run-one' in sys.argv:
+        print(json.dumps(run_one(json.loads(_option('--run-one')))))
+        return
+
+    baseline_path = _option('--baseline')
+    positional = [arg for i, arg in enumerate(sys.argv[1:], 1)
+                  if not arg.startswith('--') and sys.argv[i - 1] != '--baseline']
+    output_path = positional[0] if positional else OUTPUT_PATH
+
+    print("=" * 70)
+    print("PDF取り込み ベンチマーク")
+    print("=" * 70)
+    print(f"開始時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+
+    work_dir = Path(tempfile.mkdtemp(prefix='benchmark_ingest_'))
+    try:
+        inputs = prepare_inputs(work_dir, synthetic_only='--synthetic-only' in sys.argv)
+        for entry in inputs:
+            print(f"[入力] {entry['name']} ({entry['bytes']:,} bytes)")
+        print()
+        results = run_benchmarks(inputs, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_summary(results)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {'synthetic_pages': SYNTHETIC_PAGES, 'synthetic_tables_per_page': SYNTHETIC_TABLES_PER_PAGE,
+                   'repeat': REPEAT, 'extraction_modes': EXTRACTION_MODES},
+        'results': results,
+    }
+
+    regressions = []
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            regressions = compare_with_baseline(results, json.load(f))
+        report['baseline'] = baseline_path
+        report['regressions'] = regressions
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[OK] 結果を保存しました: {output_path}")
+
+    if baseline_path:
+        if regressions:
+            print(f"\n[警告] 基準（{baseline_path}）から{REGRESSION_THRESHOLD:.0%}以上悪化した項目: {len(regressions)}件")
+            for r in regressions:
+                print(f"  {r['key']} {r['metric']}: {r['baseline']} → {r['current']} ({r['change']:+.1%})")
+            sys.exit(1)
+        print(f"[OK] 基準（{baseline_path}）からの性能低下はありません")
+
+
+if __name__ == "__main__":
+    main()
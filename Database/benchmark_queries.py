@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+検索レイテンシのベンチマーク
+全DBファイルに対して FTS・識別子・LIKE・正規表現・コンテキスト・ページ取得を実行し、
+コールド/ウォームキャッシュ、同時読み取り数ごとの p50/p95/p99 をJSONで出力する。
+クエリはDB自身の語彙（FTS5の語彙表・本文）から作成する。
+基準のJSONと比較して、索引やトークナイザの変更の効果を確認する。
+
+使い方:
+    python benchmark_queries.py [DBパス ...] [--output 出力JSON] [--baseline 基準JSON]
+"""
+
+import json
+import math
+import os
+import platform
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from query_helper import QueryHelper
+
+# 設定
+DB_PATHS = [
+    r"c:/Users/baoma/TRD/RH850F1KMS1_Board.db",
+    r"c:/Users/baoma/TRD/RH850_FlashMemory_IF.db",
+    r"c:/Users/baoma/TRD/RH850_FlashMemory_IF_Fast.db",
+    r"c:/Users/baoma/TRD/RH850_Corpus.db",
+]
+OUTPUT_PATH = r"c:/Users/baoma/TRD/benchmark_queries.json"
+QUERIES_PER_KIND = 30           # 種類ごとのクエリ数
+CONCURRENCY = [1, 4, 8]         # 同時読み取りスレッド数
+CACHE_MODES = ['cold', 'warm']
+WARM_PASSES = 3                 # ウォーム計測でクエリセットを繰り返す回数（事前の1周は計測しない）
+RESULT_LIMIT = 10
+IMMUTABLE = False               # finalize済みDBを immutable=1 で開く
+SEED = 850
+REGRESSION_THRESHOLD = 0.10     # 基準からこの割合以上悪化したら性能低下とみなす
+REGRESSION_MIN_MS = 0.5         # 差がこれ未満（ミリ秒）の変化は計測誤差として扱う
+
+# クエリの種類
+QUERY_KINDS = ['fts', 'identifier', 'like', 'regex', 'context', 'page']
+
+_WORD_RE = re.compile(r'[A-Za-z][A-Za-z]{3,}')
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近傍順位法のパーセンタイル（昇順ソート済みのリスト）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+# ========== クエリセット ==========
+
+def _vocabulary(conn: sqlite3.Connection, table: str, column: str) -> List[Tuple[str, int]]:
+    """FTS5の語彙表から (語, 出現ページ数) を出現ページ数の降順で返す"""
+    vocab = f'temp.bench_vocab_{table}'
+    conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {vocab} USING fts5vocab(main, {table}, 'col')")
+    return conn.execute(f'''
+        SELECT term, doc FROM {vocab}
+        WHERE col = ? AND length(term) >= 3 AND term GLOB '[a-z]*'
+        ORDER BY doc DESC, term
+    ''', (column,)).fetchall()
+
+
+def _spread_sample(rng: random.Random, items: List, count: int) -> List:
+    """頻出・中間・希少の各帯から均等に抽出"""
+    if len(items) <= count:
+        return list(items)
+    bands = [items[:len(items) // 10 or 1], items[len(items) // 10:len(items) // 2], items[len(items) // 2:]]
+    picked = []
+    for i, band in enumerate(bands):
+        share = count // 3 + (1 if i < count % 3 else 0)
+        picked.extend(rng.sample(band, min(share, len(band))))
+    return picked
+
+
+def build_query_set(db_path: str, per_kind: int = QUERIES_PER_KIND, seed: int = SEED) -> Dict[str, List]:
+    """
+    DBの語彙と本文からクエリセットを作成
+
+    FTSは語彙表の頻出・中間・希少の語と、同じページに現れる2語の組み合わせ、
+    LIKE・正規表現は本文中で隣り合う2語、ページ取得は実在するページ番号を使う。
+    コーパスDBのLIKE・正規表現は (doc_id, クエリ) として、語を取ったページの文書に絞って走査する。
+
+    Args:
+        db_path: DBファイルパス
+        per_kind: 種類ごとのクエリ数
+        seed: 乱数シード
+
+    Returns:
+        {種類: [クエリ, ...]} の辞書（DBが対応しない種類は含まない）
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(Path(db_path).resolve().as_uri() + '?mode=ro', uri=True)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        row = conn.execute("SELECT value FROM metadata WHERE key = 'schema'").fetchone() if 'metadata' in tables else None
+        is_corpus = row is not None and row[0] == 'corpus'
+
+        terms = [term for term, _ in _vocabulary(conn, 'pages_fts', 'text')]
+        page_keys = conn.execute('SELECT doc_id, page_num FROM pages' if is_corpus else
+                                 'SELECT NULL, page_num FROM pages').fetchall()
+        sample_keys = rng.sample(page_keys, min(len(page_keys), per_kind))
+        texts = []
+        for doc_id, page_num in sample_keys:
+            row = (conn.execute('SELECT text FROM pages WHERE doc_id = ? AND page_num = ?', (doc_id, page_num))
+                   if is_corpus else conn.execute('SELECT text FROM pages WHERE page_num = ?', (page_num,))).fetchone()
+            if row and isinstance(row[0], str):  # 圧縮格納のDBでは本文由来のクエリを作らない
+                texts.append((doc_id, row[0]))
+
+        # 本文で隣り合う2語（語を取ったページの doc_id 付き）
+        phrases = []
+        for doc_id, text in texts:
+            words = _WORD_RE.findall(text)
+            if len(words) >= 2:
+                i = rng.randrange(len(words) - 1)
+                phrases.append((doc_id, words[i], words[i + 1]))
+
+        def scoped(query: str, doc_id: Optional[int]):
+            return (doc_id, query) if is_corpus else query
+
+        singles = _spread_sample(rng, terms, per_kind - per_kind // 3)
+        pairs = [f'{a.lower()} {b.lower()}' for _, a, b in phrases[:per_kind // 3]]
+        queries = {
+            'fts': singles + pairs,
+            'like': [scoped(f'{a} {b}', doc_id) for doc_id, a, b in phrases],
+            'regex': [scoped(rf'{re.escape(a)}\s+{re.escape(b)}', doc_id) for doc_id, a, b in phrases],
+            'context': _spread_sample(rng, terms, per_kind),
+            'page': [tuple(key) for key in sample_keys],
+        }
+        if 'idents_fts' in tables:
+            queries['identifier'] = [term.upper() for term in
+                                     _spread_sample(rng, [t for t, _ in _vocabulary(conn, 'idents_fts', 'idents')],
+                                                    per_kind)]
+    finally:
+        conn.close()
+
+    return {kind: queries[kind] for kind in QUERY_KINDS if queries.get(kind)}
+
+
+def run_query(qh: QueryHelper, kind: str, query) -> int:
+    """1件のクエリを実行し、結果件数を返す"""
+    if kind == 'fts':
+        return len(qh.search_fts(query, limit=RESULT_LIMIT))
+    if kind == 'identifier':
+        return len(qh.search_identifier(query, limit=RESULT_LIMIT))
+    if kind in ('like', 'regex'):
+        search = qh.search_like if kind == 'like' else qh.search_regex
+        if isinstance(query, tuple):  # コーパスDB: (doc_id, クエリ)
+            doc_id, query = query
+            return len(search(query, limit=RESULT_LIMIT, documents=[doc_id]))
+        return len(search(query, limit=RESULT_LIMIT))
+    if kind == 'context':
+        return len(qh.search_with_context(query, limit=RESULT_LIMIT))
+    if kind == 'page':
+        doc_id, page_num = query
+        page = qh.get_document_page(doc_id, page_num) if doc_id is not None else qh.get_page(page_num)
+        return 1 if page else 0
+    raise ValueError(f"未知のクエリ種類: {kind}")
+
+
+# ========== 計測 ==========
+
+def run_workload(db_path: str, queries: Dict[str, List], mode: str, concurrency: int) -> Dict[str, Any]:
+    """
+    クエリセットを同時読み取りスレッドで実行し、種類ごとのレイテンシを集める
+
+    cold: クエリごとに新しい接続を開く（SQLiteのページキャッシュが空の状態。OSのファイルキャッシュは対象外）
+    warm: スレッドごとに1つの接続を使い、1周目を捨てて WARM_PASSES 周を計測する
+
+    Args:
+        db_path: DBファイルパス
+        queries: build_query_set の結果
+        mode: 'cold' または 'warm'
+        concurrency: 同時読み取りスレッド数
+
+    Returns:
+        {'latencies': {種類: [秒, ...]}, 'errors': {種類: 件数}, 'elapsed': 秒, 'count': 件数}
+    """
+    workload = [(kind, query) for kind, items in queries.items() for query in items]
+    latencies = {kind: [] for kind in queries}
+    errors = {kind: 0 for kind in queries}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(concurrency + 1)
+
+    def measure(qh: QueryHelper, kind: str, query, record: bool):
+        start = time.perf_counter()
+        try:
+            run_query(qh, kind, query)
+        except Exception:
+            with lock:
+                errors[kind] += 1
+            return
+        elapsed = time.perf_counter() - start
+        if record:
+            with lock:
+                latencies[kind].append(elapsed)
+
+    def reader(thread_index: int):
+        rng = random.Random(SEED + thread_index)
+        if mode == 'warm':
+            qh = QueryHelper(db_path, immutable=IMMUTABLE)
+            try:
+                for kind, query in workload:
+                    measure(qh, kind, query, record=False)
+                start_barrier.wait()
+                for _ in range(WARM_PASSES):
+                    order = workload[:]
+                    rng.shuffle(order)
+                    for kind, query in order:
+                        measure(qh, kind, query, record=True)
+            finally:
+                qh.close()
+        else:
+            start_barrier.wait()
+            order = workload[:]
+            rng.shuffle(order)
+            for kind, query in order:
+                qh = QueryHelper(db_path, immutable=IMMUTABLE)
+                try:
+                    measure(qh, kind, query, record=True)
+                finally:
+                    qh.close()
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {'latencies': latencies, 'errors': errors, 'elapsed': elapsed,
+            'count': sum(len(v) for v in latencies.values())}
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """レイテンシ（秒）の分布をミリ秒で要約"""
+    values = sorted(latencies)
+    if not values:
+        return {'count': 0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'mean_ms': 0.0, 'max_ms': 0.0}
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3),
+    }
+
+
+def benchmark_database(db_path: str) -> List[Dict[str, Any]]:
+    """1つのDBについて全てのキャッシュモード・同時読み取り数を計測"""
+    queries = build_query_set(db_path)
+    print(f"\n[DB] {db_path}")
+    print(f"[情報] クエリ: {', '.join(f'{kind} {len(items)}件' for kind, items in queries.items())}")
+
+    results = []
+    for mode in CACHE_MODES:
+        for concurrency in CONCURRENCY:
+            run = run_workload(db_path, queries, mode, concurrency)
+            qps = run['count'] / run['elapsed'] if run['elapsed'] > 0 else 0.0
+            for kind, values in run['latencies'].items():
+                results.append({'db': Path(db_path).name, 'kind': kind, 'mode': mode, 'concurrency': concurrency,
+                                'errors': run['errors'][kind], 'throughput_qps': round(qps, 1),
+                                **summarize(values)})
+            print(f"  {mode:<4} x{concurrency:<2} {qps:>8.1f}クエリ/秒  " +
+                  '  '.join(f"{r['kind']} p50 {r['p50_ms']:.2f} / p95 {r['p95_ms']:.2f}ms"
+                            for r in results if r['mode'] == mode and r['concurrency'] == concurrency))
+    return results
+
+
+def result_key(result: Dict[str, Any]) -> str:
+    """基準との突き合わせに使うキー"""
+    return f"{result['db']}|{result['kind']}|{result['mode']}|{result['concurrency']}"
+
+
+def compare_with_baseline(results: List[Dict[str, Any]], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    基準の結果とp50/p95/p99を比較
+
+    Args:
+        results: 今回の結果
+        baseline: 基準のJSON（このスクリプトの出力）
+
+    Returns:
+        [{'key', 'metric', 'baseline', 'current', 'change'}] のリスト（change は負なら改善）
+    """
+    base = {result_key(r): r for r in baseline.get('results', [])}
+    changes = []
+    for result in results:
+        previous = base.get(result_key(result))
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            old, new = previous.get(metric), result.get(metric)
+            if old:
+                changes.append({'key': result_key(result), 'metric': metric, 'baseline': old, 'current': new,
+                                'change': round((new - old) / old, 4)})
+    return changes
+
+
+def print_comparison(changes: List[Dict[str, Any]], threshold: float = REGRESSION_THRESHOLD,
+                     min_ms: float = REGRESSION_MIN_MS) -> int:
+    """基準との比較を表示し、悪化した項目数を返す（割合・絶対差の両方が閾値以上の変化のみ）"""
+    print(f"\n{'='*70}")
+    print("基準との比較（p50/p95/p99、負の値が改善）")
+    print(f"{'='*70}")
+    significant = [c for c in changes
+                   if abs(c['change']) >= threshold and abs(c['current'] - c['baseline']) >= min_ms]
+    regressions = 0
+    for change in significant:
+        mark = '悪化' if change['change'] > 0 else '改善'
+        regressions += change['change'] > 0
+        print(f"  [{mark}] {change['key']} {change['metric']}: "
+              f"{change['baseline']:.2f} → {change['current']:.2f}ms ({change['change']:+.1%})")
+    if not significant:
+        print(f"  {threshold:.0%}以上かつ{min_ms}ms以上の変化はありません")
+    print(f"{'='*70}")
+    return regressions
+
+
+def _option(name: str) -> Optional[str]:
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return None
+
+
+def main():
+    """メイン関数（引数: [DBパス ...] [--output 出力JSON] [--baseline 基準JSON]）"""
+    output_path = _option('--output') or OUTPUT_PATH
+    baseline_path = _option('--baseline')
+    db_paths = [arg for i, arg in enumerate(sys.argv[1:], 1)
+                if not arg.startswith('--') and sys.argv[i - 1] not in ('--output', '--baseline')] or DB_PATHS
+
+    print("=" * 70)
+    print("検索レイテンシ ベンチマーク")
+    print("=" * 70)
+    print(f"開始時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"キャッシュ: {', '.join(CACHE_MODES)} / 同時読み取り: {CONCURRENCY} / ウォーム計測 {WARM_PASSES}周")
+
+    results = []
+    for db_path in db_paths:
+        if not Path(db_path).exists():
+            print(f"\n[スキップ] データベースが見つかりません: {db_path}")
+            continue
+        results.extend(benchmark_database(db_path))
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {'queries_per_kind': QUERIES_PER_KIND, 'concurrency': CONCURRENCY, 'cache_modes': CACHE_MODES,
+                   'warm_passes': WARM_PASSES, 'result_limit': RESULT_LIMIT, 'immutable': IMMUTABLE, 'seed': SEED},
+        'results': results,
+    }
+
+    regressions = 0
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            changes = compare_with_baseline(results, json.load(f))
+        report['baseline'] = baseline_path
+        report['changes'] = changes
+        regressions = print_comparison(changes)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n[OK] 結果を保存しました: {output_path}")
+
+    if regressions:
+        print(f"[警告] 基準から{REGRESSION_THRESHOLD:.0%}以上悪化した項目: {regressions}件")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DB構築スクリプト共通の後処理
+全文検索インデックス・チェックサム・類似ページ索引の作成、圧縮、公開用の最適化と差し替えを
+pdf_to_db.py / pdf_to_db_large.py / pdf_to_db_ultra_fast.py（公開処理は corpus_builder.py も）で共有する
+"""
+
+from pathlib import Path
+
+from ingest_pipeline import IngestPipeline
+from page_store import compress_storage
+from db_publish import finalize_database, publish_database
+from page_checksums import store_page_checksums
+
+try:
+    from similarity_index import build_similarity_index
+except ImportError:  # NumPyが無い環境では類似ページ索引を作成しない
+    build_similarity_index = None
+
+
+class PublishStepsMixin:
+    """
+    一時ファイルの最適化と公開
+
+    使う側のクラスは conn, build_path, db_path, metrics を持つこと。
+    """
+
+    def finalize_for_publish(self):
+        """公開用に読み取り最適化（ロールバックジャーナルの単一ファイルに置き換え、接続は閉じる）"""
+        print("\n[処理] 公開用に最適化中（FTSマージ、ANALYZE、VACUUM INTO）...")
+        result = finalize_database(self.conn, self.build_path)
+        self.conn = None
+        print(f"[OK] 最適化しました: {result['size_before']:,} → {result['size_after']:,} bytes"
+              f"（ページサイズ {result['page_size']:,}）")
+
+    def publish(self):
+        """一時ファイルを検証し、公開中のDBとアトミックに差し替える（検索側は停止不要）"""
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+        retries = publish_database(self.build_path, self.db_path)
+        self.metrics.incr('publish_retries', retries)
+        self.metrics.set_gauge('db_size_bytes', Path(self.db_path).stat().st_size)
+        print(f"[OK] データベースを公開しました: {self.db_path}")
+
+
+class PDFBuildStepsMixin(PublishStepsMixin):
+    """
+    単一PDFのDB構築の後処理（ページ・テーブルの保存後に呼ぶ）
+
+    使う側のクラスは PublishStepsMixin の属性に加えて pdf_path を持つこと。
+    """
+
+    def create_fts_index(self):
+        """ヘッダ/フッタを除去したテキストで全文検索インデックスを作成"""
+        print("\n[処理] 全文検索インデックスを作成中...")
+        stats = IngestPipeline().index(self.conn)
+        print(f"[OK] 全文検索インデックスを作成しました"
+              f"（ヘッダ/フッタ {stats['boilerplate_lines']}パターン、{stats['chars_removed']:,}文字を除外）")
+
+    def store_checksums(self):
+        """ページ単位のチェックサム（本文・テーブル・全文検索の行・元PDF）を保存（verify_db.py の検証用）"""
+        pages = store_page_checksums(self.conn, self.pdf_path)
+        print(f"[OK] {pages:,}ページのチェックサムを保存しました")
+
+    def create_similarity_index(self):
+        """類似ページ検索用のTF-IDF索引を作成（NumPyが必要）"""
+        if build_similarity_index is None:
+            print("[スキップ] NumPyが無いため類似ページ索引は作成しません")
+            return
+
+        index_dir = build_similarity_index(self.conn, self.build_path)
+        print(f"[OK] 類似ページ索引を作成しました: {index_dir}")
+
+    def compress_text_storage(self):
+        """本文・テーブルを共有辞書付きzlibで圧縮（全文検索インデックスはそのまま）"""
+        print("\n[処理] 本文・テーブルを圧縮中...")
+        raw_bytes, compressed_bytes = compress_storage(self.conn)
+        self.conn.execute('VACUUM')
+        print(f"[OK] 本文・テーブルを圧縮しました: {raw_bytes:,} → {compressed_bytes:,} bytes")
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+構築時のバッチサイズ・ワーカー数の自動調整
+バッチごとの処理速度（ページ/秒）とコミット時間を見て範囲内で調整し、
+選んだ値をDBのmetadataに残して次回の構築の初期値にする
+"""
+
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+# 調整範囲
+MIN_BATCH_SIZE = 25
+MAX_BATCH_SIZE = 2000
+MIN_WORKERS = 1
+MAX_WORKERS_LIMIT = min(32, (os.cpu_count() or 1) + 4)  # ThreadPoolExecutor の既定値と同じ
+
+# コミットがバッチ処理時間のこの割合を超えたらバッチを大きくする
+TARGET_COMMIT_SHARE = 0.05
+
+# 1回のコミットがこの時間（秒）を超えたらバッチを小さくする（進捗・中断時の損失を抑える）
+MAX_COMMIT_SECONDS = 1.0
+
+# ワーカー数を変えて処理速度がこの割合以上上がらなければ元に戻す
+MIN_GAIN = 0.05
+
+# 最初のバッチはPDFの読み込み等を含むため判断に使わない
+WARMUP_BATCHES = 1
+
+# metadata のキー
+TUNED_KEYS = ('tuned_batch_size', 'tuned_workers', 'tuned_pages_per_sec', 'tuned_source')
+
+
+def tuning_source(pdf_path: Union[str, Path]) -> str:
+    """調整結果を引き継ぐPDFの識別子（ファイル名とサイズ）"""
+    path = Path(pdf_path)
+    return f"{path.name}:{path.stat().st_size}"
+
+
+def load_tuned_settings(db_path: Union[str, Path], pdf_path: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """
+    公開中のDBから前回の調整結果を読む
+
+    Args:
+        db_path: 公開中のDBファイル
+        pdf_path: これから構築するPDF（前回と同じPDFの場合のみ値を返す）
+
+    Returns:
+        {'batch_size', 'workers', 'pages_per_sec'}、無い・別のPDFの場合はNone
+    """
+    if not Path(db_path).exists():
+        return None
+    try:
+        conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            placeholders = ', '.join('?' for _ in TUNED_KEYS)
+            rows = dict(conn.execute(f"SELECT key, value FROM metadata WHERE key IN ({placeholders})",
+                                     TUNED_KEYS).fetchall())
+        finally:
+            conn.close()
+        if rows.get('tuned_source') != tuning_source(pdf_path):
+            return None
+        return {
+            'batch_size': int(rows['tuned_batch_size']),
+            'workers': int(rows['tuned_workers']),
+            'pages_per_sec': float(rows.get('tuned_pages_per_sec') or 0),
+        }
+    except (sqlite3.Error, KeyError, ValueError, OSError):
+        return None
+
+
+class BatchTuner:
+    """
+    バッチサイズとワーカー数の自動調整
+
+    バッチをコミットするたびに observe() に処理ページ数・経過時間・コミット時間を渡す。
+
+    - バッチサイズ: コミットが経過時間の TARGET_COMMIT_SHARE を超えたら2倍、
+      1回のコミットが MAX_COMMIT_SECONDS を超えたら半分にする（以降はそのサイズを上限にする）
+    - ワーカー数: 山登り法。1つ増やして（上限なら減らして）処理速度が MIN_GAIN 以上上がれば
+      同じ向きに進め、上がらなければ戻す。最初の一歩で改善しなければ逆向きを1回試し、以降は固定する
+
+    1回の observe() で変えるのはどちらか一方だけにし、速度の比較が混ざらないようにする。
+    ワーカー数を変えた後は、その結果を評価するバッチが終わるまでバッチサイズを変えない。
+    """
+
+    def __init__(self, batch_size: int, workers: int,
+                 min_batch_size: int = MIN_BATCH_SIZE, max_batch_size: int = MAX_BATCH_SIZE,
+                 min_workers: int = MIN_WORKERS, max_workers: int = MAX_WORKERS_LIMIT):
+        """
+        Args:
+            batch_size: バッチサイズの初期値
+            workers: ワーカー数の初期値
+            min_batch_size, max_batch_size: バッチサイズの範囲
+            min_workers, max_workers: ワーカー数の範囲
+        """
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max(min_batch_size, max_batch_size)
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers)
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.workers = min(max(workers, self.min_workers), self.max_workers)
+        self.batches = 0
+        self.adjustments = 0
+        self.settled = self.min_workers == self.max_workers
+        self.pages_per_sec = 0.0   # 直近のバッチの処理速度
+        self._base_rate = None     # 現在のワーカー数を採用したときの処理速度
+        self._direction = 1
+        self._accepted = False     # 今の向きで改善したことがあるか
+        self._reversed = False
+        self._evaluating = False   # 変えたワーカー数の評価待ち（バッチサイズを固定する）
+        self._batch_limit = self.max_batch_size  # コミットが長すぎて縮めたサイズ（これより大きくしない）
+
+    def observe(self, pages: int, seconds: float, commit_seconds: float) -> List[str]:
+        """
+        1バッチ分の計測値から次のバッチの設定を決める
+
+        Args:
+            pages: バッチのページ数
+            seconds: 前回のコミット終了からこのコミット終了までの時間
+            commit_seconds: このコミットにかかった時間
+
+        Returns:
+            変更内容の説明（変更なしなら空）
+        """
+        self.batches += 1
+        if pages <= 0 or seconds <= 0:
+            return []
+        rate = pages / seconds
+        self.pages_per_sec = rate
+        if self.batches <= WARMUP_BATCHES:
+            return []
+
+        # バッチサイズ（コミット時間の割合で判断）。ワーカー数の評価中は同じバッチサイズで比較する
+        batch_size = self.batch_size
+        if not self._evaluating:
+            if commit_seconds > MAX_COMMIT_SECONDS:
+                batch_size = max(self.min_batch_size, self.batch_size // 2)
+                self._batch_limit = batch_size
+            elif commit_seconds / seconds > TARGET_COMMIT_SHARE:
+                batch_size = min(self._batch_limit, self.batch_size * 2)
+        if batch_size != self.batch_size:
+            change = f"バッチサイズ {self.batch_size}→{batch_size}（コミット {commit_seconds * 1000:.0f}ms）"
+            self.batch_size = batch_size
+            self._base_rate = None  # 速度の基準を測り直す
+            self.adjustments += 1
+            return [change]
+
+        if self.settled:
+            return []
+
+        # ワーカー数（処理速度の山登り）
+        previous = self.workers
+        if self._base_rate is None:
+            self._base_rate = rate
+            self._step()
+        elif rate > self._base_rate * (1 + MIN_GAIN):
+            self._base_rate = rate
+            self._accepted = True
+            self._step()
+        else:
+            self.workers -= self._direction  # 改善しなかった一歩を戻す
+            if not self._accepted and not self._reversed:
+                self._reversed = True
+                self._direction = -self._direction
+                self._step()
+            else:
+                self.settled = True
+
+        self._evaluating = not self.settled and self.workers != previous
+        if self.workers == previous:
+            return []
+        self.adjustments += 1
+        return [f"ワーカー数 {previous}→{self.workers}（{rate:.1f}ページ/秒）"]
+
+    def _step(self):
+        """今の向きにワーカー数を1つ動かす（範囲外なら逆向き、どちらも無理なら固定）"""
+        for direction in (self._direction, -self._direction):
+            workers = self.workers + direction
+            if self.min_workers <= workers <= self.max_workers:
+                if direction != self._direction:
+                    if self._reversed:
+                        break
+                    self._reversed = True
+                    self._direction = direction
+                self.workers = workers
+                return
+        self.settled = True
+
+    def settings(self) -> Dict[str, Any]:
+        """選んだ設定"""
+        return {
+            'batch_size': self.batch_size,
+            'workers': self.workers,
+            'pages_per_sec': round(self._base_rate or self.pages_per_sec, 2),
+            'batches': self.batches,
+            'adjustments': self.adjustments,
+        }
+
+    def metadata_items(self, pdf_path: Union[str, Path]) -> List[tuple]:
+        """metadata に保存する (key, value) のリスト"""
+        settings = self.settings()
+        return [
+            ('tuned_batch_size', str(settings['batch_size'])),
+            ('tuned_workers', str(settings['workers'])),
+            ('tuned_pages_per_sec', str(settings['pages_per_sec'])),
+            ('tuned_source', tuning_source(pdf_path)),
+        ]
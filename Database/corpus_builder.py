@@ -0,0 +1,731 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+複数PDFの統合コーパスデータベース構築スクリプト
+ディレクトリ内の全PDFを文書単位で並列処理し、(doc_id, page_num) をキーとする1つのDBにまとめる
+--watch でディレクトリを監視し、追加・変更・削除されたPDFだけを差分で取り込む
+"""
+
+import sqlite3
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from db_publish import discard_staging, staging_path_for
+from build_steps import PublishStepsMixin
+from extraction_cache import file_sha256, open_pdf
+from page_checksums import CHECKSUM_VERSION, create_checksum_table, page_checksum_rows, store_page_checksums
+from instrumentation import BuildMetrics, create_build_metrics
+from ingest_pipeline import XREF_VERSION, IngestPipeline, normalize_text
+
+# 設定
+CORPUS_DIR = r"c:/Users/baoma/TRD/Renesas"
+DB_PATH = r"c:/Users/baoma/TRD/RH850_Corpus.db"
+MAX_WORKERS = 4           # 文書単位の並列プロセス数
+FINALIZE = True           # 公開用に読み取り最適化（FTSマージ、ANALYZE、VACUUM INTO）する
+EXTRACTION_CACHE_DIR = r"c:/Users/baoma/TRD/.extraction_cache"  # ページ抽出結果のキャッシュ（Noneで無効）
+WATCH_INTERVAL = 10.0     # 監視モードのポーリング間隔（秒）
+METRICS_JSONL_PATH = None       # 構築の計測イベントのJSON Lines出力先（Noneで無効）
+METRICS_PROMETHEUS_PATH = None  # 計測値のPrometheusテキスト形式の出力先（Noneで無効）
+
+# metadataテーブルの schema 値（QueryHelperがコーパスDBの判別に使う）
+CORPUS_SCHEMA = 'corpus'
+
+
+def document_tag(doc_id: int) -> str:
+    """FTSのdoc列に入れる文書トークン（文書の絞り込みをFTSのインデックスで行う）"""
+    return f"d{doc_id}"
+
+
+def extract_document(pdf_path: str, cache_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    1文書を抽出し、検索用の派生データまで計算する（ワーカープロセス用）
+
+    Args:
+        pdf_path: PDFファイルパス
+        cache_dir: 抽出キャッシュのディレクトリ
+
+    Returns:
+        {'metadata', 'outline', 'pages', 'tables', 'derived', 'page_times'} の辞書
+        （page_times は (ページ番号, 秒, 文字数, テーブル数, バイト数) のリスト）
+    """
+    with open_pdf(pdf_path, cache_dir) as pdf:
+        metadata = pdf.metadata
+        outline = pdf.outline
+
+        pages = []
+        tables = []
+        page_times = []
+        for page in pdf.pages:
+            page_start = time.perf_counter()
+            text = normalize_text(page.extract_text() or "")
+            page_tables = page.extract_tables()
+            pages.append((page.page_number, text, len(text), len(page_tables)))
+            page_bytes = len(text.encode('utf-8'))
+            for idx, table in enumerate(page_tables):
+                table_json = json.dumps(table, ensure_ascii=False)
+                tables.append((page.page_number, idx, table_json))
+                page_bytes += len(table_json.encode('utf-8'))
+            page.release()
+            page_times.append((page.page_number, time.perf_counter() - page_start,
+                               len(text), len(page_tables), page_bytes))
+
+    derived = IngestPipeline().prepare([(page_num, text) for page_num, text, _, _ in pages], outline)
+    return {'metadata': metadata, 'outline': outline, 'pages': pages, 'tables': tables, 'derived': derived,
+            'page_times': page_times}
+
+
+class CorpusDatabaseBuilder(PublishStepsMixin):
+    """複数PDFの統合コーパスデータベース構築クラス"""
+
+    def __init__(self, pdf_dir: str, db_path: str, max_workers: int = 4, finalize: bool = True,
+                 cache_dir: Optional[str] = None, metrics: Optional[BuildMetrics] = None):
+        self.pdf_dir = pdf_dir
+        self.db_path = db_path
+        self.build_path = staging_path_for(db_path)  # 構築中の一時ファイル（検証後に db_path へ差し替え）
+        self.max_workers = max_workers
+        self.finalize = finalize
+        self.cache_dir = cache_dir
+        self.metrics = metrics or BuildMetrics(Path(db_path).stem)  # 工程・ページ単位の計測（監視モードでは累積）
+        self.conn = None
+        self.start_time = None
+        self._skipped_duplicates = {}  # 監視モードで内容の重複により取り込まなかったファイル（名前 → サイズ・更新時刻）
+
+    def setup_database(self):
+        """データベースの初期設定"""
+        self.conn = sqlite3.connect(self.build_path)
+        cursor = self.conn.cursor()
+
+        # page_sizeはWALへの切り替え後には変更できないため先に設定する
+        cursor.execute('PRAGMA page_size=8192')
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA cache_size=-128000')  # 128MB
+        cursor.execute('PRAGMA temp_store=MEMORY')
+
+        print("[設定] データベース最適化完了")
+
+    def create_schema(self):
+        """データベーススキーマを作成（全テーブルを (doc_id, page_num) で識別）"""
+        cursor = self.conn.cursor()
+
+        # 文書テーブル
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE,
+                path TEXT,
+                sha256 TEXT,
+                page_count INTEGER,
+                title TEXT,
+                metadata TEXT,
+                boilerplate_patterns TEXT,
+                file_size INTEGER,
+                file_mtime INTEGER
+            )
+        ''')
+
+        # ページテーブル
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                doc_id INTEGER,
+                page_num INTEGER,
+                text TEXT,
+                char_count INTEGER,
+                table_count INTEGER,
+                PRIMARY KEY (doc_id, page_num),
+                FOREIGN KEY (doc_id) REFERENCES documents(doc_id)
+            )
+        ''')
+
+        # テーブルテーブル
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tables (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id INTEGER,
+                page_num INTEGER,
+                table_index INTEGER,
+                content TEXT,
+                FOREIGN KEY (doc_id, page_num) REFERENCES pages(doc_id, page_num)
+            )
+        ''')
+
+        # セクションテーブル（各PDFのアウトライン）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id INTEGER,
+                page_num INTEGER,
+                level INTEGER,
+                title TEXT
+            )
+        ''')
+
+        # 近似重複ページ（同じ文書内の代表ページへのリンク）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS page_duplicates (
+                doc_id INTEGER,
+                page_num INTEGER,
+                canonical_page INTEGER,
+                distance INTEGER,
+                PRIMARY KEY (doc_id, page_num)
+            )
+        ''')
+
+        # メタデータテーブル（コーパス全体）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+
+        # FTS5全文検索テーブル（doc列の文書トークンで文書を絞り込む）
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+                doc_id UNINDEXED,
+                page_num UNINDEXED,
+                doc,
+                text,
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+
+        # 段落チャンク索引（オフセットは pages.text 上の文字位置）
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                doc_id UNINDEXED,
+                page_num UNINDEXED,
+                chunk_index UNINDEXED,
+                start_offset UNINDEXED,
+                end_offset UNINDEXED,
+                doc,
+                text,
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+
+        # 相互参照: 参照先（見出し・図表キャプション）と参照元（本文中の "Table 5-1" 等）。文書内で解決する
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS xref_targets (
+                doc_id INTEGER,
+                kind TEXT,
+                label TEXT,
+                page_num INTEGER,
+                title TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS xrefs (
+                doc_id INTEGER,
+                page_num INTEGER,
+                start_offset INTEGER,
+                kind TEXT,
+                label TEXT,
+                text TEXT
+            )
+        ''')
+
+        # ページ単位のチェックサム（verify_db.py の検証用）
+        create_checksum_table(self.conn)
+
+        # 識別子索引
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS idents_fts USING fts5(
+                doc_id UNINDEXED,
+                page_num UNINDEXED,
+                doc,
+                idents,
+                tokenize="unicode61 tokenchars '._'",
+                prefix='2 3 4'
+            )
+        ''')
+
+        self.conn.commit()
+        print("[OK] コーパススキーマを作成しました")
+
+    def scan_directory(self) -> Dict[str, Dict[str, Any]]:
+        """ディレクトリ内のPDFを列挙（文書名 → パス・サイズ・更新時刻）"""
+        files = {}
+        for path in sorted(Path(self.pdf_dir).iterdir()):
+            if path.is_file() and path.suffix.lower() == '.pdf':
+                st = path.stat()
+                files[path.stem] = {'path': path, 'size': st.st_size, 'mtime': st.st_mtime_ns}
+        return files
+
+    def discover_documents(self) -> List[Tuple[Path, str]]:
+        """ディレクトリ内のPDFを名前順に列挙（内容が同じファイルは1つにまとめる）"""
+        documents = []
+        seen = {}
+        for entry in self.scan_directory().values():
+            pdf_path = entry['path']
+            sha256 = file_sha256(pdf_path)
+            if sha256 in seen:
+                print(f"[スキップ] {pdf_path.name} は {seen[sha256].name} と同じ内容です")
+                continue
+            seen[sha256] = pdf_path
+            documents.append((pdf_path, sha256))
+        return documents
+
+    def ingest_documents(self):
+        """全文書を並列に抽出し、終わった文書から順に保存"""
+        documents = self.discover_documents()
+        print(f"\n[情報] 文書数: {len(documents)}")
+        print(f"[情報] 並列プロセス数: {self.max_workers}")
+        print("=" * 70)
+
+        self._ingest([(doc_id, pdf_path, sha256) for doc_id, (pdf_path, sha256) in enumerate(documents, 1)])
+        self._store_corpus_metadata()
+        print("=" * 70)
+
+    def _ingest(self, jobs: List[Tuple[int, Path, str]], replace: Iterable[int] = ()):
+        """
+        (doc_id, PDFパス, SHA-256) の文書を並列に抽出して保存
+
+        replace の doc_id は、抽出が成功した時点で旧版の行を削除して同じトランザクションで保存し直す
+        （抽出に失敗した文書は旧版のまま残り、次回の比較で再び変更として検出される）。
+        """
+        replace = set(replace)
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            future_to_doc = {
+                executor.submit(extract_document, str(pdf_path), self.cache_dir): (doc_id, pdf_path, sha256)
+                for doc_id, pdf_path, sha256 in jobs
+            }
+
+            for future in as_completed(future_to_doc):
+                doc_id, pdf_path, sha256 = future_to_doc[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    kept = '（旧版を残します）' if doc_id in replace else ''
+                    print(f"[警告] {pdf_path.name} の処理中にエラー{kept}: {e}")
+                    self.metrics.incr('document_errors')
+                    continue
+
+                if doc_id in replace:
+                    self._delete_document(doc_id)
+                self._store_document(doc_id, pdf_path, sha256, result)
+                self.metrics.incr('documents')
+                for page_num, seconds, chars, tables, page_bytes in result['page_times']:
+                    self.metrics.record_page(page_num, seconds, chars, tables, page_bytes, document=pdf_path.stem)
+                self.metrics.event('progress', document=pdf_path.stem, doc_id=doc_id,
+                                   documents_total=len(future_to_doc), pages=len(result['pages']))
+                stats = result['derived']['stats']
+                elapsed = time.time() - self.start_time
+                print(f"[OK] d{doc_id} {pdf_path.name}: {stats['pages']:,}ページ"
+                      f"（ヘッダ/フッタ {stats['boilerplate_lines']}パターン除外） 経過: {elapsed:.0f}秒")
+
+    def _store_corpus_metadata(self):
+        """コーパス全体のメタデータ（世代・文書数）を更新"""
+        cursor = self.conn.cursor()
+        cursor.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?)', [
+            ('schema', CORPUS_SCHEMA),
+            ('last_doc_id', str(self._last_doc_id())),
+            ('build_time', datetime.now().isoformat()),  # 読み取り側が世代の判別に使う
+            ('builder_version', 'corpus_v1.0'),
+            ('document_count', str(cursor.execute('SELECT COUNT(*) FROM documents').fetchone()[0])),
+            ('checksum_version', str(CHECKSUM_VERSION)),
+            ('xref_version', str(XREF_VERSION)),
+        ])
+        self.conn.commit()
+
+    def _last_doc_id(self) -> int:
+        """これまでに割り当てた最大のdoc_id（削除済みの文書を含む）"""
+        cursor = self.conn.cursor()
+        row = cursor.execute("SELECT value FROM metadata WHERE key = 'last_doc_id'").fetchone()
+        current = cursor.execute('SELECT MAX(doc_id) FROM documents').fetchone()[0]
+        return max(int(row[0]) if row else 0, current or 0)
+
+    def _store_document(self, doc_id: int, pdf_path: Path, sha256: str, result: Dict[str, Any]):
+        """1文書分のページ・テーブル・セクション・索引行を保存"""
+        cursor = self.conn.cursor()
+        metadata = result['metadata']
+        derived = result['derived']
+        tag = document_tag(doc_id)
+
+        st = pdf_path.stat()
+        cursor.execute('INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+            doc_id, pdf_path.stem, str(pdf_path), sha256, len(result['pages']),
+            metadata.get('Title') or pdf_path.stem,
+            json.dumps(metadata, ensure_ascii=False),
+            json.dumps(derived['patterns'], ensure_ascii=False),
+            st.st_size, st.st_mtime_ns,
+        ))
+        cursor.executemany('INSERT INTO pages VALUES (?, ?, ?, ?, ?)',
+                           [(doc_id, *page) for page in result['pages']])
+        cursor.executemany('INSERT INTO tables (doc_id, page_num, table_index, content) VALUES (?, ?, ?, ?)',
+                           [(doc_id, *table) for table in result['tables']])
+        cursor.executemany('INSERT INTO sections (doc_id, level, title, page_num) VALUES (?, ?, ?, ?)',
+                           [(doc_id, *section) for section in result['outline']])
+        cursor.executemany('INSERT INTO page_duplicates VALUES (?, ?, ?, ?)',
+                           [(doc_id, *row) for row in derived['duplicate_rows']])
+        cursor.executemany('INSERT INTO pages_fts (doc_id, page_num, doc, text) VALUES (?, ?, ?, ?)',
+                           [(doc_id, page_num, tag, text) for page_num, text in derived['fts_rows']])
+        cursor.executemany('INSERT INTO idents_fts (doc_id, page_num, doc, idents) VALUES (?, ?, ?, ?)',
+                           [(doc_id, page_num, tag, idents) for page_num, idents in derived['ident_rows']])
+        self._store_chunks(doc_id, derived['chunk_rows'])
+        self._store_xrefs(doc_id, derived['xref_target_rows'], derived['xref_rows'])
+        cursor.executemany('INSERT INTO page_checksums VALUES (?, ?, ?, ?, ?, ?)',
+                           page_checksum_rows(doc_id, result['pages'], result['tables'], derived['fts_rows']))
+        self.conn.commit()
+
+    def _store_chunks(self, doc_id: int, chunk_rows: Iterable[tuple]):
+        """1文書分の段落チャンクを chunks_fts に保存"""
+        tag = document_tag(doc_id)
+        self.conn.executemany('''
+            INSERT INTO chunks_fts (doc_id, page_num, chunk_index, start_offset, end_offset, doc, text)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(doc_id, page_num, index, start, end, tag, text) for page_num, index, start, end, text in chunk_rows])
+
+    def _store_xrefs(self, doc_id: int, target_rows: Iterable[tuple], xref_rows: Iterable[tuple]):
+        """1文書分の相互参照（参照先・参照元）を保存"""
+        self.conn.executemany('INSERT INTO xref_targets VALUES (?, ?, ?, ?, ?)',
+                              [(doc_id, *row) for row in target_rows])
+        self.conn.executemany('INSERT INTO xrefs VALUES (?, ?, ?, ?, ?, ?)', [(doc_id, *row) for row in xref_rows])
+
+    def create_indexes(self):
+        """インデックスを作成"""
+        cursor = self.conn.cursor()
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tables_page ON tables(doc_id, page_num)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pages_char_count ON pages(char_count)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pages_table_count ON pages(table_count)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sections_page ON sections(doc_id, page_num)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_xref_targets_label ON xref_targets(kind, label, doc_id, page_num)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_xrefs_label ON xrefs(kind, label, doc_id, page_num)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_xrefs_page ON xrefs(doc_id, page_num)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_page_duplicates_canonical '
+                       'ON page_duplicates(doc_id, canonical_page)')
+        self.conn.commit()
+        print("[OK] インデックスを作成しました")
+
+    def print_statistics(self):
+        """統計情報を表示"""
+        cursor = self.conn.cursor()
+
+        print(f"\n{'='*70}")
+        print("コーパス統計")
+        print(f"{'='*70}")
+        rows = cursor.execute('''
+            SELECT d.doc_id, d.name, COUNT(p.page_num), COALESCE(SUM(p.char_count), 0), COALESCE(SUM(p.table_count), 0)
+            FROM documents d LEFT JOIN pages p ON p.doc_id = d.doc_id
+            GROUP BY d.doc_id ORDER BY d.doc_id
+        ''').fetchall()
+        for doc_id, name, page_count, char_count, table_count in rows:
+            print(f"d{doc_id} {name}: {page_count:,}ページ / {table_count:,}テーブル / {char_count:,}文字")
+        print(f"{'='*70}")
+
+    def build(self):
+        """コーパスデータベースを構築"""
+        self.start_time = time.time()
+
+        print("=" * 70)
+        print("統合コーパス データベース構築ツール")
+        print("=" * 70)
+        print(f"開始時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+
+        # 一時ファイルに構築する（公開中のDBは差し替えまでそのまま検索できる）
+        discard_staging(self.build_path)
+        print(f"[作成] 一時ファイルに構築します: {self.build_path}")
+
+        self.setup_database()
+
+        status = 'failed'
+        try:
+            with self.metrics.stage('schema'):
+                self.create_schema()
+
+            # 文書単位の並列抽出と保存
+            with self.metrics.stage('extract'):
+                self.ingest_documents()
+
+            with self.metrics.stage('indexes'):
+                self.create_indexes()
+            self.print_statistics()
+
+            # 公開用の読み取り最適化
+            if self.finalize:
+                with self.metrics.stage('finalize'):
+                    self.finalize_for_publish()
+
+            # 検証して公開中のDBと差し替え
+            with self.metrics.stage('publish'):
+                self.publish()
+            status = 'complete'
+
+            self.metrics.print_report()
+            elapsed = time.time() - self.start_time
+            print(f"\n[完了] コーパス構築完了！ (所要時間: {elapsed:.1f}秒)")
+
+        finally:
+            if self.conn:
+                self.conn.close()
+            self.metrics.summary(status)
+
+    # ========== 監視モード（差分更新） ==========
+
+    def detect_changes(self, conn: sqlite3.Connection, files: Dict[str, Dict[str, Any]],
+                       pending: Iterable[str] = ()) -> Dict[str, list]:
+        """
+        公開中のDBとディレクトリを比較し、追加・変更・削除された文書を返す
+
+        サイズと更新時刻が記録と同じ文書はハッシュを計算しない。
+        異なる場合だけSHA-256を計算し、内容が同じなら更新時刻の記録だけを直す。
+
+        Args:
+            conn: 公開中のDBへの接続
+            files: scan_directory の結果
+            pending: 書き込み中（前回のポーリングからサイズ・更新時刻が変わった）の文書名
+
+        Returns:
+            {'added': [(PDFパス, SHA-256)], 'changed': [(doc_id, PDFパス, SHA-256)],
+             'removed': [(doc_id, 文書名)], 'touched': [(doc_id, PDFパス)]}
+        """
+        pending = set(pending)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(documents)')}
+        stat_columns = 'file_size, file_mtime' if 'file_mtime' in columns else 'NULL, NULL'
+        known = {name: (doc_id, sha256, size, mtime) for name, doc_id, sha256, size, mtime in conn.execute(
+            f'SELECT name, doc_id, sha256, {stat_columns} FROM documents')}
+
+        changes = {'added': [], 'changed': [], 'removed': [], 'touched': []}
+        for name, (doc_id, _, _, _) in known.items():
+            if name not in files:
+                changes['removed'].append((doc_id, name))
+
+        for name, entry in files.items():
+            if name in pending:
+                continue
+            if name not in known:
+                skipped = self._skipped_duplicates.get(name)
+                if skipped != (entry['size'], entry['mtime']):
+                    changes['added'].append((entry['path'], file_sha256(entry['path'])))
+                continue
+
+            doc_id, sha256, size, mtime = known[name]
+            if (size, mtime) == (entry['size'], entry['mtime']):
+                continue
+            new_sha256 = file_sha256(entry['path'])
+            if new_sha256 == sha256:
+                changes['touched'].append((doc_id, entry['path']))
+            else:
+                changes['changed'].append((doc_id, entry['path'], new_sha256))
+
+        # 内容が既存の文書（削除・変更されるものを除く）と同じファイルは取り込まない
+        replaced = {doc_id for doc_id, _ in changes['removed']} | {doc_id for doc_id, _, _ in changes['changed']}
+        seen = {sha256: name for name, (doc_id, sha256, _, _) in known.items() if doc_id not in replaced}
+        seen.update({sha256: path.stem for _, path, sha256 in changes['changed']})
+        added = []
+        for pdf_path, sha256 in changes['added']:
+            if sha256 in seen:
+                print(f"[スキップ] {pdf_path.name} は {seen[sha256]} と同じ内容です")
+                st = pdf_path.stat()
+                self._skipped_duplicates[pdf_path.stem] = (st.st_size, st.st_mtime_ns)
+                continue
+            seen[sha256] = pdf_path.stem
+            added.append((pdf_path, sha256))
+        changes['added'] = added
+        return changes
+
+    def _delete_document(self, doc_id: int):
+        """1文書分の行を全テーブル・全文検索インデックスから削除"""
+        cursor = self.conn.cursor()
+        for table in ('documents', 'pages', 'tables', 'sections', 'page_duplicates', 'page_checksums',
+                      'xref_targets', 'xrefs'):
+            cursor.execute(f'DELETE FROM {table} WHERE doc_id = ?', (doc_id,))
+        # doc列の文書トークンで対象行をFTSのインデックスから引く
+        for table in ('pages_fts', 'idents_fts', 'chunks_fts'):
+            cursor.execute(f'DELETE FROM {table} WHERE rowid IN '
+                           f'(SELECT rowid FROM {table} WHERE {table} MATCH ?)',
+                           (f'doc : {document_tag(doc_id)}',))
+
+    def _migrate_schema(self):
+        """
+        旧スキーマのDBに監視用の列・ページチェックサム・段落チャンク・相互参照を追加
+        （既存文書は次回の比較でハッシュを確認する）
+        """
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(documents)')}
+        for column in ('file_size', 'file_mtime'):
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE documents ADD COLUMN {column} INTEGER')
+        if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'page_checksums'").fetchone():
+            # チェックサム導入前のDBは既存の全文書分を一度だけ計算する
+            pages = store_page_checksums(self.conn)
+            print(f"[OK] 既存の{pages:,}ページのチェックサムを作成しました")
+        has_pages = self.conn.execute('SELECT 1 FROM pages LIMIT 1').fetchone() is not None
+        chunks = has_pages and not self.conn.execute('SELECT 1 FROM chunks_fts LIMIT 1').fetchone()
+        row = self.conn.execute("SELECT value FROM metadata WHERE key = 'xref_version'").fetchone()
+        xrefs = has_pages and (row is None or row[0] != str(XREF_VERSION))
+        if chunks or xrefs:
+            # 段落チャンク・相互参照の導入前（または抽出規則の変更前）のDBは既存の全文書分を一度だけ作成する
+            # （PDFは読み直さず、保存済みのページとアウトラインから作る）
+            pipeline = IngestPipeline(identifiers=False, chunks=chunks, xrefs=xrefs)
+            if xrefs:
+                self.conn.execute('DELETE FROM xref_targets')
+                self.conn.execute('DELETE FROM xrefs')
+            counts = {'chunk_rows': 0, 'xref_rows': 0}
+            for (doc_id,) in self.conn.execute('SELECT doc_id FROM documents').fetchall():
+                rows = self.conn.execute('SELECT page_num, text FROM pages WHERE doc_id = ? ORDER BY page_num',
+                                         (doc_id,)).fetchall()
+                outline = self.conn.execute('SELECT level, title, page_num FROM sections WHERE doc_id = ? '
+                                            'ORDER BY page_num', (doc_id,)).fetchall()
+                derived = pipeline.prepare(rows, outline)
+                self._store_chunks(doc_id, derived['chunk_rows'])
+                self._store_xrefs(doc_id, derived['xref_target_rows'], derived['xref_rows'])
+                for key in counts:
+                    counts[key] += len(derived[key])
+            if chunks:
+                print(f"[OK] 既存の文書から{counts['chunk_rows']:,}個の段落チャンクを作成しました")
+            if xrefs:
+                self.conn.execute('INSERT OR REPLACE INTO metadata VALUES (?, ?)', ('xref_version', str(XREF_VERSION)))
+                print(f"[OK] 既存の文書から{counts['xref_rows']:,}件の相互参照を作成しました")
+        self.conn.commit()
+
+    def update(self, files: Optional[Dict[str, Dict[str, Any]]] = None, pending: Iterable[str] = ()) -> bool:
+        """
+        追加・変更・削除された文書だけを取り込み、公開中のDBを差し替える
+
+        公開中のDBのコピーを一時ファイルに作り、変更のあった文書を再抽出して行を入れ替えてから
+        publish_database でアトミックに差し替える。変更の無い文書は抽出し直さない。
+        再抽出に失敗した文書は旧版のまま公開する。
+
+        Args:
+            files: scan_directory の結果（省略時はここで走査）
+            pending: 書き込み中のため今回は取り込まない文書名
+
+        Returns:
+            DBを更新した場合True
+        """
+        files = files if files is not None else self.scan_directory()
+        pending = set(pending)
+
+        if not Path(self.db_path).exists():
+            if pending:
+                return False
+            self.build()
+            return True
+
+        published = sqlite3.connect(self.db_path)
+        try:
+            changes = self.detect_changes(published, files, pending)
+            if not any(changes.values()):
+                return False
+
+            self.start_time = time.time()
+            print(f"\n[検出] {datetime.now().strftime('%H:%M:%S')} 追加 {len(changes['added'])} / "
+                  f"変更 {len(changes['changed'])} / 削除 {len(changes['removed'])} / "
+                  f"更新時刻のみ {len(changes['touched'])}")
+
+            # 公開中のDBをコピーして一時ファイルに差分を反映する
+            discard_staging(self.build_path)
+            published.execute('VACUUM INTO ?', (str(self.build_path),))
+        finally:
+            published.close()
+
+        for kind in ('added', 'changed', 'removed'):
+            self.metrics.incr(f'documents_{kind}', len(changes[kind]))
+
+        self.setup_database()
+        status = 'failed'
+        try:
+            self.create_schema()
+            self._migrate_schema()
+            cursor = self.conn.cursor()
+            # 削除した文書のdoc_idは再利用しない（検索側が保持しているdoc_idが別文書を指さないように）
+            next_id = self._last_doc_id() + 1
+
+            for doc_id, pdf_path in changes['touched']:
+                st = pdf_path.stat()
+                cursor.execute('UPDATE documents SET path = ?, file_size = ?, file_mtime = ? WHERE doc_id = ?',
+                               (str(pdf_path), st.st_size, st.st_mtime_ns, doc_id))
+            for doc_id, name in changes['removed']:
+                self._delete_document(doc_id)
+                print(f"[削除] d{doc_id} {name}")
+            self.conn.commit()
+
+            # 変更された文書は同じdoc_idで（抽出が成功してから旧版と入れ替える）、追加された文書は新しいdoc_idで取り込む
+            jobs = list(changes['changed'])
+            jobs.extend((doc_id, pdf_path, sha256)
+                        for doc_id, (pdf_path, sha256) in enumerate(changes['added'], next_id))
+            if jobs:
+                with self.metrics.stage('extract'):
+                    self._ingest(jobs, replace=[doc_id for doc_id, _, _ in changes['changed']])
+
+            self._store_corpus_metadata()
+            with self.metrics.stage('indexes'):
+                self.create_indexes()
+
+            if self.finalize:
+                with self.metrics.stage('finalize'):
+                    self.finalize_for_publish()
+            with self.metrics.stage('publish'):
+                self.publish()
+            status = 'complete'
+
+            elapsed = time.time() - self.start_time
+            print(f"[完了] 差分更新完了 (所要時間: {elapsed:.1f}秒)")
+            return True
+
+        finally:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+            self.metrics.summary(status)
+
+    def watch(self, interval: float = WATCH_INTERVAL):
+        """
+        ディレクトリをポーリングで監視し、変更があれば差分更新する（Ctrl+Cで終了）
+
+        コピー途中のファイルを取り込まないよう、2回続けてサイズ・更新時刻が
+        同じだったファイルだけを対象にする。
+
+        Args:
+            interval: ポーリング間隔（秒）
+        """
+        print("=" * 70)
+        print("統合コーパス 監視モード")
+        print("=" * 70)
+        print(f"監視対象: {self.pdf_dir}")
+        print(f"データベース: {self.db_path}")
+        print(f"ポーリング間隔: {interval}秒（Ctrl+Cで終了）")
+
+        previous = {}
+        try:
+            while True:
+                files = self.scan_directory()
+                pending = {name for name, entry in files.items()
+                           if name not in previous
+                           or (previous[name]['size'], previous[name]['mtime']) != (entry['size'], entry['mtime'])}
+                try:
+                    self.update(files, pending)
+                except Exception as e:
+                    print(f"[警告] 差分更新に失敗しました（次回のポーリングで再試行）: {e}")
+                    discard_staging(self.build_path)
+                previous = files
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("\n[完了] 監視を終了しました")
+
+
+def main():
+    """メイン関数（引数: [--watch] [PDFディレクトリ] [DBパス]）"""
+    args = [arg for arg in sys.argv[1:] if arg != '--watch']
+    pdf_dir = args[0] if len(args) > 0 else CORPUS_DIR
+    db_path = args[1] if len(args) > 1 else DB_PATH
+
+    metrics = create_build_metrics(Path(db_path).stem, METRICS_JSONL_PATH, METRICS_PROMETHEUS_PATH)
+    builder = CorpusDatabaseBuilder(pdf_dir, db_path, MAX_WORKERS, finalize=FINALIZE,
+                                    cache_dir=EXTRACTION_CACHE_DIR, metrics=metrics)
+    try:
+        if '--watch' in sys.argv[1:]:
+            builder.watch(WATCH_INTERVAL)
+        else:
+            builder.build()
+    finally:
+        metrics.close(status=None)
+
+
+if __name__ == "__main__":
+    main()
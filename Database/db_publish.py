@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+構築済みデータベースの公開処理
+FTSセグメントのマージ、統計情報の収集、VACUUM INTOによる読み取り専用ファイルの作成、
+一時ファイルからのアトミックな差し替えと、読み取り側での新しい世代の検出
+"""
+
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+# 公開用DBのページサイズ（ビルド中のWALモードでは変更できないためVACUUM INTOで適用する）
+PUBLISH_PAGE_SIZE = 8192
+
+# 構築中の一時ファイル名に付ける印（x.db → x.building.db）
+STAGING_MARK = '.building'
+
+# 類似ページ索引ディレクトリの拡張子（similarity_index.INDEX_SUFFIX と同じ）
+INDEX_SUFFIX = '.tfidf'
+
+# os.replace の再試行（Windowsでは読み取り中のファイルを置き換えられないことがある）
+REPLACE_RETRIES = 50
+REPLACE_RETRY_INTERVAL = 0.1
+
+# 読み取り側がファイルの差し替えを確認する間隔（秒）
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+def fts5_tables(conn: sqlite3.Connection) -> List[str]:
+    """DB内のFTS5仮想テーブル名を返す"""
+    rows = conn.execute('''
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%USING fts5%'
+    ''').fetchall()
+    return [row[0] for row in rows]
+
+
+def remove_sidecar_files(db_path: Union[str, Path]):
+    """WAL・共有メモリ・ジャーナルファイルが残っていれば削除"""
+    for suffix in ('-wal', '-shm', '-journal'):
+        sidecar = Path(f"{db_path}{suffix}")
+        if sidecar.exists():
+            sidecar.unlink()
+
+
+def finalize_database(conn: sqlite3.Connection, db_path: Union[str, Path],
+                      page_size: int = PUBLISH_PAGE_SIZE) -> Dict[str, int]:
+    """
+    公開用にDBを読み取り最適化して置き換える
+
+    1. 全FTS5テーブルのセグメントを 'optimize' で1つにマージ
+    2. ANALYZE でクエリプランナ用の統計を収集
+    3. VACUUM INTO で指定ページサイズ・ロールバックジャーナルの単一ファイルを作成
+    4. 元のファイルを置き換える（WAL/SHMは残らない）
+
+    出力は immutable=1 で開ける不変ファイルになる。この関数は conn を閉じる。
+
+    Args:
+        conn: 構築に使った接続
+        db_path: DBファイルパス
+        page_size: 出力ファイルのページサイズ
+
+    Returns:
+        {'size_before', 'size_after', 'page_size', 'fts_tables'} の辞書
+    """
+    db_path = Path(db_path)
+    wal_path = Path(f"{db_path}-wal")
+    size_before = db_path.stat().st_size + (wal_path.stat().st_size if wal_path.exists() else 0)
+
+    tables = fts5_tables(conn)
+    for table in tables:
+        conn.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+    conn.commit()
+
+    conn.execute('ANALYZE')
+    conn.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?)', [
+        ('finalized_at', datetime.now().isoformat()),
+        ('page_size', str(page_size)),
+    ])
+    conn.commit()
+
+    output_path = Path(f"{db_path}.finalize")
+    if output_path.exists():
+        output_path.unlink()
+
+    conn.execute(f'PRAGMA page_size={int(page_size)}')
+    conn.execute('VACUUM INTO ?', (str(output_path),))
+    conn.close()
+
+    remove_sidecar_files(db_path)
+    os.replace(output_path, db_path)
+
+    return {
+        'size_before': size_before,
+        'size_after': db_path.stat().st_size,
+        'page_size': page_size,
+        'fts_tables': len(tables),
+    }
+
+
+def connect_immutable(db_path: Union[str, Path]) -> sqlite3.Connection:
+    """
+    immutable=1 で接続（ロック・変更検出を一切行わない）
+
+    finalize_database で作成した不変ファイル専用。WALモードのDBや
+    開いている間に書き換えられるDBに使うと結果は保証されない。
+    """
+    uri = Path(db_path).resolve().as_uri() + '?immutable=1'
+    return sqlite3.connect(uri, uri=True)
+
+
+def staging_path_for(db_path: Union[str, Path]) -> Path:
+    """構築用の一時ファイルパスを返す（同じディレクトリに置くためrenameがアトミックになる）"""
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}{STAGING_MARK}{db_path.suffix}")
+
+
+def discard_staging(staging_path: Union[str, Path]):
+    """中断したビルドの一時ファイル・サイドカー・類似ページ索引を削除"""
+    staging_path = Path(staging_path)
+    if staging_path.exists():
+        staging_path.unlink()
+    remove_sidecar_files(staging_path)
+    shutil.rmtree(staging_path.with_suffix(INDEX_SUFFIX), ignore_errors=True)
+
+
+def read_generation(conn: sqlite3.Connection) -> Optional[str]:
+    """DBの世代（metadataのbuild_time）を返す"""
+    try:
+        row = conn.execute("SELECT value FROM metadata WHERE key = 'build_time'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def verify_staged_database(db_path: Union[str, Path], reference: Optional[Union[str, Path]] = None) -> List[str]:
+    """
+    公開前の一時ファイルを検証
+
+    基本的な確認の後、verify_db.verify_database でチェックサム・FTS5の integrity-check を確認する。
+    reference（公開中のDB）を渡すと増分検証になり、チェックサムが公開中のDBと異なるページだけを読み直す。
+
+    Args:
+        db_path: 一時ファイルのパス
+        reference: 増分検証の基準にする公開中のDB
+
+    Returns:
+        問題点のリスト（空なら公開してよい）
+    """
+    problems = []
+    conn = sqlite3.connect(db_path)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+        if result != 'ok':
+            problems.append(f"quick_check: {result}")
+            return problems
+
+        if conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0] == 0:
+            problems.append("ページが1件もありません")
+        if conn.execute('SELECT COUNT(*) FROM pages_fts').fetchone()[0] == 0:
+            problems.append("全文検索インデックスが空です")
+        if read_generation(conn) is None:
+            problems.append("メタデータ build_time がありません")
+    except sqlite3.DatabaseError as e:
+        problems.append(str(e))
+    finally:
+        conn.close()
+
+    if not problems:
+        from verify_db import verify_database  # verify_db は db_publish を使うため、ここで読み込む
+        problems += verify_database(db_path, reference=reference)['problems']
+    remove_sidecar_files(db_path)
+    return problems
+
+
+def _replace_with_retry(source: Path, target: Path) -> int:
+    """os.replace を再試行付きで実行し、再試行した回数を返す"""
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(source, target)
+            return attempt
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(REPLACE_RETRY_INTERVAL)
+
+
+def publish_database(staging_path: Union[str, Path], db_path: Union[str, Path]) -> int:
+    """
+    検証済みの一時ファイルで公開中のDBをアトミックに置き換える
+
+    置き換えはrenameのみで行うため、読み取り側は常に旧DBか新DBの
+    どちらか一方の完全なファイルを見る。開いたままの旧接続は旧ファイルを
+    読み続け、GenerationWatcher で差し替えを検出して開き直す。
+    類似ページ索引（.tfidf）はDBの置き換えが成功した後に差し替える
+    （失敗した場合は公開中のDBと索引の組をそのまま残す）。
+
+    公開先のWAL・共有メモリ・ジャーナルファイルには触れない。読み取り側が開いている可能性があり、
+    残っているジャーナルを消すとDBが壊れることがある（公開するDBは finalize_database で
+    ロールバックジャーナルの単一ファイルにしてあるため、通常は存在しない）。
+
+    Args:
+        staging_path: 構築済みの一時ファイル（接続は閉じておくこと）
+        db_path: 公開先のDBファイルパス
+
+    Returns:
+        置き換えの再試行回数（Windowsで読み取り側がファイルを開いていると再試行になる）
+
+    Raises:
+        RuntimeError: 検証に失敗した場合（公開中のDBはそのまま）
+    """
+    staging_path = Path(staging_path)
+    db_path = Path(db_path)
+
+    problems = verify_staged_database(staging_path, reference=db_path if db_path.exists() else None)
+    if problems:
+        raise RuntimeError(f"検証に失敗したため公開しません: {'; '.join(problems)}")
+
+    retries = _replace_with_retry(staging_path, db_path)
+
+    staged_index = staging_path.with_suffix(INDEX_SUFFIX)
+    if staged_index.exists():
+        index_dir = db_path.with_suffix(INDEX_SUFFIX)
+        retired_index = index_dir.with_name(f"{index_dir.name}.old")
+        shutil.rmtree(retired_index, ignore_errors=True)
+        if index_dir.exists():
+            index_dir.rename(retired_index)
+        staged_index.rename(index_dir)
+        # メモリマップ中の旧索引はPOSIXでは削除後も読める（Windowsでは次回公開時に削除）
+        shutil.rmtree(retired_index, ignore_errors=True)
+
+    return retries
+
+
+class GenerationWatcher:
+    """
+    DBファイルの差し替えを検出する
+
+    rename後も旧接続は旧ファイルを読み続けるため、パス側のファイルの
+    識別情報（inode・サイズ・更新時刻）をstatで比較する。
+    statは RELOAD_CHECK_INTERVAL 秒に1回だけ行う。
+    """
+
+    def __init__(self, db_path: Union[str, Path], interval: float = RELOAD_CHECK_INTERVAL):
+        self.db_path = Path(db_path)
+        self.interval = interval
+        self._stamp = self._stat()
+        self._checked_at = time.monotonic()
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = self.db_path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def reset(self):
+        """現在のファイルを既知の世代として記録"""
+        self._stamp = self._stat()
+        self._checked_at = time.monotonic()
+
+    def changed(self) -> bool:
+        """前回の記録以降にファイルが差し替えられたか（ファイルが無い間はFalse）"""
+        now = time.monotonic()
+        if now - self._checked_at < self.interval:
+            return False
+        self._checked_at = now
+
+        stamp = self._stat()
+        return stamp is not None and stamp != self._stamp
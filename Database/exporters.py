@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全ページのストリーミングエクスポート
+JSONL（1ページ1行）、Markdown（最上位セクションごとに1ファイル、章ごとに並列）、CSV（全テーブル）を
+カーソルから一定ページ数ずつ読みながら逐次書き出すため、最大のマニュアルでもメモリ使用量は一定。
+
+使い方:
+    python exporters.py [DB] [--out 出力ディレクトリ] [--jsonl] [--markdown] [--csv] [--workers N]
+"""
+
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from db_publish import connect_immutable
+from page_store import TextCodec, json_default
+
+# 引数なしで実行したときのDBと出力先
+DB_PATH = r"c:/Users/baoma/TRD/Database/RH850_FlashMemory_IF_Fast.db"
+EXPORT_DIR = r"c:/Users/baoma/TRD/Database/export"
+
+EXPORT_CHUNK_SIZE = 200   # 1回のクエリで読むページ数（メモリ使用量の上限を決める）
+EXPORT_WORKERS = 4        # Markdownを並列に書き出す章の数（プロセス）
+PAGES_PER_FILE = 100      # セクションが無いDBでMarkdownを分割するページ数
+
+_UNSAFE_NAME = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def _open(db_path: Union[str, Path], immutable: bool = False) -> Tuple[sqlite3.Connection, TextCodec, bool]:
+    """読み取り専用で接続し、(接続, 展開用のコーデック, コーパスDBか) を返す"""
+    if immutable:
+        conn = connect_immutable(db_path)
+    else:
+        conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    corpus = any(row[1] == 'doc_id' for row in conn.execute('PRAGMA table_info(pages)'))
+    return conn, TextCodec.from_connection(conn), corpus
+
+
+@contextmanager
+def _atomic_open(path: Union[str, Path], encoding: str = 'utf-8', newline: Optional[str] = None):
+    """一時ファイルに書き、完了したらrenameで置き換える（中断しても書きかけのファイルを残さない）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    try:
+        with open(tmp_path, 'w', encoding=encoding, newline=newline) as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def iter_page_chunks(conn: sqlite3.Connection, codec: TextCodec, corpus: bool = False,
+                     doc_id: Optional[int] = None, page_range: Optional[Tuple[int, int]] = None,
+                     chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    ページを chunk_size 件ずつ読む（キー順のページング）
+
+    チャンクごとに pages をキーの続きから LIMIT 付きで読み、そのキー範囲の tables を1本のクエリで読む。
+    文は毎回完了させるため、長時間の読み取りでも保持する行はチャンク分だけになる。
+
+    Args:
+        conn: データベース接続（row_factory = sqlite3.Row）
+        codec: 本文・テーブルの展開用
+        corpus: (doc_id, page_num) キーのコーパスDBか
+        doc_id: コーパスDBで1文書だけ読む場合の doc_id
+        page_range: (開始, 終了) のページ範囲（両端を含む）
+        chunk_size: 1回に読むページ数
+
+    Yields:
+        ページ情報の辞書（text は展開済み、tables はデコード済みのリスト）のリスト
+    """
+    key = 'doc_id, page_num' if corpus else 'page_num'
+    placeholders = '?, ?' if corpus else '?'
+    conditions, params = [], []
+    if corpus and doc_id is not None:
+        conditions.append('doc_id = ?')
+        params.append(doc_id)
+    if page_range is not None:
+        conditions.append('page_num BETWEEN ? AND ?')
+        params.extend(page_range)
+
+    last_key = None
+    while True:
+        where, args = list(conditions), list(params)
+        if last_key is not None:
+            where.append(f'({key}) > ({placeholders})')
+            args.extend(last_key)
+        sql = 'SELECT * FROM pages'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        rows = conn.execute(f'{sql} ORDER BY {key} LIMIT ?', args + [chunk_size]).fetchall()
+        if not rows:
+            return
+
+        keys = [tuple(row[name] for name in ('doc_id', 'page_num')) if corpus else (row['page_num'],)
+                for row in rows]
+        tables: Dict[tuple, List[Any]] = {}
+        for table_row in conn.execute(f'''
+            SELECT {key}, content FROM tables
+            WHERE ({key}) BETWEEN ({placeholders}) AND ({placeholders})
+            ORDER BY {key}, table_index
+        ''', keys[0] + keys[-1]):
+            tables.setdefault(tuple(table_row)[:-1], []).append(codec.decode_json(table_row['content']))
+
+        pages = []
+        for row, page_key in zip(rows, keys):
+            page = dict(row)
+            page['text'] = codec.decode(page['text'])
+            page['tables'] = tables.get(page_key, [])
+            pages.append(page)
+        yield pages
+
+        if len(rows) < chunk_size:
+            return
+        last_key = keys[-1]
+
+
+def page_markdown(page: Dict[str, Any]) -> str:
+    """1ページ分のMarkdown（本文とテーブル）"""
+    parts = [f"## ページ {page['page_num']}\n\n", f"{page['text']}\n\n"]
+    for index, table in enumerate(page['tables'], 1):
+        parts.append(f"### テーブル {index}\n\n")
+        for row_index, row in enumerate(table):
+            cells = ['' if cell is None else str(cell).replace('\n', ' ') for cell in row]
+            parts.append("| " + " | ".join(cells) + " |\n")
+            if row_index == 0:
+                # 1行目を見出し行とする（区切り行が無いとMarkdownの表として扱われない）
+                parts.append("|" + " --- |" * len(cells) + "\n")
+        parts.append("\n")
+    parts.append("---\n\n")
+    return ''.join(parts)
+
+
+# ========== JSONL ==========
+
+def export_jsonl(db_path: Union[str, Path], output_path: Union[str, Path], immutable: bool = False,
+                 chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """
+    全ページをJSONL（1ページ1行）に書き出す
+
+    Args:
+        db_path: データベースファイル
+        output_path: 出力ファイル
+        immutable: finalize済みの不変ファイルとして開く
+        chunk_size: 1回に読むページ数
+
+    Returns:
+        書き出したページ数
+    """
+    conn, codec, corpus = _open(db_path, immutable)
+    count = 0
+    try:
+        with _atomic_open(output_path) as f:
+            for pages in iter_page_chunks(conn, codec, corpus, chunk_size=chunk_size):
+                for page in pages:
+                    f.write(json.dumps(page, ensure_ascii=False, default=json_default))
+                    f.write('\n')
+                count += len(pages)
+    finally:
+        conn.close()
+    return count
+
+
+# ========== CSV（テーブル） ==========
+
+def export_tables_csv(db_path: Union[str, Path], output_path: Union[str, Path], immutable: bool = False,
+                      chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """
+    全テーブルを1つのCSVに書き出す（Excelで開けるようBOM付きUTF-8）
+
+    1行がテーブルの1行に対応し、先頭の列が (doc_id,) page_num, table_index, row_index、
+    以降の列がセルの値。テーブルごとに列数が異なるため行の長さはそろえない。
+
+    Args:
+        db_path: データベースファイル
+        output_path: 出力ファイル
+        immutable: finalize済みの不変ファイルとして開く
+        chunk_size: 1回に読むテーブル数
+
+    Returns:
+        書き出したテーブル数
+    """
+    conn, codec, corpus = _open(db_path, immutable)
+    key = 'doc_id, page_num' if corpus else 'page_num'
+    count = 0
+    try:
+        with _atomic_open(output_path, encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow((['doc_id'] if corpus else []) + ['page_num', 'table_index', 'row_index', 'cells'])
+            cursor = conn.execute(f'SELECT {key}, table_index, content FROM tables ORDER BY {key}, table_index')
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    *prefix, content = tuple(row)
+                    for row_index, cells in enumerate(codec.decode_json(content) or []):
+                        writer.writerow(prefix + [row_index] + ['' if cell is None else cell for cell in cells])
+                count += len(rows)
+    finally:
+        conn.close()
+    return count
+
+
+# ========== Markdown（セクションごと） ==========
+
+def _safe_name(title: str, limit: int = 60) -> str:
+    """タイトルからファイル名に使える文字列を作る"""
+    return _UNSAFE_NAME.sub('_', title).strip('_.')[:limit] or 'section'
+
+
+def markdown_parts(conn: sqlite3.Connection, corpus: bool = False,
+                   pages_per_file: int = PAGES_PER_FILE) -> List[Dict[str, Any]]:
+    """
+    Markdownの出力単位（最上位セクションのページ範囲）を決める
+
+    最初のセクションより前のページは「前付け」として1ファイルにまとめる。
+    セクション（アウトライン）が無い文書は pages_per_file ページずつに分ける。
+
+    Returns:
+        {'file', 'title', 'document', 'doc_id', 'start', 'end'} のリスト（document はコーパスDBの文書名）
+    """
+    if corpus:
+        documents = conn.execute('SELECT doc_id, name FROM documents ORDER BY doc_id').fetchall()
+    else:
+        documents = [(None, None)]
+    has_sections = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sections'").fetchone() is not None
+
+    parts = []
+    for doc_id, doc_name in documents:
+        doc_where, doc_params = (' WHERE doc_id = ?', [doc_id]) if corpus else ('', [])
+        first, last = conn.execute(f'SELECT MIN(page_num), MAX(page_num) FROM pages{doc_where}',
+                                   doc_params).fetchone()
+        if first is None:
+            continue
+
+        starts: List[Tuple[int, str]] = []
+        if has_sections:
+            doc_filter = ' AND doc_id = ?' if corpus else ''
+            for page_num, title in conn.execute(f'''
+                SELECT page_num, title FROM sections
+                WHERE page_num BETWEEN ? AND ?{doc_filter}
+                  AND level = (SELECT MIN(level) FROM sections WHERE page_num IS NOT NULL{doc_filter})
+                ORDER BY page_num, id
+            ''', [first, last] + doc_params + doc_params):
+                if not starts or starts[-1][0] != page_num:
+                    starts.append((page_num, title or f"ページ {page_num}"))
+            if starts and starts[0][0] > first:
+                starts.insert(0, (first, '前付け'))
+        if not starts:
+            starts = [(page_num, f"ページ {page_num}-{min(page_num + pages_per_file - 1, last)}")
+                      for page_num in range(first, last + 1, pages_per_file)]
+
+        prefix = f"{_safe_name(Path(doc_name or f'doc{doc_id}').stem, 30)}_" if corpus else ''
+        for index, (start, title) in enumerate(starts, 1):
+            end = starts[index][0] - 1 if index < len(starts) else last
+            parts.append({'file': f"{prefix}{index:03d}_{_safe_name(title)}.md", 'title': title,
+                          'document': doc_name, 'doc_id': doc_id, 'start': start, 'end': end})
+    return parts
+
+
+def _write_markdown_part(db_path: str, part: Dict[str, Any], output_path: str, immutable: bool,
+                         chunk_size: int) -> int:
+    """1つのセクションをMarkdownファイルに書き出す（並列実行用。接続はプロセスごとに開く）"""
+    conn, codec, corpus = _open(db_path, immutable)
+    count = 0
+    try:
+        with _atomic_open(output_path) as f:
+            f.write(f"# {part['title']}\n\n")
+            if part['document']:
+                f.write(f"**文書**: {part['document']}\n\n")
+            f.write(f"**ページ**: {part['start']}-{part['end']}\n\n---\n\n")
+            for pages in iter_page_chunks(conn, codec, corpus, part['doc_id'], (part['start'], part['end']),
+                                          chunk_size):
+                for page in pages:
+                    f.write(page_markdown(page))
+                count += len(pages)
+    finally:
+        conn.close()
+    return count
+
+
+def export_sections_markdown(db_path: Union[str, Path], output_dir: Union[str, Path], workers: int = EXPORT_WORKERS,
+                             immutable: bool = False, chunk_size: int = EXPORT_CHUNK_SIZE,
+                             pages_per_file: int = PAGES_PER_FILE) -> List[Dict[str, Any]]:
+    """
+    最上位セクションごとにMarkdownファイルを書き出し、目次（index.md）を作る
+
+    Args:
+        db_path: データベースファイル
+        output_dir: 出力ディレクトリ
+        workers: 並列に書き出す章の数（1なら順番に書き出す）
+        immutable: finalize済みの不変ファイルとして開く
+        chunk_size: 1回に読むページ数
+        pages_per_file: セクションが無い場合の1ファイルあたりのページ数
+
+    Returns:
+        markdown_parts の各要素に 'pages'（書き出したページ数）を加えたリスト（目次の順）
+    """
+    output_dir = Path(output_dir)
+    conn, _, corpus = _open(db_path, immutable)
+    try:
+        parts = markdown_parts(conn, corpus, pages_per_file)
+    finally:
+        conn.close()
+
+    args = [(str(db_path), part, str(output_dir / part['file']), immutable, chunk_size) for part in parts]
+    if workers > 1 and len(parts) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(parts))) as executor:
+            future_to_part = {executor.submit(_write_markdown_part, *arg): arg[1] for arg in args}
+            for future in as_completed(future_to_part):
+                future_to_part[future]['pages'] = future.result()
+    else:
+        for arg in args:
+            arg[1]['pages'] = _write_markdown_part(*arg)
+
+    with _atomic_open(output_dir / 'index.md') as f:
+        f.write(f"# {Path(db_path).stem}\n\n")
+        for part in parts:
+            document = f"{part['document']}: " if part['document'] else ''
+            f.write(f"- {document}[{part['title']}]({part['file']}) ページ {part['start']}-{part['end']}"
+                    f"（{part['pages']}ページ）\n")
+    return parts
+
+
+def export_database(db_path: Union[str, Path], output_dir: Union[str, Path],
+                    formats: Iterable[str] = ('jsonl', 'markdown', 'csv'), workers: int = EXPORT_WORKERS,
+                    immutable: bool = False) -> Dict[str, Any]:
+    """
+    DB全体を指定の形式で出力ディレクトリに書き出す
+
+    Returns:
+        形式 → {'path', 'count', 'seconds'} の辞書
+    """
+    output_dir = Path(output_dir)
+    stem = Path(db_path).stem
+    results = {}
+    for fmt in formats:
+        start = time.perf_counter()
+        if fmt == 'jsonl':
+            path = output_dir / f"{stem}.jsonl"
+            count = export_jsonl(db_path, path, immutable)
+        elif fmt == 'csv':
+            path = output_dir / f"{stem}_tables.csv"
+            count = export_tables_csv(db_path, path, immutable)
+        elif fmt == 'markdown':
+            path = output_dir / f"{stem}_markdown"
+            count = len(export_sections_markdown(db_path, path, workers, immutable))
+        else:
+            raise ValueError(f"未対応の形式です: {fmt}")
+        results[fmt] = {'path': str(path), 'count': count, 'seconds': round(time.perf_counter() - start, 3)}
+    return results
+
+
+def main():
+    args = sys.argv[1:]
+    db_path, output_dir, workers, formats = DB_PATH, EXPORT_DIR, EXPORT_WORKERS, []
+    try:
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg == '--out':
+                output_dir = args[i + 1]
+                i += 1
+            elif arg == '--workers':
+                workers = int(args[i + 1])
+                i += 1
+            elif arg in ('--jsonl', '--markdown', '--csv'):
+                formats.append(arg[2:])
+            elif arg.startswith('--'):
+                raise ValueError(f"不明なオプション: {arg}")
+            else:
+                db_path = arg
+            i += 1
+    except (IndexError, ValueError) as e:
+        print(f"[ERROR] 引数が正しくありません: {e}")
+        print(__doc__)
+        sys.exit(2)
+
+    if not Path(db_path).exists():
+        print(f"[ERROR] データベースが見つかりません: {db_path}")
+        sys.exit(1)
+
+    print(f"[処理] {db_path} を {output_dir} にエクスポート中...")
+    results = export_database(db_path, output_dir, formats or ('jsonl', 'markdown', 'csv'), workers)
+    units = {'jsonl': 'ページ', 'markdown': 'ファイル', 'csv': 'テーブル'}
+    for fmt, result in results.items():
+        print(f"[OK] {fmt}: {result['count']:,}{units[fmt]} → {result['path']}（{result['seconds']:.2f}秒）")
+    print("[完了] エクスポートが終わりました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ページ抽出結果のディスクキャッシュ
+PDFのハッシュ・抽出設定をキーに、extract_text / extract_tables の結果を
+バイナリのパックファイルに保存し、スキーマや索引を変えた再構築ではpdfplumberを使わずに読み出す
+"""
+
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+from importlib import metadata as importlib_metadata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# キャッシュ形式のバージョン（レコード形式を変えたら上げる）
+CACHE_FORMAT_VERSION = 1
+
+# 抽出処理のバージョン（extract_text / extract_tables の呼び方を変えたら上げる）
+EXTRACTOR_VERSION = 1
+
+# レコードヘッダ: ページ番号, ペイロード長, CRC32（リトルエンディアン）
+RECORD_HEADER = struct.Struct('<III')
+
+PACK_NAME = 'pages.bin'
+MANIFEST_NAME = 'manifest.json'
+
+
+def file_sha256(path: Union[str, Path], chunk_size: int = 1024 * 1024) -> str:
+    """ファイル内容のSHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extractor_settings() -> Dict[str, Any]:
+    """キャッシュキーに含める抽出設定（pdfplumberはimportせずにバージョンだけ読む）"""
+    try:
+        plumber_version = importlib_metadata.version('pdfplumber')
+    except importlib_metadata.PackageNotFoundError:
+        plumber_version = 'unknown'
+    return {
+        'format': CACHE_FORMAT_VERSION,
+        'extractor': 'pdfplumber',
+        'extractor_version': EXTRACTOR_VERSION,
+        'pdfplumber': plumber_version,
+        'extract_text': {},
+        'extract_tables': {},
+    }
+
+
+class ExtractionCache:
+    """
+    1つのPDF・抽出設定に対応するキャッシュ
+
+    <cache_dir>/<PDFのSHA-256>/<設定のハッシュ>/ に
+    pages.bin（ヘッダ + zlib圧縮JSONのレコードを追記）と
+    manifest.json（ページ番号 → オフセット、文書メタデータ、アウトライン）を置く。
+    PDFの内容か抽出設定が変われば別のディレクトリになる（内容アドレス方式）。
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], pdf_path: Union[str, Path],
+                 settings: Optional[Dict[str, Any]] = None):
+        self.settings = settings or extractor_settings()
+        self.pdf_sha256 = file_sha256(pdf_path)
+        settings_key = hashlib.sha256(json.dumps(self.settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        self.path = Path(cache_dir) / self.pdf_sha256 / settings_key
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+        manifest_path = self.path / MANIFEST_NAME
+        if manifest_path.exists():
+            self.manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+        else:
+            self.manifest = {'pdf_sha256': self.pdf_sha256, 'settings': self.settings,
+                             'page_count': None, 'metadata': None, 'outline': None, 'pages': {}}
+
+        self._pack = open(self.path / PACK_NAME, 'a+b')
+
+    # ========== 文書単位の情報 ==========
+
+    def get_document(self, key: str) -> Any:
+        """page_count / metadata / outline を返す（未保存ならNone）"""
+        return self.manifest.get(key)
+
+    def put_document(self, key: str, value: Any):
+        """page_count / metadata / outline を保存"""
+        with self._lock:
+            self.manifest[key] = value
+            self._dirty = True
+
+    # ========== ページ単位の抽出結果 ==========
+
+    def get(self, page_num: int) -> Optional[Tuple[str, List]]:
+        """
+        キャッシュ済みの抽出結果を返す
+
+        Returns:
+            (extract_textの結果, extract_tablesの結果)。未キャッシュ・破損時はNone
+        """
+        payload = self._read_payload(page_num)
+        if payload is None:
+            return None
+        record = json.loads(zlib.decompress(payload).decode('utf-8'))
+        return record['text'], record['tables']
+
+    def _read_payload(self, page_num: int) -> Optional[bytes]:
+        """マニフェストが指すレコードのペイロード（未キャッシュ・破損時はNone）"""
+        entry = self.manifest['pages'].get(str(page_num))
+        if entry is None:
+            return None
+
+        offset, length = entry
+        with self._lock:
+            self._pack.seek(offset)
+            data = self._pack.read(length)
+
+        if len(data) < RECORD_HEADER.size:
+            return None
+        stored_page, payload_len, crc = RECORD_HEADER.unpack_from(data)
+        payload = data[RECORD_HEADER.size:RECORD_HEADER.size + payload_len]
+        if stored_page != page_num or len(payload) != payload_len or zlib.crc32(payload) != crc:
+            return None
+        return payload
+
+    def put(self, page_num: int, text: Optional[str], tables: List):
+        """
+        抽出結果をパックファイルに追記
+
+        同じページの正常なレコードが既にあれば書かない（同じページを複数のワーカーが抽出した場合など）。
+        パックは追記のみのため、破損したレコードを書き直した場合だけ古いレコードが残る。
+        """
+        if self._read_payload(page_num) is not None:
+            return
+        payload = zlib.compress(json.dumps({'text': text, 'tables': tables},
+                                           ensure_ascii=False).encode('utf-8'), 6)
+        record = RECORD_HEADER.pack(page_num, len(payload), zlib.crc32(payload)) + payload
+
+        with self._lock:
+            self._pack.seek(0, os.SEEK_END)
+            offset = self._pack.tell()
+            self._pack.write(record)
+            self.manifest['pages'][str(page_num)] = [offset, len(record)]
+            self._dirty = True
+
+    def flush(self):
+        """パックファイルを書き出し、マニフェストをアトミックに更新"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._pack.flush()
+            os.fsync(self._pack.fileno())
+            tmp_path = self.path / f"{MANIFEST_NAME}.tmp"
+            tmp_path.write_text(json.dumps(self.manifest, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp_path, self.path / MANIFEST_NAME)
+            self._dirty = False
+
+    def close(self):
+        """マニフェストを保存して閉じる"""
+        self.flush()
+        self._pack.close()
+
+
+class CachedPage:
+    """pdfplumberのページと同じ extract_text / extract_tables を持つキャッシュ経由のページ"""
+
+    __slots__ = ('_pdf', 'page_number', '_record')
+
+    def __init__(self, pdf: 'CachedPDF', page_number: int):
+        self._pdf = pdf
+        self.page_number = page_number
+        self._record = None
+
+    def _load(self) -> Tuple[str, List]:
+        if self._record is None:
+            self._record = self._pdf._extract(self.page_number)
+        return self._record
+
+    def extract_text(self) -> str:
+        return self._load()[0]
+
+    def extract_tables(self) -> List:
+        return self._load()[1]
+
+    def release(self):
+        """抽出結果の参照を捨てる（大規模PDFでのメモリ節約）"""
+        self._record = None
+
+
+class CachedPDF:
+    """
+    キャッシュを優先し、未キャッシュのページだけpdfplumberで抽出するPDF
+
+    ビルダーが使う pdf.metadata / pdf.pages / ページの extract_text・extract_tables と
+    アウトライン（outline）を提供する。全ページがキャッシュ済みならpdfplumberは開かない。
+    cache_dir が None の場合はキャッシュせず、常にpdfplumberで抽出する。
+    """
+
+    def __init__(self, pdf_path: Union[str, Path], cache_dir: Optional[Union[str, Path]] = None):
+        self.pdf_path = pdf_path
+        self.cache = ExtractionCache(cache_dir, pdf_path) if cache_dir else None
+        self._pdf = None
+        self._open_lock = threading.Lock()
+
+        page_count = self.cache.get_document('page_count') if self.cache else None
+        if page_count is None:
+            page_count = len(self._plumber().pages)
+            if self.cache:
+                self.cache.put_document('page_count', page_count)
+        self.pages = [CachedPage(self, page_num) for page_num in range(1, page_count + 1)]
+
+    def _plumber(self):
+        """pdfplumberのPDFを必要になった時点で開く"""
+        with self._open_lock:
+            if self._pdf is None:
+                import pdfplumber
+                self._pdf = pdfplumber.open(self.pdf_path)
+                self._pdf.pages  # ページ一覧をここで作成（ワーカースレッドから同時に作らせない）
+            return self._pdf
+
+    def _cached_document(self, key: str, compute):
+        value = self.cache.get_document(key) if self.cache else None
+        if value is None:
+            value = compute()
+            if self.cache:
+                self.cache.put_document(key, value)
+        return value
+
+    @property
+    def metadata(self) -> Dict[str, str]:
+        """文書メタデータ（値は文字列化済み）"""
+        return self._cached_document(
+            'metadata', lambda: {k: str(v) for k, v in self._plumber().metadata.items()})
+
+    @property
+    def outline(self) -> List[Tuple[int, str, int]]:
+        """アウトライン [(レベル, タイトル, ページ番号), ...]"""
+        from progressive_build import read_outline
+        return [tuple(item) for item in self._cached_document('outline', lambda: read_outline(self._plumber()))]
+
+    def _extract(self, page_num: int) -> Tuple[str, List]:
+        if self.cache:
+            record = self.cache.get(page_num)
+            if record is not None:
+                self.cache.hits += 1
+                return record
+
+        page = self._plumber().pages[page_num - 1]
+        try:
+            record = (page.extract_text(), page.extract_tables())
+        finally:
+            page.close()  # 解析済みの文字・罫線を捨てる（pdf.pages が全ページを保持し続けないように）
+        if self.cache:
+            self.cache.misses += 1
+            self.cache.put(page_num, *record)
+        return record
+
+    def flush(self):
+        """キャッシュのマニフェストを保存（バッチコミットごとに呼ぶと中断時も再利用できる）"""
+        if self.cache:
+            self.cache.flush()
+
+    def cache_summary(self) -> str:
+        """キャッシュのヒット状況（表示用）"""
+        if not self.cache:
+            return "抽出キャッシュ: 無効"
+        opened = "使用" if self._pdf is not None else "未使用"
+        return (f"抽出キャッシュ: ヒット {self.cache.hits:,} / 抽出 {self.cache.misses:,}ページ"
+                f"（pdfplumber {opened}）")
+
+    def close(self):
+        if self.cache:
+            self.cache.close()
+        if self._pdf is not None:
+            self._pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def open_pdf(pdf_path: Union[str, Path], cache_dir: Optional[Union[str, Path]] = None) -> CachedPDF:
+    """抽出キャッシュ付きでPDFを開く（with文で使う）"""
+    return CachedPDF(pdf_path, cache_dir)
@@ -0,0 +1,657 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ビルダー共通のインジェスト処理
+pagesに保存したテキストから全文検索インデックスを作成する前処理ステージ群
+"""
+
+import sqlite3
+import hashlib
+import json
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from page_store import TextCodec
+
+# 数字の並びは "Page 10 of 98" などページごとに変わるため同一視する
+_DIGITS = re.compile(r'\d+')
+
+# SimHash用の語の抽出
+_WORDS = re.compile(r'\w+')
+
+# 正規化用パターン
+_SOFT_HYPHEN = '\u00ad'
+_LINE_BREAK_HYPHEN = re.compile(r'([^\W\d_])-\n([a-z])')  # "regis-\nter" → "register"
+_HORIZONTAL_SPACE = re.compile(r'[^\S\n]+')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+
+# 識別子の抽出（区切り付きの複合識別子、大文字の略語・レジスタ名、16進リテラル）
+_COMPOUND_IDENTIFIER = re.compile(r'\b[A-Za-z][A-Za-z0-9]*(?:[._][A-Za-z0-9]+)+\b')
+_UPPER_IDENTIFIER = re.compile(r'\b[A-Z][A-Z0-9]{2,}\b')
+# H付きの1語は数字で始まる形（0FFH）だけを16進とみなす（BEACH のような英単語を除くため）
+_HEX_LITERAL = re.compile(r'\b(?:0[xX]([0-9A-Fa-f][0-9A-Fa-f_]*)'
+                          r'|([0-9A-F]{4}(?: [0-9A-F]{4})+|[0-9][0-9A-F_]*)H)\b')
+_IDENTIFIER_SEPARATORS = re.compile(r'[._]')
+
+# 段落チャンクの区切り（見出し行で始まる行、文末で終わる行）
+_HEADING_LINE = re.compile(r'^(?:\d+(?:\.\d+)*\.?|[A-Z]\.\d+(?:\.\d+)*|第\d+[章節]|(?:Chapter|Section) \d+)\s+\S')
+_SENTENCE_END = ('.', '。', ':', '：', ')', '）')
+
+# 段落チャンクの大きさ（文字数）。抽出テキストは空行を持たないため、
+# 見出し行・文末・最大長で区切り、短すぎるチャンクは次の行とつなげる
+CHUNK_MAX_CHARS = 600
+CHUNK_MIN_CHARS = 200
+
+# 相互参照の抽出規則のバージョン（規則を変えたら上げる。metadata の xref_version）
+XREF_VERSION = 1
+
+# 相互参照（"see Section 3.2"・"Table 5-1"・"Figure 2.4"・"表5-1"・"図2.4"・"3.2節"・"第3章"）
+_XREF_LABEL = r'(\d+(?:\s?[.\-\u2010-\u2013]\s?\d+)*)'
+_XREF_PATTERN = re.compile(
+    r'\b(?P<en>Section|Chapter|Table|Figure|Fig\.)\s?' + _XREF_LABEL
+    + r'|(?P<ja>表|図)\s?' + _XREF_LABEL
+    + r'|' + _XREF_LABEL + r'\s?(?P<sec>節)'
+    + r'|第' + _XREF_LABEL + r'(?P<chap>章)',
+    re.IGNORECASE)
+_XREF_KINDS = {'section': 'section', 'chapter': 'section', 'table': 'table', 'figure': 'figure', 'fig.': 'figure',
+               '表': 'table', '図': 'figure', '節': 'section', '章': 'section'}
+_XREF_SEPARATORS = re.compile(r'\s?[.\-\u2010-\u2013]\s?')
+
+# 参照先: 番号付きの見出し行（"3.2 Flash Memory"）と、行頭の図表キャプション（"Table 5-1 ..."）
+# （折り返しで行頭に来た本文中の参照と区別するため、ラベルの後が大文字・和文で始まるものに限る）
+_SECTION_HEADING = re.compile(r'^(\d+(?:\.\d+)+)\.?\s+((?:[A-Z][A-Za-z0-9]|[^\x00-\x7F]).*)$')
+_CAPTION_TITLE = re.compile(r'\s*[:.]?\s*(?:[A-Z]|[^\x00-\x7F])')
+_TOC_LINE = re.compile(r'(?:\.{4,}|…{2,}|\s\.\s\.\s)\s*\d+\s*$')  # 目次の行（リーダーとページ番号）
+
+
+def normalize_text(text: str) -> str:
+    """
+    抽出テキストの表記ゆれを正規化
+
+    - NFKC（合字の展開、全角英数・半角カナの統一）
+    - ソフトハイフンの除去と行末ハイフネーションの連結
+    - 行内の空白の圧縮と空行の除去（行構造はヘッダ/フッタ検出のため維持）
+
+    Args:
+        text: 抽出されたテキスト
+
+    Returns:
+        正規化後のテキスト
+    """
+    if not text:
+        return ''
+
+    text = unicodedata.normalize('NFKC', text).replace(_SOFT_HYPHEN, '')
+    text = _LINE_BREAK_HYPHEN.sub(r'\1\2', text)
+    text = _HORIZONTAL_SPACE.sub(' ', text)
+    text = _BLANK_LINES.sub('\n', text)
+    return '\n'.join(line.strip() for line in text.split('\n')).strip()
+
+
+def normalize_query(query: str) -> str:
+    """検索クエリを索引テキストと同じ規則で正規化（行構造は持たないため空白は1つに圧縮）"""
+    query = unicodedata.normalize('NFKC', query or '').replace(_SOFT_HYPHEN, '')
+    return ' '.join(query.split())
+
+
+class BoilerplateStripper:
+    """ページ上端・下端の決まった位置に繰り返し現れるヘッダ/フッタ行を学習して除去する"""
+
+    def __init__(self, band_lines: int = 3, min_repeat: int = 3, min_density: float = 0.8):
+        """
+        Args:
+            band_lines: ヘッダ/フッタとみなす上端・下端の行数
+            min_repeat: 同じ位置に何ページ以上現れた行を除去対象とするか
+            min_density: 初出ページから最終出現ページまでのうち、現れたページの割合の下限
+                         （章ごとのバナーは連続して現れ、本文の偶然の一致は散発的になる）
+        """
+        self.band_lines = band_lines
+        self.min_repeat = min_repeat
+        self.min_density = min_density
+        self.keys: Set[Tuple[int, str]] = set()
+
+    @staticmethod
+    def _normalize(line: str) -> str:
+        """行を比較用に正規化（前後空白除去、数字を#に置換）"""
+        return _DIGITS.sub('#', line.strip())
+
+    def _band_keys(self, lines: List[str]) -> Iterable[Tuple[int, str]]:
+        """位置帯の行を (位置, 正規化行) のキーとして返す（上端は0,1,..、下端は-1,-2,..）"""
+        band = min(self.band_lines, len(lines) // 2)
+        for i in range(band):
+            yield i, self._normalize(lines[i])
+            yield -1 - i, self._normalize(lines[-1 - i])
+
+    def fit(self, texts: Iterable[str]) -> 'BoilerplateStripper':
+        """文書全体のページテキスト（ページ順）からヘッダ/フッタ行を学習"""
+        counts = Counter()
+        first_seen: Dict[Tuple[int, str], int] = {}
+        last_seen: Dict[Tuple[int, str], int] = {}
+
+        for page_index, text in enumerate(texts):
+            for key in set(self._band_keys((text or '').splitlines())):
+                if not key[1]:
+                    continue
+                counts[key] += 1
+                first_seen.setdefault(key, page_index)
+                last_seen[key] = page_index
+
+        self.keys = {
+            key for key, count in counts.items()
+            if count >= self.min_repeat
+            and count / (last_seen[key] - first_seen[key] + 1) >= self.min_density
+        }
+        return self
+
+    def strip(self, text: str) -> str:
+        """学習済みのヘッダ/フッタ行を上端・下端から除去"""
+        lines = (text or '').splitlines()
+        start, end = self.body_range(lines)
+        return '\n'.join(lines[start:end])
+
+    def body_range(self, lines: List[str]) -> Tuple[int, int]:
+        """ヘッダ/フッタを除いた本文の行範囲 [start, end)"""
+        band = min(self.band_lines, len(lines) // 2)
+
+        start = 0
+        while start < band and (start, self._normalize(lines[start])) in self.keys:
+            start += 1
+
+        end = len(lines)
+        while (len(lines) - end < band and end > start
+               and (end - 1 - len(lines), self._normalize(lines[end - 1])) in self.keys):
+            end -= 1
+
+        return start, end
+
+    def patterns(self) -> List[List]:
+        """学習したパターン（メタデータ保存用、[位置, 正規化行] のリスト）"""
+        return [[position, line] for position, line in sorted(self.keys)]
+
+
+def _normalize_hex(digits: str) -> str:
+    """16進数字列を 0x + 小文字（区切り・先頭0なし）に正規化"""
+    digits = digits.replace('_', '').replace(' ', '').lower().lstrip('0')
+    return '0x' + (digits or '0')
+
+
+def normalize_identifier(token: str) -> str:
+    """
+    識別子を索引と同じ形に正規化
+
+    16進リテラル（0xFFE5_0000, 0FFE50000H, FFE5 0000H など）は 0xffe50000 の形にそろえ、
+    それ以外は前後の空白を除いてそのまま返す（大文字小文字はトークナイザが吸収する）。
+    """
+    token = token.strip()
+    match = _HEX_LITERAL.fullmatch(token)
+    if match:
+        return _normalize_hex(match.group(1) or match.group(2))
+    return token
+
+
+def is_compound_identifier(token: str) -> bool:
+    """区切り付きの複合識別子または16進リテラルか（unicode61では1語として検索できない形）"""
+    token = token.strip()
+    return bool(_COMPOUND_IDENTIFIER.fullmatch(token) or _HEX_LITERAL.fullmatch(token))
+
+
+def extract_identifiers(text: str) -> Set[str]:
+    """
+    識別子索引に入れる語を抽出
+
+    TAUJ0.CMOR0 のような複合識別子は全体と構成要素（TAUJ0, CMOR0）の両方、
+    大文字の略語・レジスタ名（FLMDCNT など）はそのまま、16進リテラルは正規化した形で返す。
+
+    Args:
+        text: ページテキスト
+
+    Returns:
+        識別子の集合
+    """
+    identifiers = set()
+
+    for match in _COMPOUND_IDENTIFIER.finditer(text):
+        identifier = match.group()
+        identifiers.add(identifier)
+        identifiers.update(part for part in _IDENTIFIER_SEPARATORS.split(identifier) if len(part) >= 2)
+
+    identifiers.update(token for token in _UPPER_IDENTIFIER.findall(text) if not _HEX_LITERAL.fullmatch(token))
+
+    for match in _HEX_LITERAL.finditer(text):
+        identifiers.add(_normalize_hex(match.group(1) or match.group(2)))
+
+    return identifiers
+
+
+def split_chunks(text: str, line_range: Optional[Tuple[int, int]] = None,
+                 max_chars: int = CHUNK_MAX_CHARS, min_chars: int = CHUNK_MIN_CHARS) -> List[Tuple[int, int, str]]:
+    """
+    ページテキストを段落（ブロック）単位のチャンクに分割
+
+    見出し行の前、文末で終わる行の後（チャンクが min_chars 以上の場合）、max_chars を超える手前で区切る。
+    max_chars より長い1行は空白の位置で分割する。
+
+    Args:
+        text: ページテキスト（pages.text と同じもの。オフセットはこのテキスト上の文字位置）
+        line_range: チャンクにする行の範囲 [start, end)（ヘッダ/フッタを除く場合。Noneなら全行）
+        max_chars: チャンクの最大文字数
+        min_chars: 文末で区切るチャンクの最小文字数
+
+    Returns:
+        (開始オフセット, 終了オフセット, チャンクのテキスト) のリスト
+    """
+    text = text or ''
+    lines = text.split('\n')
+    first, last = line_range if line_range is not None else (0, len(lines))
+
+    # 行（長い行は分割した断片）を (開始, 終了, 見出し行か) で並べる
+    pieces = []
+    offset = sum(len(line) + 1 for line in lines[:first])
+    for line in lines[first:last]:
+        start, end = offset, offset + len(line)
+        offset = end + 1
+        heading = _HEADING_LINE.match(line) is not None
+        while end - start > max_chars:
+            cut = text.rfind(' ', start + min_chars, start + max_chars)
+            if cut <= start:
+                cut = start + max_chars
+            pieces.append((start, cut, heading))
+            heading = False
+            start = cut + 1 if text[cut] == ' ' else cut
+        if end > start:
+            pieces.append((start, end, heading))
+
+    chunks = []
+    chunk_start = chunk_end = None
+    for start, end, heading in pieces:
+        if chunk_start is not None and (
+                heading or end - chunk_start > max_chars
+                or (chunk_end - chunk_start >= min_chars and text[chunk_end - 1] in _SENTENCE_END)):
+            chunks.append((chunk_start, chunk_end, text[chunk_start:chunk_end]))
+            chunk_start = None
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end = end
+    if chunk_start is not None:
+        chunks.append((chunk_start, chunk_end, text[chunk_start:chunk_end]))
+    return chunks
+
+
+def _xref_key(match: re.Match) -> Tuple[str, str]:
+    """参照の正規表現の一致から (種類, ラベル) を返す（ラベルの区切りは '.' にそろえる）"""
+    groups = match.groups()
+    kind_word = next(word for word in (match.group('en'), match.group('ja'), match.group('sec'),
+                                       match.group('chap')) if word)
+    label = next(group for group in (groups[1], groups[3], groups[4], groups[6]) if group)
+    return _XREF_KINDS[kind_word.lower()], _XREF_SEPARATORS.sub('.', label)
+
+
+def parse_reference(text: str) -> Optional[Tuple[str, str]]:
+    """
+    "Table 5-1"・"see Section 3.2"・"図2.4"・"3.2" のような参照の指定を (種類, ラベル) に変換
+
+    番号だけの指定はセクションとみなす。
+
+    Returns:
+        ('section' / 'table' / 'figure', 正規化したラベル)、解釈できなければNone
+    """
+    text = normalize_query(text)
+    match = _XREF_PATTERN.search(text)
+    if match:
+        return _xref_key(match)
+    if re.fullmatch(r'\d+(?:[.\-]\d+)*', text):
+        return 'section', _XREF_SEPARATORS.sub('.', text)
+    return None
+
+
+def extract_xrefs(text: str, line_range: Optional[Tuple[int, int]] = None
+                  ) -> Tuple[List[Tuple[str, str, str]], List[Tuple[int, str, str, str]]]:
+    """
+    ページテキストから相互参照の参照先と参照元を抽出
+
+    行頭の図表キャプション・番号付きの見出し行・"Chapter N"/"第N章" の行を参照先、
+    それ以外の位置の "Section 3.2"・"Table 5-1" などを参照元とする。目次の行はどちらにも含めない。
+
+    Args:
+        text: ページテキスト（pages.text と同じもの。オフセットはこのテキスト上の文字位置）
+        line_range: 対象の行の範囲 [start, end)（ヘッダ/フッタを除く場合。Noneなら全行）
+
+    Returns:
+        (参照先 [(種類, ラベル, タイトル)], 参照元 [(開始オフセット, 種類, ラベル, 参照の文字列)])
+    """
+    text = text or ''
+    lines = text.split('\n')
+    first, last = line_range if line_range is not None else (0, len(lines))
+
+    targets = []
+    references = []
+    offset = sum(len(line) + 1 for line in lines[:first])
+    for line in lines[first:last]:
+        line_offset = offset
+        offset += len(line) + 1
+        if _TOC_LINE.search(line):
+            continue
+
+        heading = _SECTION_HEADING.match(line)
+        if heading:
+            targets.append(('section', heading.group(1), line))
+        for match in _XREF_PATTERN.finditer(line):
+            key = _xref_key(match)
+            if (match.start() == 0 and (key[0] != 'section' or match.group('en') or match.group('chap'))
+                    and _CAPTION_TITLE.match(line, match.end())):
+                # 行頭の "Table 5-1 ..."・"Chapter 3 ..."・"第3章 ..." は参照先（キャプション・章見出し）
+                targets.append((*key, line))
+            else:
+                references.append((line_offset + match.start(), *key, match.group()))
+    return targets, references
+
+
+def outline_targets(outline: Iterable[Tuple[int, str, int]]) -> List[Tuple[int, str, str, str]]:
+    """アウトライン（(level, title, page_num)）のうち番号付きの見出しを参照先 (page_num, 種類, ラベル, タイトル) にする"""
+    targets = []
+    for _, title, page_num in outline:
+        heading = re.match(r'^(?:Chapter\s|第)?(\d+(?:\.\d+)*)\.?(?:章)?\s+\S', (title or '').strip(), re.IGNORECASE)
+        if heading and page_num is not None:
+            targets.append((page_num, 'section', heading.group(1), title.strip()))
+    return targets
+
+
+def _build_spread_table() -> List[int]:
+    """1バイトの各ビットを16ビット幅のフィールドに展開するテーブル"""
+    table = []
+    for value in range(256):
+        spread = 0
+        for bit in range(8):
+            if value >> bit & 1:
+                spread |= 1 << (bit * 16)
+        table.append(spread)
+    return table
+
+
+_SPREAD = _build_spread_table()
+
+
+def simhash(text: str) -> int:
+    """
+    64ビットSimHashを計算
+
+    各語のハッシュを64個の16ビットカウンタを並べた多倍長整数に展開して加算し、
+    ビットごとの多数決を1回の整数加算で集計する。
+
+    Args:
+        text: ページテキスト
+
+    Returns:
+        64ビットの署名（語が無い場合は0）
+    """
+    counts = Counter(_WORDS.findall(text.lower()))
+    accumulator = 0
+    total = 0
+    for word, weight in counts.items():
+        h = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+        spread = 0
+        for byte_index in range(8):
+            spread |= _SPREAD[(h >> (byte_index * 8)) & 0xFF] << (byte_index * 128)
+        accumulator += spread * weight
+        total += weight
+
+    signature = 0
+    for bit in range(64):
+        if 2 * ((accumulator >> (bit * 16)) & 0xFFFF) > total:
+            signature |= 1 << bit
+    return signature
+
+
+class NearDuplicateIndex:
+    """SimHash署名による近似重複ページのクラスタリング（LSHバンドで候補を絞り込む）"""
+
+    BANDS = 4
+    BAND_BITS = 16
+
+    def __init__(self, max_distance: int = 3):
+        """
+        Args:
+            max_distance: 重複とみなすハミング距離の上限（BANDS-1以下なら取りこぼしなし）
+        """
+        self.max_distance = max_distance
+        self.buckets: Dict[Tuple[int, int], List[Tuple[int, int]]] = defaultdict(list)
+
+    def add(self, page_num: int, signature: int) -> Optional[Tuple[int, int]]:
+        """
+        ページを登録し、既存の代表ページと重複していればそれを返す
+
+        Returns:
+            (代表ページ番号, ハミング距離)、重複でなければNone（このページが代表になる）
+        """
+        mask = (1 << self.BAND_BITS) - 1
+        band_keys = [(band, (signature >> (band * self.BAND_BITS)) & mask) for band in range(self.BANDS)]
+
+        best = None
+        for key in band_keys:
+            for canonical_page, canonical_signature in self.buckets.get(key, ()):
+                distance = bin(signature ^ canonical_signature).count('1')
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (canonical_page, distance)
+
+        if best is None:
+            for key in band_keys:
+                self.buckets[key].append((page_num, signature))
+        return best
+
+
+class IngestPipeline:
+    """pagesテーブルの内容から検索用の派生データを作成するパイプライン"""
+
+    def __init__(self, strip_boilerplate: bool = True, dedup: bool = True, dedup_distance: int = 3,
+                 identifiers: bool = True, chunks: bool = True, xrefs: bool = True):
+        """
+        Args:
+            strip_boilerplate: ヘッダ/フッタを除去してから索引化する
+            dedup: 近似重複ページを検出してpage_duplicatesに記録する
+            dedup_distance: 近似重複とみなすSimHashのハミング距離の上限
+            identifiers: レジスタ名・16進リテラル用の識別子索引（idents_fts）を作成する
+            chunks: 段落チャンクの索引（chunks_fts）を作成する
+            xrefs: 相互参照の索引（xrefs・xref_targets）を作成する
+        """
+        self.stripper = BoilerplateStripper() if strip_boilerplate else None
+        self.dedup = dedup
+        self.dedup_distance = dedup_distance
+        self.identifiers = identifiers
+        self.chunks = chunks
+        self.xrefs = xrefs
+
+    def create_schema(self, conn: sqlite3.Connection):
+        """パイプラインが作成する派生テーブル"""
+        # distance 0 は本文が代表ページと完全に一致するページ（pages_fts に索引しない）
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS page_duplicates (
+                page_num INTEGER PRIMARY KEY,
+                canonical_page INTEGER,
+                distance INTEGER,
+                FOREIGN KEY (page_num) REFERENCES pages(page_num)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_page_duplicates_canonical ON page_duplicates(canonical_page)')
+
+        # 識別子索引: '.' と '_' を語の一部として扱い、接頭辞検索用のprefixインデックスを持つ
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS idents_fts USING fts5(
+                page_num UNINDEXED,
+                idents,
+                tokenize="unicode61 tokenchars '._'",
+                prefix='2 3 4'
+            )
+        ''')
+
+        # 段落チャンク索引: オフセットは pages.text（展開後）上の文字位置
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                page_num UNINDEXED,
+                chunk_index UNINDEXED,
+                start_offset UNINDEXED,
+                end_offset UNINDEXED,
+                text,
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+
+        # 相互参照: 参照先（見出し・図表キャプション）と参照元（本文中の "Table 5-1" 等）
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS xref_targets (
+                kind TEXT,
+                label TEXT,
+                page_num INTEGER,
+                title TEXT
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS xrefs (
+                page_num INTEGER,
+                start_offset INTEGER,
+                kind TEXT,
+                label TEXT,
+                text TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_xref_targets_label ON xref_targets(kind, label, page_num)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_xrefs_label ON xrefs(kind, label, page_num)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_xrefs_page ON xrefs(page_num)')
+
+    def prepare(self, rows: List[Tuple[int, str]],
+                outline: Optional[Iterable[Tuple[int, str, int]]] = None) -> Dict[str, Any]:
+        """
+        1文書分の (page_num, text) から派生データを計算（DBには書き込まない）
+
+        ヘッダ/フッタ除去は文書全体を見て学習する必要があるため、全ページをまとめて渡す。
+        近似重複ページは代表ページ（最初に現れたページ）へのリンクとして返す。
+        除去後のテキストが代表ページと完全に一致するページは索引対象に含めない
+        （近似重複は語が異なるため、再現率を落とさないよう索引には残す）。
+        段落チャンクは索引対象のページの本文（ヘッダ/フッタを除いた行）から作る。
+        相互参照は重複ページも含む全ページの本文から抽出し、アウトラインの番号付き見出しも参照先に加える。
+
+        Args:
+            rows: ページ番号順の (page_num, text) のリスト
+            outline: アウトライン（(level, title, page_num) のリスト）
+
+        Returns:
+            {'stats', 'patterns', 'fts_rows', 'duplicate_rows', 'ident_rows', 'chunk_rows',
+             'xref_target_rows', 'xref_rows'} の辞書
+            （chunk_rows は (page_num, chunk_index, 開始オフセット, 終了オフセット, テキスト)、
+             xref_target_rows は (種類, ラベル, page_num, タイトル)、
+             xref_rows は (page_num, 開始オフセット, 種類, ラベル, 参照の文字列)）
+        """
+        stats = {'pages': len(rows), 'boilerplate_lines': 0, 'chars_removed': 0,
+                 'duplicates': 0, 'fts_skipped': 0, 'identifiers': 0, 'chunks': 0, 'xrefs': 0}
+        patterns = []
+
+        if self.stripper is not None:
+            self.stripper.fit(text for _, text in rows)
+            patterns = self.stripper.patterns()
+            stats['boilerplate_lines'] = len(patterns)
+
+        near_duplicates = NearDuplicateIndex(self.dedup_distance)
+        exact_texts: Dict[str, int] = {}
+        near_matches: Dict[int, Tuple[int, int]] = {}
+        fts_rows = []
+        duplicate_rows = []
+        ident_rows = []
+        chunk_rows = []
+        xref_target_rows = []
+        xref_rows = []
+        if self.xrefs and outline:
+            xref_target_rows = [(kind, label, page_num, title)
+                                for page_num, kind, label, title in outline_targets(outline)]
+
+        for page_num, text in rows:
+            text = text or ''
+            indexed = self.stripper.strip(text) if self.stripper is not None else text
+            stats['chars_removed'] += len(text) - len(indexed)
+            line_range = self.stripper.body_range(text.split('\n')) if self.stripper is not None else None
+
+            if self.xrefs:
+                targets, references = extract_xrefs(text, line_range)
+                xref_target_rows.extend((kind, label, page_num, title) for kind, label, title in targets)
+                xref_rows.extend((page_num, *reference) for reference in references)
+
+            if self.dedup:
+                exact_page = exact_texts.setdefault(indexed, page_num)
+                if exact_page != page_num:
+                    # 重複リンクは常にグループの代表ページ（ルート）を指す
+                    canonical_page, distance = near_matches.get(exact_page, (exact_page, 0))
+                    duplicate_rows.append((page_num, canonical_page, distance))
+                    if distance == 0:
+                        stats['fts_skipped'] += 1
+                        continue
+                    # 近似重複ページのコピーは代表ページと本文が異なるため索引する
+                else:
+                    match = near_duplicates.add(page_num, simhash(indexed))
+                    if match is not None:
+                        # 距離0は完全一致（索引しないページ）を表すため、本文の異なるページは1以上で記録する
+                        near_matches[page_num] = (match[0], max(match[1], 1))
+                        duplicate_rows.append((page_num, *near_matches[page_num]))
+
+            fts_rows.append((page_num, indexed))
+
+            if self.identifiers:
+                identifiers = extract_identifiers(indexed)
+                stats['identifiers'] += len(identifiers)
+                ident_rows.append((page_num, ' '.join(sorted(identifiers))))
+
+            if self.chunks:
+                for chunk_index, (start, end, chunk) in enumerate(split_chunks(text, line_range)):
+                    chunk_rows.append((page_num, chunk_index, start, end, chunk))
+
+        stats['duplicates'] = len(duplicate_rows)
+        stats['chunks'] = len(chunk_rows)
+        stats['xrefs'] = len(xref_rows)
+
+        return {'stats': stats, 'patterns': patterns, 'fts_rows': fts_rows,
+                'duplicate_rows': duplicate_rows, 'ident_rows': ident_rows, 'chunk_rows': chunk_rows,
+                'xref_target_rows': xref_target_rows, 'xref_rows': xref_rows}
+
+    def index(self, conn: sqlite3.Connection) -> Dict[str, int]:
+        """
+        pages_fts・page_duplicates・idents_fts・chunks_fts・相互参照（xrefs・xref_targets）を作成
+
+        全ページをpagesに保存し終えた後でまとめて実行する（prepare を参照）。
+        pages.text は元のテキストのまま残す。
+
+        Args:
+            conn: データベース接続（pages挿入済み、pages_fts作成済み）
+
+        Returns:
+            統計情報の辞書
+        """
+        self.create_schema(conn)
+        codec = TextCodec.from_connection(conn)
+        rows = [(page_num, codec.decode(text))
+                for page_num, text in conn.execute('SELECT page_num, text FROM pages ORDER BY page_num')]
+        outline = None
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sections'").fetchone():
+            outline = conn.execute('SELECT level, title, page_num FROM sections ORDER BY page_num').fetchall()
+        result = self.prepare(rows, outline)
+
+        if self.stripper is not None:
+            conn.execute('INSERT OR REPLACE INTO metadata VALUES (?, ?)',
+                         ('boilerplate_patterns', json.dumps(result['patterns'], ensure_ascii=False)))
+        if self.xrefs:
+            conn.execute('INSERT OR REPLACE INTO metadata VALUES (?, ?)', ('xref_version', str(XREF_VERSION)))
+
+        conn.execute('DELETE FROM pages_fts')
+        conn.execute('DELETE FROM page_duplicates')
+        conn.execute('DELETE FROM idents_fts')
+        conn.execute('DELETE FROM chunks_fts')
+        conn.execute('DELETE FROM xref_targets')
+        conn.execute('DELETE FROM xrefs')
+        conn.executemany('INSERT INTO pages_fts (page_num, text) VALUES (?, ?)', result['fts_rows'])
+        conn.executemany('INSERT INTO page_duplicates VALUES (?, ?, ?)', result['duplicate_rows'])
+        conn.executemany('INSERT INTO idents_fts (page_num, idents) VALUES (?, ?)', result['ident_rows'])
+        conn.executemany('INSERT INTO chunks_fts (page_num, chunk_index, start_offset, end_offset, text) '
+                         'VALUES (?, ?, ?, ?, ?)', result['chunk_rows'])
+        conn.executemany('INSERT INTO xref_targets VALUES (?, ?, ?, ?)', result['xref_target_rows'])
+        conn.executemany('INSERT INTO xrefs VALUES (?, ?, ?, ?, ?)', result['xref_rows'])
+        conn.commit()
+
+        return result['stats']
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+構築処理の計測（インストルメンテーション）
+工程タイマー、カウンタ、ヒストグラム、最も遅いページの記録と、
+イベントを受け取るコールバック・エクスポーター（JSON Lines / Prometheusテキスト形式）
+"""
+
+import heapq
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+# ページ抽出時間のヒストグラムの境界（秒）
+PAGE_TIME_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 最も遅いページとして保持する件数
+SLOWEST_PAGES = 10
+
+# Prometheusのメトリクス名の接頭辞
+PROMETHEUS_PREFIX = 'pdf_build'
+
+
+class Histogram:
+    """固定境界のヒストグラム（Prometheusと同じく境界以下の件数を数える）"""
+
+    def __init__(self, buckets: Iterable[float] = PAGE_TIME_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # 最後は +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """分位点の推定値（該当する区間の上限。ただし最大値を超えない）"""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def cumulative_counts(self) -> List[int]:
+        """各境界以下の累積件数（最後は +Inf = 総数）"""
+        total = 0
+        result = []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.cumulative_counts())),
+        }
+
+
+class BuildMetrics:
+    """
+    1回の構築の計測値を集めてイベントとして通知する（スレッドセーフ）
+
+    - stage(name): 工程の所要時間（with文）
+    - incr(name, value): カウンタ（pages, tables, chars, bytes_written, publish_retries など）
+    - set_gauge(name, value): 最新値（db_size_bytes など）
+    - observe(name, value): ヒストグラム
+    - record_page(...): ページ単位の抽出時間（ヒストグラム・カウンタ・最も遅いページ）
+    - event(kind, **fields): コールバック・エクスポーターへの通知
+
+    エクスポーターは export(event, metrics) と close() を持つオブジェクト、
+    コールバックは event の辞書を受け取る関数。
+    """
+
+    def __init__(self, name: str = 'build', labels: Optional[Dict[str, str]] = None,
+                 slowest: int = SLOWEST_PAGES):
+        self.name = name
+        self.labels = dict(labels or {})
+        self.slowest = slowest
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._slowest_pages: List = []  # (秒, 連番, ページ情報) の最小ヒープ
+        self._sequence = 0
+        self._callbacks: List[Callable[[Dict[str, Any]], None]] = []
+        self._exporters: List[Any] = []
+        self._lock = threading.RLock()
+        self._closed = False
+        self.start_time = time.time()
+
+    # ========== 通知先 ==========
+
+    def add_callback(self, callback: Callable[[Dict[str, Any]], None]):
+        """イベントを受け取るコールバックを登録"""
+        self._callbacks.append(callback)
+
+    def add_exporter(self, exporter):
+        """エクスポーター（export(event, metrics) / close()）を登録"""
+        self._exporters.append(exporter)
+
+    def event(self, kind: str, **fields):
+        """イベントを通知（コールバック・エクスポーターの例外は構築を止めない）"""
+        event = {'time': datetime.now().isoformat(), 'kind': kind, 'build': self.name, **self.labels, **fields}
+        for callback in self._callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"[警告] 計測コールバックでエラー: {e}")
+        for exporter in self._exporters:
+            try:
+                exporter.export(event, self)
+            except Exception as e:
+                print(f"[警告] 計測エクスポーターでエラー: {e}")
+
+    # ========== 計測 ==========
+
+    @contextmanager
+    def stage(self, name: str):
+        """工程の所要時間を計測（同じ工程を複数回通った場合は合計）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            self.event('stage', stage=name, seconds=round(elapsed, 6))
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float, buckets: Iterable[float] = PAGE_TIME_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def record_page(self, page_num: int, seconds: float, chars: int = 0, tables: int = 0,
+                    bytes_written: int = 0, document: Optional[str] = None):
+        """
+        1ページ分の抽出結果を記録
+
+        Args:
+            page_num: ページ番号
+            seconds: テキスト・テーブル抽出とJSON化にかかった時間
+            chars: 文字数
+            tables: テーブル数
+            bytes_written: 保存する本文・テーブルJSONのバイト数
+            document: 文書名（コーパスの場合）
+        """
+        page = {'page_num': page_num, 'seconds': round(seconds, 6), 'chars': chars, 'tables': tables}
+        if document is not None:
+            page['document'] = document
+        with self._lock:
+            self.observe('page_extract_seconds', seconds)
+            self.incr('pages')
+            self.incr('tables', tables)
+            self.incr('chars', chars)
+            self.incr('bytes_written', bytes_written)
+            self._sequence += 1
+            item = (seconds, self._sequence, page)
+            if len(self._slowest_pages) < self.slowest:
+                heapq.heappush(self._slowest_pages, item)
+            elif seconds > self._slowest_pages[0][0]:
+                heapq.heapreplace(self._slowest_pages, item)
+
+    def slowest_pages(self) -> List[Dict[str, Any]]:
+        """最も遅いページ（遅い順）"""
+        with self._lock:
+            return [page for _, _, page in sorted(self._slowest_pages, key=lambda item: -item[0])]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """現時点の計測値"""
+        with self._lock:
+            return {
+                'elapsed': round(time.time() - self.start_time, 3),
+                'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {name: h.to_dict() for name, h in self.histograms.items()},
+                'slowest_pages': self.slowest_pages(),
+            }
+
+    # ========== 終了処理 ==========
+
+    def print_report(self):
+        """工程別の時間と最も遅いページを表示"""
+        snapshot = self.snapshot()
+        if snapshot['stages']:
+            print("\n[計測] 工程別の時間: " +
+                  ', '.join(f"{name} {seconds:.2f}秒" for name, seconds in snapshot['stages'].items()))
+        histogram = snapshot['histograms'].get('page_extract_seconds')
+        if histogram and histogram['count']:
+            print(f"[計測] ページ抽出時間: 平均 {histogram['sum'] / histogram['count'] * 1000:.1f}ms"
+                  f" / 最大 {histogram['max'] * 1000:.1f}ms（{histogram['count']:,}ページ）")
+        if snapshot['slowest_pages']:
+            print(f"[計測] 抽出に時間がかかったページ（上位{len(snapshot['slowest_pages'])}件）:")
+            for page in snapshot['slowest_pages']:
+                where = f"{page['document']} " if 'document' in page else ''
+                print(f"  {where}p.{page['page_num']}: {page['seconds'] * 1000:.1f}ms"
+                      f"（{page['chars']:,}文字, テーブル{page['tables']}個）")
+
+    def summary(self, status: str = 'complete'):
+        """現時点の計測値を summary イベントとして通知（監視モードでは更新ごとに呼ぶ。値は累積）"""
+        self.event('summary', status=status, **self.snapshot())
+
+    def close(self, status: Optional[str] = 'complete'):
+        """最終結果を summary イベントとして通知し（status=Noneなら通知しない）、エクスポーターを閉じる"""
+        if self._closed:
+            return
+        self._closed = True
+        if status is not None:
+            self.summary(status)
+        for exporter in self._exporters:
+            try:
+                exporter.close()
+            except Exception as e:
+                print(f"[警告] 計測エクスポーターの終了処理でエラー: {e}")
+
+
+class JsonLinesExporter:
+    """イベントを1行1JSONで追記する（CIでの収集用）"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def export(self, event: Dict[str, Any], metrics: BuildMetrics):
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class PrometheusTextExporter:
+    """
+    Prometheusのテキスト形式でファイルに書き出す（node_exporter の textfile collector 用）
+
+    進捗・工程・終了のイベントごとに全体を書き直し、一時ファイルからのrenameで置き換える。
+    """
+
+    REFRESH_EVENTS = ('progress', 'stage', 'summary')
+
+    def __init__(self, path: Union[str, Path], prefix: str = PROMETHEUS_PREFIX):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+
+    def export(self, event: Dict[str, Any], metrics: BuildMetrics):
+        if event['kind'] in self.REFRESH_EVENTS:
+            self.write(metrics)
+
+    def render(self, metrics: BuildMetrics) -> str:
+        """計測値をテキスト形式に変換"""
+        snapshot = metrics.snapshot()
+        labels = {'build': metrics.name, **metrics.labels}
+
+        def label_str(extra: Optional[Dict[str, str]] = None) -> str:
+            items = {**labels, **(extra or {})}
+            return '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in items.items()) + '}'
+
+        lines = [f'# TYPE {self.prefix}_stage_seconds gauge']
+        for stage, seconds in snapshot['stages'].items():
+            lines.append(f'{self.prefix}_stage_seconds{label_str({"stage": stage})} {seconds}')
+
+        for name, value in snapshot['counters'].items():
+            metric = f'{self.prefix}_{name}_total'
+            lines += [f'# TYPE {metric} counter', f'{metric}{label_str()} {value}']
+
+        gauges = dict(snapshot['gauges'], elapsed_seconds=snapshot['elapsed'])
+        for name, value in gauges.items():
+            metric = f'{self.prefix}_{name}'
+            lines += [f'# TYPE {metric} gauge', f'{metric}{label_str()} {value}']
+
+        # ヒストグラムもロック下で取ったスナップショットから書く（構築スレッドの更新と混ざらないように）
+        for name, histogram in snapshot['histograms'].items():
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# TYPE {metric} histogram')
+            for bound, count in histogram['buckets'].items():
+                lines.append(f'{metric}_bucket{label_str({"le": bound})} {count}')
+            lines.append(f'{metric}_sum{label_str()} {histogram["sum"]}')
+            lines.append(f'{metric}_count{label_str()} {histogram["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, metrics: BuildMetrics):
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        tmp_path.write_text(self.render(metrics), encoding='utf-8')
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        pass
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def create_build_metrics(name: str, jsonl_path: Optional[str] = None,
+                         prometheus_path: Optional[str] = None) -> BuildMetrics:
+    """
+    設定のパスに応じてエクスポーターを登録した BuildMetrics を作成
+
+    Args:
+        name: 構築の名前（メトリクスの build ラベル）
+        jsonl_path: JSON Linesの出力先（Noneで無効）
+        prometheus_path: Prometheusテキスト形式の出力先（Noneで無効）
+
+    Returns:
+        BuildMetrics
+    """
+    metrics = BuildMetrics(name)
+    if jsonl_path:
+        metrics.add_exporter(JsonLinesExporter(jsonl_path))
+    if prometheus_path:
+        metrics.add_exporter(PrometheusTextExporter(prometheus_path))
+    return metrics
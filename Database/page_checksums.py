@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ページ単位のチェックサム
+構築時に本文・テーブル・全文検索の行・元PDFのページ内容のダイジェストを page_checksums に保存し、
+verify_db.py がDBの内容・元PDFとの一致を確認する
+"""
+
+import hashlib
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from extraction_cache import file_sha256
+from page_store import TextCodec
+
+# チェックサムの計算方法のバージョン（ダイジェストの対象を変えたら上げる）
+CHECKSUM_VERSION = 1
+
+# 単一PDFのDBで使う doc_id（コーパスDBは documents.doc_id）
+SINGLE_DOC_ID = 0
+
+CHECKSUM_KINDS = ('text', 'tables', 'fts', 'source')
+
+
+def digest(data: Union[str, bytes, None]) -> Optional[str]:
+    """ダイジェスト（128bitのBLAKE2b。Noneはそのまま）"""
+    if data is None:
+        return None
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def digest_tables(contents: Iterable[str]) -> str:
+    """1ページ分のテーブルのJSON（table_index順）のダイジェスト"""
+    hasher = hashlib.blake2b(digest_size=16)
+    for content in contents:
+        data = content.encode('utf-8')
+        hasher.update(len(data).to_bytes(8, 'little'))
+        hasher.update(data)
+    return hasher.hexdigest()
+
+
+def source_page_digests(pdf_path: Union[str, Path]) -> Dict[int, str]:
+    """
+    元PDFの各ページのコンテンツストリーム（展開後）のダイジェスト
+
+    テキスト抽出はせずストリームを読むだけなので、抽出より桁違いに速い。
+
+    Returns:
+        ページ番号 → ダイジェスト
+    """
+    import pdfplumber
+    from pdfminer.pdftypes import resolve1
+
+    digests = {}
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_num, page in enumerate(pdf.pages, 1):
+            hasher = hashlib.blake2b(digest_size=16)
+            for stream in page.page_obj.contents:
+                data = resolve1(stream).get_data()
+                hasher.update(len(data).to_bytes(8, 'little'))
+                hasher.update(data)
+            digests[page_num] = hasher.hexdigest()
+    return digests
+
+
+def create_checksum_table(conn: sqlite3.Connection):
+    """page_checksums テーブルを作成"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS page_checksums (
+            doc_id INTEGER,
+            page_num INTEGER,
+            text TEXT,
+            tables TEXT,
+            fts TEXT,
+            source TEXT,
+            PRIMARY KEY (doc_id, page_num)
+        )
+    ''')
+
+
+def is_corpus(conn: sqlite3.Connection) -> bool:
+    """pages を (doc_id, page_num) で持つコーパスDBか"""
+    return any(row[1] == 'doc_id' for row in conn.execute('PRAGMA table_info(pages)'))
+
+
+def compute_page_checksums(conn: sqlite3.Connection, keys: Optional[Iterable[Tuple[int, int]]] = None,
+                           doc_id: Optional[int] = None) -> Dict[Tuple[int, int], Dict[str, Optional[str]]]:
+    """
+    DBの内容から本文・テーブル・全文検索の行のダイジェストを計算
+
+    Args:
+        conn: データベース接続
+        keys: 対象の (doc_id, page_num)（Noneなら全ページ、または doc_id の全ページ）
+        doc_id: コーパスDBで1文書だけ計算する場合の doc_id
+
+    Returns:
+        (doc_id, page_num) → {'text', 'tables', 'fts'}（全文検索の行が無いページの fts はNone）
+    """
+    codec = TextCodec.from_connection(conn)
+    corpus = is_corpus(conn)
+
+    def select(table: str, columns: str, order: str = '') -> Iterable[tuple]:
+        doc_column = 't.doc_id' if corpus else str(SINGLE_DOC_ID)
+        sql = f'SELECT {doc_column}, t.page_num, {columns} FROM {table} t'
+        params = []
+        if keys is not None:
+            sql += f' JOIN temp.checksum_keys k ON k.doc_id = {doc_column} AND k.page_num = t.page_num'
+        elif doc_id is not None and corpus:
+            sql += ' WHERE t.doc_id = ?'
+            params.append(doc_id)
+        return conn.execute(sql + order, params)
+
+    if keys is not None:
+        # 対象ページだけを読むよう一時テーブルと結合する（増分検証用）
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS checksum_keys (doc_id INTEGER, page_num INTEGER, '
+                     'PRIMARY KEY (doc_id, page_num))')
+        conn.execute('DELETE FROM temp.checksum_keys')
+        conn.executemany('INSERT OR IGNORE INTO temp.checksum_keys VALUES (?, ?)', keys)
+
+    result: Dict[Tuple[int, int], Dict[str, Optional[str]]] = {}
+    for key_doc, page_num, text in select('pages', 't.text'):
+        result[(key_doc, page_num)] = {'text': digest(codec.decode(text) or ''), 'tables': None, 'fts': None}
+
+    tables: Dict[Tuple[int, int], List[str]] = {}
+    for key_doc, page_num, content in select('tables', 't.content', ' ORDER BY 1, 2, t.table_index'):
+        tables.setdefault((key_doc, page_num), []).append(codec.decode(content) or '')
+    for key, value in result.items():
+        value['tables'] = digest_tables(tables.get(key, []))
+
+    # 全文検索の page_num はUNINDEXED列のため、結合せず全行を読んで対象ページだけ計算する
+    doc_column = 'doc_id' if corpus else str(SINGLE_DOC_ID)
+    for key_doc, page_num, text in conn.execute(f'SELECT {doc_column}, page_num, text FROM pages_fts'):
+        key = (int(key_doc), int(page_num))
+        if key in result:
+            result[key]['fts'] = digest(text)
+    return result
+
+
+def page_checksum_rows(doc_id: int, pages: Iterable[tuple], tables: Iterable[tuple],
+                       fts_rows: Iterable[Tuple[int, str]]) -> List[tuple]:
+    """
+    保存前の行から page_checksums の行を作る（コーパスの文書ごとの保存用。DBを読み直さない）
+
+    Args:
+        doc_id: 文書ID
+        pages: (page_num, text, char_count, table_count)
+        tables: (page_num, table_index, content)
+        fts_rows: (page_num, 索引したテキスト)
+
+    Returns:
+        (doc_id, page_num, text, tables, fts, source) のリスト
+    """
+    page_tables: Dict[int, List[Tuple[int, str]]] = {}
+    for page_num, table_index, content in tables:
+        page_tables.setdefault(page_num, []).append((table_index, content))
+    fts = {page_num: digest(text) for page_num, text in fts_rows}
+    return [(doc_id, page_num, digest(text or ''),
+             digest_tables(content for _, content in sorted(page_tables.get(page_num, []))),
+             fts.get(page_num), None)
+            for page_num, text, *_ in pages]
+
+
+def store_page_checksums(conn: sqlite3.Connection, pdf_path: Optional[Union[str, Path]] = None,
+                         doc_id: Optional[int] = None) -> int:
+    """
+    構築したページのチェックサムを page_checksums に保存（pages・tables・pages_fts の作成後に呼ぶ）
+
+    pdf_path を渡すと元PDFの各ページのダイジェストと、ファイル全体のSHA-256・ページ数
+    （metadata の source_sha256・source_pages）も保存する。
+
+    Args:
+        conn: データベース接続
+        pdf_path: 元PDF（単一PDFのDBの場合）
+        doc_id: コーパスDBで1文書分だけ保存する場合の doc_id
+
+    Returns:
+        保存したページ数
+    """
+    create_checksum_table(conn)
+    checksums = compute_page_checksums(conn, doc_id=doc_id)
+    sources = source_page_digests(pdf_path) if pdf_path else {}
+
+    if doc_id is not None:
+        conn.execute('DELETE FROM page_checksums WHERE doc_id = ?', (doc_id,))
+    else:
+        conn.execute('DELETE FROM page_checksums')
+    conn.executemany('INSERT INTO page_checksums VALUES (?, ?, ?, ?, ?, ?)', [
+        (key_doc, page_num, value['text'], value['tables'], value['fts'], sources.get(page_num))
+        for (key_doc, page_num), value in sorted(checksums.items())
+    ])
+
+    items = [('checksum_version', str(CHECKSUM_VERSION))]
+    if pdf_path:
+        items += [('source_name', Path(pdf_path).name), ('source_sha256', file_sha256(pdf_path)),
+                  ('source_pages', str(len(sources)))]
+    conn.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?)', items)
+    conn.commit()
+    return len(checksums)
+
+
+def load_page_checksums(conn: sqlite3.Connection) -> Optional[Dict[Tuple[int, int], Tuple]]:
+    """保存済みのチェックサム（(doc_id, page_num) → (text, tables, fts, source)）。テーブルが無ければNone"""
+    try:
+        rows = conn.execute('SELECT doc_id, page_num, text, tables, fts, source FROM page_checksums').fetchall()
+    except sqlite3.OperationalError:
+        return None
+    return {(row[0], row[1]): tuple(row[2:]) for row in rows}
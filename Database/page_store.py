@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ページ・テーブル格納データの共通処理
+複数ページの一括取得（集合クエリ + ストリーミング）、テーブルの遅延デコード、
+本文・テーブルの圧縮格納（zlib + 文書ごとの共有辞書）と透過的な展開
+"""
+
+import sqlite3
+import json
+import zlib
+from collections import Counter
+from collections.abc import Sequence
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+# IN句1回あたりのページ数（SQLITE_MAX_VARIABLE_NUMBERの既定値999未満に抑える）
+IN_CHUNK_SIZE = 500
+
+_UNDECODED = object()
+
+# zlibの共有辞書の最大サイズ（スライディングウィンドウ32KB）
+ZDICT_SIZE = 32 * 1024
+
+
+class TextCodec:
+    """
+    pages.text / tables.content の圧縮と展開
+
+    圧縮済みの値はBLOB、未圧縮の値はTEXTとして格納されるため、
+    値の型だけで判別でき、圧縮・未圧縮のDBを同じコードで読める。
+    """
+
+    def __init__(self, zdict: Optional[bytes] = None, level: int = 9):
+        self.zdict = zdict or b''
+        self.level = level
+
+    @classmethod
+    def from_connection(cls, conn: sqlite3.Connection) -> 'TextCodec':
+        """DBに保存された共有辞書を読み込む（辞書が無いDBでは展開のみ素通し）"""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'codec_dictionary'").fetchone()
+        if not exists:
+            return cls()
+
+        row = conn.execute("SELECT data FROM codec_dictionary WHERE name = 'text'").fetchone()
+        return cls(row[0] if row else None)
+
+    @staticmethod
+    def train_dictionary(texts: Iterable[str], size: int = ZDICT_SIZE) -> bytes:
+        """
+        文書内で繰り返し現れる行から共有辞書を作成
+
+        zlibは辞書の末尾ほど短い距離で参照できるため、効果の大きい行を末尾に置く。
+
+        Args:
+            texts: 文書のページテキスト・テーブルJSON
+            size: 辞書の最大バイト数
+
+        Returns:
+            辞書のバイト列
+        """
+        line_counts = Counter()
+        for text in texts:
+            line_counts.update(line for line in set((text or '').splitlines()) if len(line) >= 8)
+
+        candidates = [(count * len(line.encode('utf-8')), line)
+                      for line, count in line_counts.items() if count >= 2]
+        candidates.sort(reverse=True)
+
+        chosen = []
+        total = 0
+        for _, line in candidates:
+            encoded = line.encode('utf-8') + b'\n'
+            if total + len(encoded) > size:
+                continue
+            chosen.append(encoded)
+            total += len(encoded)
+
+        return b''.join(reversed(chosen))
+
+    def encode(self, text: Optional[str]) -> Optional[bytes]:
+        """テキストを圧縮"""
+        if text is None:
+            return None
+        if self.zdict:
+            compressor = zlib.compressobj(self.level, zdict=self.zdict)
+        else:
+            compressor = zlib.compressobj(self.level)
+        return compressor.compress(text.encode('utf-8')) + compressor.flush()
+
+    def decode(self, value: Any) -> Any:
+        """格納値を展開（BLOB以外はそのまま返す）"""
+        if not isinstance(value, bytes):
+            return value
+        if self.zdict:
+            decompressor = zlib.decompressobj(zdict=self.zdict)
+        else:
+            decompressor = zlib.decompressobj()
+        return (decompressor.decompress(value) + decompressor.flush()).decode('utf-8')
+
+    def decode_json(self, value: Any) -> Any:
+        """テーブルのJSONを展開してデコード"""
+        return json.loads(self.decode(value))
+
+    def register(self, conn: sqlite3.Connection):
+        """SQL関数 decode_text(x) を登録（LIKE検索などSQL内での展開用）"""
+        conn.create_function('decode_text', 1, self.decode, deterministic=True)
+
+
+def compress_storage(conn: sqlite3.Connection, level: int = 9) -> Tuple[int, int]:
+    """
+    pages.text と tables.content を共有辞書付きzlibで圧縮
+
+    全文検索インデックス（pages_fts）は独自に本文を持つため影響を受けない。
+    ファイルを実際に縮めるにはこの後でVACUUMが必要。
+
+    Args:
+        conn: データベース接続（pages・tables挿入済み）
+        level: zlibの圧縮レベル
+
+    Returns:
+        (圧縮前の合計バイト数, 圧縮後の合計バイト数)
+    """
+    pages = conn.execute('SELECT page_num, text FROM pages WHERE typeof(text) = \'text\'').fetchall()
+    tables = conn.execute('SELECT id, content FROM tables WHERE typeof(content) = \'text\'').fetchall()
+
+    zdict = TextCodec.train_dictionary([text for _, text in pages] + [content for _, content in tables])
+    codec = TextCodec(zdict, level)
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS codec_dictionary (
+            name TEXT PRIMARY KEY,
+            codec TEXT,
+            data BLOB
+        )
+    ''')
+    conn.execute("INSERT OR REPLACE INTO codec_dictionary VALUES ('text', 'zlib', ?)", (zdict,))
+    conn.execute("INSERT OR REPLACE INTO metadata VALUES ('text_codec', 'zlib+dict')")
+
+    raw_bytes = 0
+    compressed_bytes = 0
+    page_rows = []
+    for page_num, text in pages:
+        encoded = codec.encode(text)
+        raw_bytes += len(text.encode('utf-8'))
+        compressed_bytes += len(encoded)
+        page_rows.append((encoded, page_num))
+    table_rows = []
+    for table_id, content in tables:
+        encoded = codec.encode(content)
+        raw_bytes += len(content.encode('utf-8'))
+        compressed_bytes += len(encoded)
+        table_rows.append((encoded, table_id))
+
+    conn.executemany('UPDATE pages SET text = ? WHERE page_num = ?', page_rows)
+    conn.executemany('UPDATE tables SET content = ? WHERE id = ?', table_rows)
+    conn.commit()
+
+    return raw_bytes, compressed_bytes
+
+
+class LazyTables(Sequence):
+    """JSON文字列のまま保持し、アクセスされた要素だけをデコードするテーブルリスト"""
+
+    __slots__ = ('_raw', '_decoded', '_decode')
+
+    def __init__(self, raw: Iterable[Any], decode: Callable[[Any], Any] = json.loads):
+        self._raw = list(raw)
+        self._decoded = [_UNDECODED] * len(self._raw)
+        self._decode = decode
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        value = self._decoded[index]
+        if value is _UNDECODED:
+            value = self._decode(self._raw[index])
+            self._decoded[index] = value
+        return value
+
+    def __repr__(self) -> str:
+        return f"LazyTables({len(self)} tables)"
+
+
+def json_default(obj: Any) -> Any:
+    """json.dump用: LazyTablesをリストとして書き出す"""
+    if isinstance(obj, LazyTables):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def iter_pages(conn: sqlite3.Connection, page_nums: Iterable[int],
+               doc_id: Optional[int] = None) -> Iterator[Tuple[sqlite3.Row, List[sqlite3.Row]]]:
+    """
+    指定ページの行とテーブル行をpage_num順にストリーミングする
+
+    連続範囲（step=1のrange）はBETWEEN、それ以外はIN句で、
+    pagesとtablesをそれぞれ1本の集合クエリで読み、マージしながら返す。
+
+    Args:
+        conn: データベース接続
+        page_nums: ページ番号のrangeまたは任意のイテラブル
+        doc_id: コーパスDBの文書（コーパスDBでは必須）
+
+    Yields:
+        (ページ行, そのページのテーブル行[(page_num, table_index, content)]) のタプル
+    """
+    scope, scope_params = ('doc_id = ? AND ', [doc_id]) if doc_id is not None else ('', [])
+    key_index = 1 if doc_id is not None else 0  # コーパスDBの pages は (doc_id, page_num, ...) の順
+
+    if isinstance(page_nums, range) and page_nums.step == 1:
+        if len(page_nums) > 0:
+            yield from _iter_page_span(conn, scope + 'page_num BETWEEN ? AND ?',
+                                       (*scope_params, page_nums.start, page_nums.stop - 1), key_index)
+        return
+
+    nums = sorted(set(page_nums))
+    for i in range(0, len(nums), IN_CHUNK_SIZE):
+        chunk = nums[i:i + IN_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        yield from _iter_page_span(conn, scope + f'page_num IN ({placeholders})', scope_params + chunk, key_index)
+
+
+def _iter_page_span(conn: sqlite3.Connection, where: str, params,
+                    key_index: int = 0) -> Iterator[Tuple[sqlite3.Row, List[sqlite3.Row]]]:
+    """WHERE条件に一致するページとテーブルを2本のカーソルでマージする"""
+    pages = conn.execute(f'SELECT * FROM pages WHERE {where} ORDER BY page_num', params)
+    tables = conn.execute(f'''
+        SELECT page_num, table_index, content FROM tables
+        WHERE {where}
+        ORDER BY page_num, table_index
+    ''', params)
+
+    pending = tables.fetchone()
+    for page in pages:
+        page_num = page[key_index]
+        page_tables = []
+        while pending is not None and pending[0] <= page_num:
+            if pending[0] == page_num:
+                page_tables.append(pending)
+            pending = tables.fetchone()
+        yield page, page_tables
+
+
+def page_filter_sql(column: str = 'page_num',
+                    page_range: Optional[Tuple[int, int]] = None,
+                    has_tables: Optional[bool] = None,
+                    min_chars: Optional[int] = None,
+                    max_chars: Optional[int] = None,
+                    section: Optional[str] = None) -> Tuple[str, List[Any]]:
+    """
+    構造化フィルタをSQL条件に変換
+
+    条件は「column IN (SELECT page_num FROM pages WHERE ...)」の形にまとめるため、
+    FTSのMATCHと同じ1本のSQLで評価され、サブクエリ側では
+    pagesの主キー・idx_pages_char_count・idx_pages_table_count が使われる。
+
+    Args:
+        column: 絞り込み対象のページ番号列（例: 'fts.page_num'）
+        page_range: (開始, 終了) のページ範囲（両端を含む）
+        has_tables: True=テーブルを含むページのみ、False=含まないページのみ
+        min_chars: 最小文字数
+        max_chars: 最大文字数
+        section: セクションタイトル（LIKEパターン、sectionsテーブルが必要）
+
+    Returns:
+        (" AND ..." 形式のSQL断片, パラメータのリスト)。フィルタなしの場合は ("", [])
+    """
+    conditions = []
+    params: List[Any] = []
+
+    if page_range is not None:
+        conditions.append('page_num BETWEEN ? AND ?')
+        params.extend(page_range)
+    if has_tables is not None:
+        conditions.append('table_count > 0' if has_tables else 'table_count = 0')
+    if min_chars is not None:
+        conditions.append('char_count >= ?')
+        params.append(min_chars)
+    if max_chars is not None:
+        conditions.append('char_count <= ?')
+        params.append(max_chars)
+    if section is not None:
+        # セクション開始ページから、同レベル以上の次のセクション開始ページの手前まで
+        conditions.append('''EXISTS (
+            SELECT 1 FROM sections s
+            WHERE s.title LIKE ?
+              AND pages.page_num >= s.page_num
+              AND pages.page_num < COALESCE(
+                  (SELECT MIN(n.page_num) FROM sections n
+                   WHERE n.level <= s.level AND n.page_num > s.page_num),
+                  pages.page_num + 1)
+        )''')
+        params.append(section)
+
+    if not conditions:
+        return '', []
+
+    where = ' AND '.join(conditions)
+    return f' AND {column} IN (SELECT page_num FROM pages WHERE {where})', params
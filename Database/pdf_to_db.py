@@ -6,22 +6,39 @@ RH850ハードウェアマニュアルPDFをSQLiteデータベースに変換
 """
 
 import sqlite3
-import pdfplumber
 import json
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import time
+from datetime import datetime
+
+from ingest_pipeline import normalize_text
+from extraction_cache import open_pdf
+from db_publish import discard_staging, staging_path_for
+from build_steps import PDFBuildStepsMixin
+from instrumentation import BuildMetrics, create_build_metrics
 
 # 設定
 PDF_PATH = r"c:/Users/baoma/TRD/Renesas/r12ut0004ed0110-rh850f1km-s1.pdf"
 DB_PATH = r"c:/Users/baoma/TRD/RH850F1KMS1_Board.db"
+COMPRESS_STORAGE = False  # 本文・テーブルを共有辞書付きzlibで圧縮格納する
+FINALIZE = True           # 公開用に読み取り最適化（FTSマージ、ANALYZE、VACUUM INTO）する
+EXTRACTION_CACHE_DIR = r"c:/Users/baoma/TRD/.extraction_cache"  # ページ抽出結果のキャッシュ（Noneで無効）
+METRICS_JSONL_PATH = None       # 構築の計測イベントのJSON Lines出力先（Noneで無効）
+METRICS_PROMETHEUS_PATH = None  # 計測値のPrometheusテキスト形式の出力先（Noneで無効）
 
-class PDFDatabaseBuilder:
+class PDFDatabaseBuilder(PDFBuildStepsMixin):
     """PDFからデータベースを構築するクラス"""
 
-    def __init__(self, pdf_path: str, db_path: str):
+    def __init__(self, pdf_path: str, db_path: str, compress: bool = False, finalize: bool = True,
+                 cache_dir: Optional[str] = None, metrics: Optional[BuildMetrics] = None):
         self.pdf_path = pdf_path
         self.db_path = db_path
+        self.build_path = staging_path_for(db_path)  # 構築中の一時ファイル（検証後に db_path へ差し替え）
+        self.compress = compress
+        self.finalize = finalize
+        self.cache_dir = cache_dir
+        self.metrics = metrics or BuildMetrics(Path(db_path).stem)  # 工程・ページ単位の計測
         self.conn = None
 
     def create_schema(self):
@@ -73,7 +90,7 @@ class PDFDatabaseBuilder:
         """PDFからデータを抽出してデータベースに保存"""
         print(f"PDFを開いています: {self.pdf_path}")
 
-        with pdfplumber.open(self.pdf_path) as pdf:
+        with open_pdf(self.pdf_path, self.cache_dir) as pdf:
             total_pages = len(pdf.pages)
             print(f"総ページ数: {total_pages}")
 
@@ -84,11 +101,12 @@ class PDFDatabaseBuilder:
             cursor = self.conn.cursor()
             pages_data = []
             tables_data = []
-            fts_data = []
 
             for i, page in enumerate(pdf.pages, 1):
+                page_start = time.perf_counter()
+
                 # テキスト抽出
-                text = page.extract_text() or ""
+                text = normalize_text(page.extract_text() or "")
                 char_count = len(text)
 
                 # テーブル抽出
@@ -97,30 +115,37 @@ class PDFDatabaseBuilder:
 
                 # ページデータを追加
                 pages_data.append((i, text, char_count, table_count))
-                fts_data.append((i, text))
 
                 # テーブルデータを追加
+                page_bytes = len(text.encode('utf-8'))
                 for idx, table in enumerate(tables):
                     table_json = json.dumps(table, ensure_ascii=False)
                     tables_data.append((i, idx, table_json))
+                    page_bytes += len(table_json.encode('utf-8'))
+                page.release()
+                self.metrics.record_page(i, time.perf_counter() - page_start, char_count, table_count, page_bytes)
 
                 # 進捗表示
                 if i % 5 == 0 or i == total_pages:
                     print(f"  処理中: {i}/{total_pages} ページ ({i*100//total_pages}%)")
+                    self.metrics.event('progress', pages=i, pages_total=total_pages)
 
             # バッチ挿入
             print("データベースに挿入中...")
+            commit_start = time.perf_counter()
             cursor.executemany('INSERT INTO pages VALUES (?, ?, ?, ?)', pages_data)
             cursor.executemany('INSERT INTO tables (page_num, table_index, content) VALUES (?, ?, ?)', tables_data)
-            cursor.executemany('INSERT INTO pages_fts (page_num, text) VALUES (?, ?)', fts_data)
 
             self.conn.commit()
+            self.metrics.observe('batch_commit_seconds', time.perf_counter() - commit_start)
             print(f"[OK] {total_pages}ページ、{len(tables_data)}個のテーブルを保存しました")
+            print(f"[OK] {pdf.cache_summary()}")
 
     def _store_metadata(self, metadata: Dict[str, Any]):
         """メタデータを保存"""
         cursor = self.conn.cursor()
         metadata_items = [(k, str(v)) for k, v in metadata.items()]
+        metadata_items.append(('build_time', datetime.now().isoformat()))  # 読み取り側が世代の判別に使う
         cursor.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?)', metadata_items)
         self.conn.commit()
         print(f"[OK] {len(metadata_items)}個のメタデータを保存しました")
@@ -136,35 +161,65 @@ class PDFDatabaseBuilder:
         """データベースを構築"""
         start_time = time.time()
 
-        # 既存のDBを削除
-        db_file = Path(self.db_path)
-        if db_file.exists():
-            db_file.unlink()
-            print(f"既存のデータベースを削除しました: {self.db_path}")
+        # 一時ファイルに構築する（公開中のDBは差し替えまでそのまま検索できる）
+        discard_staging(self.build_path)
 
         # データベース接続
-        self.conn = sqlite3.connect(self.db_path)
-        print(f"データベースを作成: {self.db_path}\n")
+        self.conn = sqlite3.connect(self.build_path)
+        print(f"データベースを作成: {self.build_path}\n")
 
+        status = 'failed'
         try:
             # スキーマ作成
-            self.create_schema()
+            with self.metrics.stage('schema'):
+                self.create_schema()
 
             # データ抽出と保存
-            self.extract_and_store()
+            with self.metrics.stage('extract'):
+                self.extract_and_store()
+
+            # 全文検索インデックス作成（ヘッダ/フッタ除去）
+            with self.metrics.stage('fts_index'):
+                self.create_fts_index()
+
+            # ページ単位のチェックサム
+            with self.metrics.stage('checksums'):
+                self.store_checksums()
 
             # インデックス作成
-            self.create_indexes()
+            with self.metrics.stage('indexes'):
+                self.create_indexes()
+
+            # 類似ページ索引作成
+            with self.metrics.stage('similarity_index'):
+                self.create_similarity_index()
+
+            # 本文・テーブルの圧縮（オプション）
+            if self.compress:
+                with self.metrics.stage('compress'):
+                    self.compress_text_storage()
 
             # 統計情報を表示
             self._print_statistics()
 
+            # 公開用の読み取り最適化
+            if self.finalize:
+                with self.metrics.stage('finalize'):
+                    self.finalize_for_publish()
+
+            # 検証して公開中のDBと差し替え
+            with self.metrics.stage('publish'):
+                self.publish()
+            status = 'complete'
+
+            self.metrics.print_report()
             elapsed = time.time() - start_time
             print(f"\n[OK] データベース構築完了！ (所要時間: {elapsed:.2f}秒)")
 
         finally:
             if self.conn:
                 self.conn.close()
+            self.metrics.close(status)
 
     def _print_statistics(self):
         """データベース統計情報を表示"""
@@ -185,7 +240,9 @@ def main():
     print("RH850 PDFデータベース構築ツール")
     print("=" * 60 + "\n")
 
-    builder = PDFDatabaseBuilder(PDF_PATH, DB_PATH)
+    metrics = create_build_metrics(Path(DB_PATH).stem, METRICS_JSONL_PATH, METRICS_PROMETHEUS_PATH)
+    builder = PDFDatabaseBuilder(PDF_PATH, DB_PATH, compress=COMPRESS_STORAGE, finalize=FINALIZE,
+                                 cache_dir=EXTRACTION_CACHE_DIR, metrics=metrics)
     builder.build()
 
 if __name__ == "__main__":
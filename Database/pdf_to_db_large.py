@@ -6,33 +6,49 @@
 """
 
 import sqlite3
-import pdfplumber
 import json
 import sys
 import time
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+from ingest_pipeline import normalize_text
+from extraction_cache import open_pdf
+from db_publish import discard_staging, staging_path_for
+from build_steps import PDFBuildStepsMixin
+from instrumentation import BuildMetrics, create_build_metrics
+
 # 設定
 PDF_PATH = r"c:/Users/baoma/TRD/Renesas/r01uh0622ej0130-rh850f1kh_rh850f1km_rh850f1k-flashmemory-if.pdf"
 DB_PATH = r"c:/Users/baoma/TRD/RH850_FlashMemory_IF.db"
 BATCH_SIZE = 100  # 100ページごとにコミット
+COMPRESS_STORAGE = False  # 本文・テーブルを共有辞書付きzlibで圧縮格納する
+FINALIZE = True           # 公開用に読み取り最適化（FTSマージ、ANALYZE、VACUUM INTO）する
+EXTRACTION_CACHE_DIR = r"c:/Users/baoma/TRD/.extraction_cache"  # ページ抽出結果のキャッシュ（Noneで無効）
+METRICS_JSONL_PATH = None       # 構築の計測イベントのJSON Lines出力先（Noneで無効）
+METRICS_PROMETHEUS_PATH = None  # 計測値のPrometheusテキスト形式の出力先（Noneで無効）
 
-class LargePDFDatabaseBuilder:
+class LargePDFDatabaseBuilder(PDFBuildStepsMixin):
     """大規模PDF用データベース構築クラス"""
 
-    def __init__(self, pdf_path: str, db_path: str, batch_size: int = 100):
+    def __init__(self, pdf_path: str, db_path: str, batch_size: int = 100, compress: bool = False, finalize: bool = True,
+                 cache_dir: Optional[str] = None, metrics: Optional[BuildMetrics] = None):
         self.pdf_path = pdf_path
         self.db_path = db_path
+        self.build_path = staging_path_for(db_path)  # 構築中の一時ファイル（検証後に db_path へ差し替え）
         self.batch_size = batch_size
+        self.compress = compress
+        self.finalize = finalize
+        self.cache_dir = cache_dir
+        self.metrics = metrics or BuildMetrics(Path(db_path).stem)  # 工程・ページ単位の計測
         self.conn = None
         self.total_pages = 0
         self.start_time = None
 
     def setup_database(self):
         """データベースの初期設定"""
-        self.conn = sqlite3.connect(self.db_path)
+        self.conn = sqlite3.connect(self.build_path)
         cursor = self.conn.cursor()
 
         # パフォーマンス最適化
@@ -94,7 +110,7 @@ class LargePDFDatabaseBuilder:
         """PDFからデータを抽出してデータベースに保存（バッチ処理）"""
         print(f"\n[開始] PDFを開いています: {Path(self.pdf_path).name}")
 
-        with pdfplumber.open(self.pdf_path) as pdf:
+        with open_pdf(self.pdf_path, self.cache_dir) as pdf:
             self.total_pages = len(pdf.pages)
             print(f"[情報] 総ページ数: {self.total_pages:,}")
 
@@ -109,15 +125,16 @@ class LargePDFDatabaseBuilder:
 
             pages_batch = []
             tables_batch = []
-            fts_batch = []
 
             print(f"\n[処理] バッチサイズ: {self.batch_size}ページ")
             print("=" * 70)
 
             for i, page in enumerate(pdf.pages, 1):
                 try:
+                    page_start = time.perf_counter()
+
                     # テキスト抽出
-                    text = page.extract_text() or ""
+                    text = normalize_text(page.extract_text() or "")
                     char_count = len(text)
                     total_chars += char_count
 
@@ -128,21 +145,26 @@ class LargePDFDatabaseBuilder:
 
                     # バッチに追加
                     pages_batch.append((i, text, char_count, table_count))
-                    fts_batch.append((i, text))
 
+                    page_bytes = len(text.encode('utf-8'))
                     for idx, table in enumerate(tables):
                         table_json = json.dumps(table, ensure_ascii=False)
                         tables_batch.append((i, idx, table_json))
+                        page_bytes += len(table_json.encode('utf-8'))
+                    page.release()
+                    self.metrics.record_page(i, time.perf_counter() - page_start, char_count, table_count, page_bytes)
 
                     # バッチコミット
                     if i % self.batch_size == 0 or i == self.total_pages:
                         batch_count += 1
 
                         # データベースに挿入
+                        commit_start = time.perf_counter()
                         cursor.executemany('INSERT INTO pages VALUES (?, ?, ?, ?)', pages_batch)
                         cursor.executemany('INSERT INTO tables (page_num, table_index, content) VALUES (?, ?, ?)', tables_batch)
-                        cursor.executemany('INSERT INTO pages_fts (page_num, text) VALUES (?, ?)', fts_batch)
                         self.conn.commit()
+                        pdf.flush()
+                        self.metrics.observe('batch_commit_seconds', time.perf_counter() - commit_start)
 
                         # 進捗報告
                         self._print_progress(i, total_chars, total_tables, batch_count)
@@ -150,20 +172,22 @@ class LargePDFDatabaseBuilder:
                         # バッチをクリア
                         pages_batch = []
                         tables_batch = []
-                        fts_batch = []
 
                 except Exception as e:
                     print(f"\n[警告] ページ {i} の処理中にエラー: {e}")
+                    self.metrics.incr('page_errors')
                     continue
 
             print("=" * 70)
             print(f"\n[完了] {self.total_pages:,}ページ、{total_tables:,}個のテーブルを保存しました")
             print(f"[完了] 総文字数: {total_chars:,}")
+            print(f"[完了] {pdf.cache_summary()}")
 
     def _store_metadata(self, metadata: Dict[str, Any]):
         """メタデータを保存"""
         cursor = self.conn.cursor()
         metadata_items = [(k, str(v)) for k, v in metadata.items()]
+        metadata_items.append(('build_time', datetime.now().isoformat()))  # 読み取り側が世代の判別に使う
         cursor.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?)', metadata_items)
         self.conn.commit()
         print(f"[OK] {len(metadata_items)}個のメタデータを保存しました")
@@ -181,6 +205,9 @@ class LargePDFDatabaseBuilder:
         print(f"       文字数: {total_chars:,} | テーブル: {total_tables:,}")
         print()
 
+        self.metrics.event('progress', pages=current_page, pages_total=self.total_pages, batch=batch_count,
+                           chars=total_chars, tables=total_tables, pages_per_sec=round(pages_per_sec, 2))
+
     def _format_time(self, seconds: float) -> str:
         """秒を読みやすい形式に変換"""
         if seconds < 60:
@@ -224,28 +251,58 @@ class LargePDFDatabaseBuilder:
         print("=" * 70)
         print(f"開始時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
 
-        # 既存のDBを削除
-        db_file = Path(self.db_path)
-        if db_file.exists():
-            db_file.unlink()
-            print(f"[削除] 既存のデータベースを削除しました")
+        # 一時ファイルに構築する（公開中のDBは差し替えまでそのまま検索できる）
+        discard_staging(self.build_path)
+        print(f"[作成] 一時ファイルに構築します: {self.build_path}")
 
         # データベース接続と設定
         self.setup_database()
 
+        status = 'failed'
         try:
             # スキーマ作成
-            self.create_schema()
+            with self.metrics.stage('schema'):
+                self.create_schema()
 
             # データ抽出と保存
-            self.extract_and_store()
+            with self.metrics.stage('extract'):
+                self.extract_and_store()
+
+            # 全文検索インデックス作成（ヘッダ/フッタ除去）
+            with self.metrics.stage('fts_index'):
+                self.create_fts_index()
+
+            # ページ単位のチェックサム
+            with self.metrics.stage('checksums'):
+                self.store_checksums()
 
             # インデックス作成
-            self.create_indexes()
+            with self.metrics.stage('indexes'):
+                self.create_indexes()
+
+            # 類似ページ索引作成
+            with self.metrics.stage('similarity_index'):
+                self.create_similarity_index()
+
+            # 本文・テーブルの圧縮（オプション）
+            if self.compress:
+                with self.metrics.stage('compress'):
+                    self.compress_text_storage()
 
             # 統計情報を表示
             self.print_statistics()
 
+            # 公開用の読み取り最適化
+            if self.finalize:
+                with self.metrics.stage('finalize'):
+                    self.finalize_for_publish()
+
+            # 検証して公開中のDBと差し替え
+            with self.metrics.stage('publish'):
+                self.publish()
+            status = 'complete'
+            self.metrics.print_report()
+
             # 完了
             elapsed = time.time() - self.start_time
             print(f"\n[完了] データベース構築完了！")
@@ -254,18 +311,23 @@ class LargePDFDatabaseBuilder:
 
         except KeyboardInterrupt:
             print("\n\n[中断] ユーザーによって中断されました")
-            self.conn.commit()
-            print("[保存] 処理済みデータを保存しました")
+            status = 'interrupted'
+            if self.conn:  # publish() の後は接続を閉じている
+                self.conn.commit()
+                print(f"[保存] 処理済みデータを一時ファイルに保存しました（公開はしていません）: {self.build_path}")
         except Exception as e:
             print(f"\n[エラー] {e}")
             raise
         finally:
             if self.conn:
                 self.conn.close()
+            self.metrics.close(status)
 
 def main():
     """メイン関数"""
-    builder = LargePDFDatabaseBuilder(PDF_PATH, DB_PATH, BATCH_SIZE)
+    metrics = create_build_metrics(Path(DB_PATH).stem, METRICS_JSONL_PATH, METRICS_PROMETHEUS_PATH)
+    builder = LargePDFDatabaseBuilder(PDF_PATH, DB_PATH, BATCH_SIZE, compress=COMPRESS_STORAGE, finalize=FINALIZE,
+                                      cache_dir=EXTRACTION_CACHE_DIR, metrics=metrics)
     builder.build()
 
 if __name__ == "__main__":
@@ -6,30 +6,60 @@
 """
 
 import sqlite3
-import pdfplumber
 import json
 import sys
 import time
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import threading
 
+from ingest_pipeline import normalize_text
+from extraction_cache import open_pdf
+from progressive_build import complete_database_live, parse_page_ranges, prioritized_order, publish_snapshot
+from db_publish import discard_staging, staging_path_for
+from build_steps import PDFBuildStepsMixin
+from instrumentation import BuildMetrics, create_build_metrics
+from build_tuning import BatchTuner, load_tuned_settings
+
 # 設定
 PDF_PATH = r"c:/Users/baoma/TRD/Renesas/r01uh0622ej0130-rh850f1kh_rh850f1km_rh850f1k-flashmemory-if.pdf"
 DB_PATH = r"c:/Users/baoma/TRD/RH850_FlashMemory_IF_Fast.db"
 BATCH_SIZE = 200  # 200ページごとにコミット（高速化）
 MAX_WORKERS = 4   # 並列処理スレッド数
-
-class UltraFastPDFDatabaseBuilder:
+ADAPTIVE_TUNING = False   # 処理速度とコミット時間を見てバッチサイズ・ワーカー数を自動調整する（前回の値から開始）
+COMPRESS_STORAGE = False  # 本文・テーブルを共有辞書付きzlibで圧縮格納する
+FINALIZE = True           # 公開用に読み取り最適化（FTSマージ、ANALYZE、VACUUM INTO）する
+EXTRACTION_CACHE_DIR = r"c:/Users/baoma/TRD/.extraction_cache"  # ページ抽出結果のキャッシュ（Noneで無効）
+PRIORITY_RANGES = []      # 先に処理して公開するページ範囲 例: [(1, 60), (120, 180)]
+CHECKPOINT_PAGES = 0      # このページ数ごとに検索可能なスナップショットを公開（0で無効）
+REPLACE_COMPLETE = False  # 完了済みのDBが公開中でもスナップショットで置き換える（通常は完了まで旧DBを残す）
+METRICS_JSONL_PATH = None       # 構築の計測イベントのJSON Lines出力先（Noneで無効）
+METRICS_PROMETHEUS_PATH = None  # 計測値のPrometheusテキスト形式の出力先（Noneで無効）
+
+class UltraFastPDFDatabaseBuilder(PDFBuildStepsMixin):
     """超高速PDF用データベース構築クラス"""
 
-    def __init__(self, pdf_path: str, db_path: str, batch_size: int = 200, max_workers: int = 4):
+    def __init__(self, pdf_path: str, db_path: str, batch_size: int = 200, max_workers: int = 4,
+                 compress: bool = False, finalize: bool = True,
+                 priority_ranges: Optional[List[Tuple[int, int]]] = None, checkpoint_pages: int = 0,
+                 cache_dir: Optional[str] = None, metrics: Optional[BuildMetrics] = None,
+                 adaptive: bool = False, replace_complete: bool = False):
         self.pdf_path = pdf_path
         self.db_path = db_path
+        self.build_path = staging_path_for(db_path)  # 構築中の一時ファイル（検証後に db_path へ差し替え）
         self.batch_size = batch_size
         self.max_workers = max_workers
+        self.compress = compress
+        self.finalize = finalize
+        self.cache_dir = cache_dir
+        self.priority_ranges = priority_ranges or []
+        self.checkpoint_pages = checkpoint_pages
+        self.replace_complete = replace_complete  # 完了済みの公開DBもスナップショットで置き換える
+        self._checkpoint_skipped = False
+        self.metrics = metrics or BuildMetrics(Path(db_path).stem)  # 工程・ページ単位の計測
+        self.tuner = BatchTuner(batch_size, max_workers) if adaptive else None  # 自動調整（adaptive時のみ）
         self.conn = None
         self.total_pages = 0
         self.start_time = None
@@ -37,16 +67,17 @@ class UltraFastPDFDatabaseBuilder:
 
     def setup_database(self):
         """データベースの初期設定（超高速版）"""
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn = sqlite3.connect(self.build_path, check_same_thread=False)
         cursor = self.conn.cursor()
 
         # 超高速パフォーマンス最適化
+        # page_sizeはWALへの切り替え後には変更できないため先に設定する
+        cursor.execute('PRAGMA page_size=8192')  # 8KBページサイズ
         cursor.execute('PRAGMA journal_mode=WAL')
         cursor.execute('PRAGMA synchronous=NORMAL')
         cursor.execute('PRAGMA cache_size=-128000')  # 128MB（2倍に増加）
         cursor.execute('PRAGMA temp_store=MEMORY')
         cursor.execute('PRAGMA mmap_size=268435456')  # 256MB メモリマップI/O
-        cursor.execute('PRAGMA page_size=8192')  # 8KBページサイズ
         cursor.execute('PRAGMA locking_mode=EXCLUSIVE')  # 排他ロックモード
 
         print("[設定] データベース超高速最適化完了")
@@ -126,8 +157,10 @@ class UltraFastPDFDatabaseBuilder:
         page_num, page = page_data
 
         try:
+            page_start = time.perf_counter()
+
             # テキスト抽出
-            text = page.extract_text() or ""
+            text = normalize_text(page.extract_text() or "")
             char_count = len(text)
 
             # テーブル抽出
@@ -136,28 +169,40 @@ class UltraFastPDFDatabaseBuilder:
 
             # テーブルをJSON化
             tables_json = []
+            page_bytes = len(text.encode('utf-8'))
             for idx, table in enumerate(tables):
                 table_json = json.dumps(table, ensure_ascii=False)
                 tables_json.append((page_num, idx, table_json))
+                page_bytes += len(table_json.encode('utf-8'))
 
+            self.metrics.record_page(page_num, time.perf_counter() - page_start, char_count, table_count, page_bytes)
             return (page_num, text, char_count, table_count, tables_json)
 
         except Exception as e:
             print(f"\n[警告] ページ {page_num} の処理中にエラー: {e}")
+            self.metrics.incr('page_errors')
             return (page_num, "", 0, 0, [])
+        finally:
+            page.release()
 
     def extract_and_store_parallel(self):
         """PDFからデータを抽出してデータベースに保存（並列処理版）"""
         print(f"\n[開始] PDFを開いています: {Path(self.pdf_path).name}")
 
-        with pdfplumber.open(self.pdf_path) as pdf:
+        with open_pdf(self.pdf_path, self.cache_dir) as pdf:
             self.total_pages = len(pdf.pages)
             print(f"[情報] 総ページ数: {self.total_pages:,}")
-            print(f"[情報] 並列ワーカー数: {self.max_workers}")
+            if self.tuner:
+                print(f"[情報] 並列ワーカー数: {self.tuner.workers}（自動調整 {self.tuner.min_workers}〜{self.tuner.max_workers}）")
+            else:
+                print(f"[情報] 並列ワーカー数: {self.max_workers}")
 
             # メタデータを保存
             self._store_metadata(pdf.metadata)
 
+            # アウトラインを先に保存（スナップショットでもセクション絞り込みを使える）
+            self._store_sections(pdf)
+
             # バッチ処理
             cursor = self.conn.cursor()
             batch_count = 0
@@ -166,56 +211,128 @@ class UltraFastPDFDatabaseBuilder:
 
             pages_batch = []
             tables_batch = []
-            fts_batch = []
 
-            print(f"\n[処理] バッチサイズ: {self.batch_size}ページ")
+            if self.tuner:
+                print(f"\n[処理] バッチサイズ: {self.tuner.batch_size}ページ"
+                      f"（自動調整 {self.tuner.min_batch_size}〜{self.tuner.max_batch_size}）")
+            else:
+                print(f"\n[処理] バッチサイズ: {self.batch_size}ページ")
             print("=" * 70)
 
-            # ページデータを準備
-            page_data_list = [(i+1, page) for i, page in enumerate(pdf.pages)]
-
-            # 並列処理でページを処理
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                future_to_page = {executor.submit(self._process_page, page_data): page_data[0]
-                                  for page_data in page_data_list}
-
+            # ページデータを準備（優先範囲のページを先に投入）
+            page_order = prioritized_order(self.total_pages, self.priority_ranges)
+            page_data_list = [(page_num, pdf.pages[page_num - 1]) for page_num in page_order]
+            priority_pages = {page_num for start, end in self.priority_ranges
+                              for page_num in range(max(1, start), min(self.total_pages, end) + 1)}
+            priority_pending = bool(priority_pages)
+            last_checkpoint = 0
+
+            # 並列処理でページを処理（処理中のページ数をワーカー数までに抑え、自動調整で増減できるようにする）
+            executor_workers = self.tuner.max_workers if self.tuner else self.max_workers
+            with ThreadPoolExecutor(max_workers=executor_workers) as executor:
+                pending_pages = iter(page_data_list)
+                in_flight = set()
+
+                def submit_pages():
+                    while len(in_flight) < self._worker_count():
+                        page_data = next(pending_pages, None)
+                        if page_data is None:
+                            break
+                        in_flight.add(executor.submit(self._process_page, page_data))
+
+                submit_pages()
                 processed_count = 0
-                for future in as_completed(future_to_page):
-                    page_num, text, char_count, table_count, tables_json = future.result()
-
-                    total_chars += char_count
-                    total_tables += table_count
-
-                    # バッチに追加
-                    with self.lock:
-                        pages_batch.append((page_num, text, char_count, table_count))
-                        fts_batch.append((page_num, text))
-                        tables_batch.extend(tables_json)
-
-                        processed_count += 1
-
-                        # バッチコミット
-                        if processed_count % self.batch_size == 0 or processed_count == self.total_pages:
-                            batch_count += 1
-
-                            # データベースに挿入
-                            cursor.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)', pages_batch)
-                            if tables_batch:
-                                cursor.executemany('INSERT INTO tables (page_num, table_index, content) VALUES (?, ?, ?)', tables_batch)
-                            cursor.executemany('INSERT OR REPLACE INTO pages_fts (page_num, text) VALUES (?, ?)', fts_batch)
-                            self.conn.commit()
-
-                            # 進捗報告
-                            self._print_progress(processed_count, total_chars, total_tables, batch_count)
-
-                            # バッチをクリア
-                            pages_batch = []
-                            tables_batch = []
-                            fts_batch = []
+                batch_start = time.perf_counter()
+                while in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        page_num, text, char_count, table_count, tables_json = future.result()
+
+                        total_chars += char_count
+                        total_tables += table_count
+
+                        # バッチに追加
+                        with self.lock:
+                            pages_batch.append((page_num, text, char_count, table_count))
+                            tables_batch.extend(tables_json)
+
+                            processed_count += 1
+
+                            # 優先範囲を処理し終えたら、バッチ途中でもコミットしてスナップショットを公開する
+                            priority_pages.discard(page_num)
+                            priority_reached = priority_pending and not priority_pages
+
+                            # バッチコミット
+                            if (len(pages_batch) >= self._batch_size() or processed_count == self.total_pages
+                                    or priority_reached):
+                                batch_count += 1
+
+                                # データベースに挿入
+                                commit_start = time.perf_counter()
+                                cursor.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)', pages_batch)
+                                if tables_batch:
+                                    cursor.executemany('INSERT INTO tables (page_num, table_index, content) VALUES (?, ?, ?)', tables_batch)
+                                self.conn.commit()
+                                pdf.flush()
+                                commit_end = time.perf_counter()
+                                self.metrics.observe('batch_commit_seconds', commit_end - commit_start)
+
+                                # 進捗報告
+                                self._print_progress(processed_count, total_chars, total_tables, batch_count)
+
+                                # 処理速度とコミット時間から次のバッチの設定を調整
+                                if self.tuner:
+                                    self._tune(len(pages_batch), commit_end - batch_start, commit_end - commit_start)
+
+                                # バッチをクリア
+                                pages_batch = []
+                                tables_batch = []
+
+                                # チェックポイント（最後のバッチは通常の完了処理で公開する）
+                                checkpoint_due = (self.checkpoint_pages > 0 and
+                                                  processed_count - last_checkpoint >= self.checkpoint_pages)
+                                if (priority_reached or checkpoint_due) and processed_count < self.total_pages:
+                                    self.publish_checkpoint()
+                                    last_checkpoint = processed_count
+                                if priority_reached:
+                                    priority_pending = False
+                                batch_start = time.perf_counter()
+
+                    submit_pages()
+
+            if self.tuner:
+                self._store_tuning()
+            cursor.execute("INSERT OR REPLACE INTO metadata VALUES ('build_status', 'complete')")
+            self.conn.commit()
 
             print("=" * 70)
             print(f"\n[完了] {self.total_pages:,}ページ、{total_tables:,}個のテーブルを保存しました")
             print(f"[完了] 総文字数: {total_chars:,}")
+            print(f"[完了] {pdf.cache_summary()}")
+
+    def _worker_count(self) -> int:
+        """同時に処理するページ数（自動調整時は調整中のワーカー数）"""
+        return self.tuner.workers if self.tuner else self.max_workers
+
+    def _batch_size(self) -> int:
+        """コミットするページ数（自動調整時は調整中のバッチサイズ）"""
+        return self.tuner.batch_size if self.tuner else self.batch_size
+
+    def _tune(self, pages: int, seconds: float, commit_seconds: float):
+        """1バッチ分の処理速度とコミット時間を自動調整に渡し、変更があれば表示・記録"""
+        for change in self.tuner.observe(pages, seconds, commit_seconds):
+            print(f"[調整] {change}")
+            self.metrics.event('tuning', change=change, **self.tuner.settings())
+        self.metrics.set_gauge('batch_size', self.tuner.batch_size)
+        self.metrics.set_gauge('workers', self.tuner.workers)
+
+    def _store_tuning(self):
+        """選んだバッチサイズ・ワーカー数を metadata に保存（次回の構築の初期値になる）"""
+        settings = self.tuner.settings()
+        self.conn.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?)', self.tuner.metadata_items(self.pdf_path))
+        self.conn.commit()
+        print(f"[OK] 自動調整の結果を保存しました: バッチサイズ {settings['batch_size']}、"
+              f"ワーカー数 {settings['workers']}（{settings['pages_per_sec']}ページ/秒、調整{settings['adjustments']}回）")
 
     def _store_metadata(self, metadata: Dict[str, Any]):
         """メタデータを保存"""
@@ -223,10 +340,37 @@ class UltraFastPDFDatabaseBuilder:
         metadata_items = [(k, str(v)) for k, v in metadata.items()]
         metadata_items.append(('build_time', datetime.now().isoformat()))
         metadata_items.append(('builder_version', 'ultra_fast_v1.0'))
+        metadata_items.append(('pages_total', str(self.total_pages)))
+        metadata_items.append(('build_status', 'building'))
         cursor.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?)', metadata_items)
         self.conn.commit()
         print(f"[OK] {len(metadata_items)}個のメタデータを保存しました")
 
+    def _store_sections(self, pdf):
+        """PDFのアウトラインをsectionsテーブルに保存"""
+        sections = pdf.outline
+        self.conn.executemany('INSERT INTO sections (level, title, page_num) VALUES (?, ?, ?)', sections)
+        self.conn.commit()
+        print(f"[OK] アウトラインから{len(sections)}個のセクションを保存しました")
+
+    def publish_checkpoint(self):
+        """
+        ここまでに保存したページで検索可能なスナップショットを公開
+
+        完了済みのDBが公開中の場合（再構築）は、replace_complete を指定しない限り公開しない。
+        """
+        if not self.replace_complete and complete_database_live(self.db_path):
+            if not self._checkpoint_skipped:
+                print("[情報] 完了済みのDBが公開中のため、スナップショットは公開しません（完了時に差し替えます）")
+                self._checkpoint_skipped = True
+            return
+        with self.metrics.stage('checkpoint'):
+            result = publish_snapshot(self.conn, self.db_path)
+        self.metrics.incr('checkpoints')
+        self.metrics.incr('publish_retries', result['retries'])
+        print(f"[公開] スナップショットを公開しました: {result['pages']:,}/{result['pages_total']:,}ページ"
+              f" → {self.db_path}")
+
     def _print_progress(self, current_page: int, total_chars: int, total_tables: int, batch_count: int):
         """進捗状況を表示"""
         elapsed = time.time() - self.start_time
@@ -240,6 +384,9 @@ class UltraFastPDFDatabaseBuilder:
         print(f"       文字数: {total_chars:,} | テーブル: {total_tables:,}")
         print()
 
+        self.metrics.event('progress', pages=current_page, pages_total=self.total_pages, batch=batch_count,
+                           chars=total_chars, tables=total_tables, pages_per_sec=round(pages_per_sec, 2))
+
     def _format_time(self, seconds: float) -> str:
         """秒を読みやすい形式に変換"""
         if seconds < 60:
@@ -284,7 +431,7 @@ class UltraFastPDFDatabaseBuilder:
 
         # ファイルサイズ
         import os
-        db_size = os.path.getsize(self.db_path)
+        db_size = os.path.getsize(self.build_path)
         print(f"DBファイルサイズ: {db_size:,} bytes ({db_size/1024/1024:.2f} MB)")
         print(f"{'='*70}")
 
@@ -297,28 +444,58 @@ class UltraFastPDFDatabaseBuilder:
         print("=" * 70)
         print(f"開始時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
 
-        # 既存のDBを削除
-        db_file = Path(self.db_path)
-        if db_file.exists():
-            db_file.unlink()
-            print(f"[削除] 既存のデータベースを削除しました")
+        # 一時ファイルに構築する（公開中のDBは差し替えまでそのまま検索できる）
+        discard_staging(self.build_path)
+        print(f"[作成] 一時ファイルに構築します: {self.build_path}")
 
         # データベース接続と設定
         self.setup_database()
 
+        status = 'failed'
         try:
             # スキーマ作成
-            self.create_schema()
+            with self.metrics.stage('schema'):
+                self.create_schema()
 
             # データ抽出と保存（並列処理）
-            self.extract_and_store_parallel()
+            with self.metrics.stage('extract'):
+                self.extract_and_store_parallel()
+
+            # 全文検索インデックス作成（ヘッダ/フッタ除去）
+            with self.metrics.stage('fts_index'):
+                self.create_fts_index()
+
+            # ページ単位のチェックサム
+            with self.metrics.stage('checksums'):
+                self.store_checksums()
 
             # インデックス作成
-            self.create_indexes()
+            with self.metrics.stage('indexes'):
+                self.create_indexes()
+
+            # 類似ページ索引作成
+            with self.metrics.stage('similarity_index'):
+                self.create_similarity_index()
+
+            # 本文・テーブルの圧縮（オプション）
+            if self.compress:
+                with self.metrics.stage('compress'):
+                    self.compress_text_storage()
 
             # 統計情報を表示
             self.print_statistics()
 
+            # 公開用の読み取り最適化
+            if self.finalize:
+                with self.metrics.stage('finalize'):
+                    self.finalize_for_publish()
+
+            # 検証して公開中のDBと差し替え
+            with self.metrics.stage('publish'):
+                self.publish()
+            status = 'complete'
+            self.metrics.print_report()
+
             # 完了
             elapsed = time.time() - self.start_time
             print(f"\n[完了] データベース構築完了！")
@@ -327,8 +504,10 @@ class UltraFastPDFDatabaseBuilder:
 
         except KeyboardInterrupt:
             print("\n\n[中断] ユーザーによって中断されました")
-            self.conn.commit()
-            print("[保存] 処理済みデータを保存しました")
+            status = 'interrupted'
+            if self.conn:  # publish() の後は接続を閉じている
+                self.conn.commit()
+                print(f"[保存] 処理済みデータを一時ファイルに保存しました（公開はしていません）: {self.build_path}")
         except Exception as e:
             print(f"\n[エラー] {e}")
             import traceback
@@ -337,10 +516,46 @@ class UltraFastPDFDatabaseBuilder:
         finally:
             if self.conn:
                 self.conn.close()
+            self.metrics.close(status)
 
 def main():
-    """メイン関数"""
-    builder = UltraFastPDFDatabaseBuilder(PDF_PATH, DB_PATH, BATCH_SIZE, MAX_WORKERS)
+    """
+    メイン関数
+
+    使い方:
+        python pdf_to_db_ultra_fast.py [--priority 1-40,120-180] [--checkpoint ページ数] [--replace-complete]
+    """
+    priority_ranges, checkpoint_pages, replace_complete = PRIORITY_RANGES, CHECKPOINT_PAGES, REPLACE_COMPLETE
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        if args[i] == '--priority' and i + 1 < len(args):
+            priority_ranges = parse_page_ranges(args[i + 1])
+            i += 1
+        elif args[i] == '--checkpoint' and i + 1 < len(args):
+            checkpoint_pages = int(args[i + 1])
+            i += 1
+        elif args[i] == '--replace-complete':
+            replace_complete = True
+        else:
+            print(f"不明な引数: {args[i]}")
+            sys.exit(2)
+        i += 1
+
+    batch_size, max_workers = BATCH_SIZE, MAX_WORKERS
+    if ADAPTIVE_TUNING:
+        # 同じPDFの前回の構築で選んだ値から始める
+        tuned = load_tuned_settings(DB_PATH, PDF_PATH)
+        if tuned:
+            batch_size, max_workers = tuned['batch_size'], tuned['workers']
+            print(f"[情報] 前回の自動調整の結果から開始します: バッチサイズ {batch_size}、ワーカー数 {max_workers}"
+                  f"（{tuned['pages_per_sec']}ページ/秒）")
+
+    metrics = create_build_metrics(Path(DB_PATH).stem, METRICS_JSONL_PATH, METRICS_PROMETHEUS_PATH)
+    builder = UltraFastPDFDatabaseBuilder(PDF_PATH, DB_PATH, batch_size, max_workers, compress=COMPRESS_STORAGE, finalize=FINALIZE,
+                                          priority_ranges=priority_ranges, checkpoint_pages=checkpoint_pages,
+                                          cache_dir=EXTRACTION_CACHE_DIR, metrics=metrics, adaptive=ADAPTIVE_TUNING,
+                                          replace_complete=replace_complete)
     builder.build()
 
 if __name__ == "__main__":
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+段階的な構築（プログレッシブビルド）
+PDFアウトラインの読み込み、優先ページ範囲からの処理順の決定、
+構築途中のスナップショット公開（チェックポイント）
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from pdfminer.pdftypes import resolve1
+from pdfminer.psparser import PSLiteral
+
+from db_publish import publish_database, remove_sidecar_files
+from ingest_pipeline import IngestPipeline
+from page_checksums import store_page_checksums
+
+try:
+    from similarity_index import build_similarity_index
+except ImportError:  # NumPyが無い環境では類似ページ索引を作成しない
+    build_similarity_index = None
+
+# スナップショット用一時ファイル名に付ける印（x.db → x.snapshot.db）
+SNAPSHOT_MARK = '.snapshot'
+
+
+def read_outline(pdf) -> List[Tuple[int, str, int]]:
+    """
+    PDFのアウトライン（しおり）を読み込む
+
+    Args:
+        pdf: pdfplumber.PDF
+
+    Returns:
+        (レベル, タイトル, ページ番号) のリスト（ページを特定できない項目は除く）
+    """
+    page_of = {page.page_obj.pageid: page.page_number for page in pdf.pages}
+    try:
+        outlines = list(pdf.doc.get_outlines())
+    except Exception:  # PDFNoOutlines など
+        return []
+
+    sections = []
+    for level, title, dest, action, _ in outlines:
+        page_num = _resolve_dest_page(pdf.doc, dest, action, page_of)
+        if page_num is not None:
+            sections.append((level, str(title).strip(), page_num))
+    return sections
+
+
+def _resolve_dest_page(doc, dest, action, page_of: Dict[int, int]) -> Optional[int]:
+    """アウトライン項目の移動先（直接指定・GoToアクション・名前付き）をページ番号に変換"""
+    if dest is None and action is not None:
+        action = resolve1(action)
+        dest = action.get('D') if isinstance(action, dict) else None
+
+    dest = resolve1(dest)
+    if isinstance(dest, PSLiteral):
+        dest = dest.name
+    if isinstance(dest, (str, bytes)):
+        try:
+            dest = resolve1(doc.get_dest(dest))
+        except Exception:
+            return None
+    if isinstance(dest, dict):
+        dest = resolve1(dest.get('D'))
+
+    if isinstance(dest, list) and dest:
+        return page_of.get(getattr(dest[0], 'objid', None))
+    return None
+
+
+def parse_page_ranges(spec: str) -> List[Tuple[int, int]]:
+    """'1-40,120-180,200' 形式の文字列をページ範囲のリストに変換"""
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        ranges.append((int(start), int(end or start)))
+    return ranges
+
+
+def prioritized_order(total_pages: int, priority_ranges: Iterable[Tuple[int, int]]) -> List[int]:
+    """
+    処理するページ番号の順序を返す
+
+    優先範囲のページを指定順に先頭へ、残りをページ順に後ろへ並べる。
+
+    Args:
+        total_pages: 総ページ数
+        priority_ranges: (開始, 終了) の優先ページ範囲（両端を含む）
+
+    Returns:
+        1始まりのページ番号のリスト（各ページ1回ずつ）
+    """
+    order = []
+    seen = set()
+    for start, end in priority_ranges:
+        for page_num in range(max(1, start), min(total_pages, end) + 1):
+            if page_num not in seen:
+                seen.add(page_num)
+                order.append(page_num)
+    order.extend(page_num for page_num in range(1, total_pages + 1) if page_num not in seen)
+    return order
+
+
+def coverage_ranges(page_nums: Iterable[int]) -> List[Tuple[int, int]]:
+    """ソート済みのページ番号を連続範囲 [(開始, 終了), ...] にまとめる"""
+    ranges = []
+    for page_num in page_nums:
+        if ranges and page_num == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], page_num)
+        else:
+            ranges.append((page_num, page_num))
+    return ranges
+
+
+def complete_database_live(db_path: Union[str, Path]) -> bool:
+    """
+    公開先に構築の完了したDBがあるか（build_status の無い旧DBも完了とみなす）
+
+    構築途中のスナップショットでこれを置き換えると、再構築の間は検索できるページが減ってしまう。
+    """
+    db_path = Path(db_path)
+    if not db_path.exists():
+        return False
+    try:
+        conn = sqlite3.connect(f"{db_path.resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT value FROM metadata WHERE key = 'build_status'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False  # 読めないDBは置き換えてよい
+    return row is None or row[0] == 'complete'
+
+
+def snapshot_path_for(db_path: Union[str, Path]) -> Path:
+    """スナップショット用の一時ファイルパスを返す"""
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}{SNAPSHOT_MARK}{db_path.suffix}")
+
+
+def publish_snapshot(conn: sqlite3.Connection, db_path: Union[str, Path]) -> Dict[str, int]:
+    """
+    構築途中のDBから検索可能なスナップショットを作成して公開
+
+    構築中の接続からVACUUM INTOで一貫したコピーを取り、コピー側で
+    全文検索インデックス（その時点のページでヘッダ/フッタを学習）・ページチェックサムと
+    類似ページ索引を作成してから、publish_database で差し替える（公開前の検証でチェックサムを照合する）。
+    構築中のDB自体には手を加えない。
+    公開先に完了したDBがあるかは確認しないため、呼び出し側で complete_database_live を見ること。
+
+    Args:
+        conn: 構築中の接続（コミット済みのページがスナップショットに入る）
+        db_path: 公開先のDBファイルパス
+
+    Returns:
+        {'pages', 'pages_total', 'retries'} の辞書（retries は置き換えの再試行回数）
+    """
+    snapshot_path = snapshot_path_for(db_path)
+    if snapshot_path.exists():
+        snapshot_path.unlink()
+    remove_sidecar_files(snapshot_path)
+
+    conn.execute('VACUUM INTO ?', (str(snapshot_path),))
+
+    snapshot = sqlite3.connect(snapshot_path)
+    try:
+        page_count = snapshot.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+        row = snapshot.execute("SELECT value FROM metadata WHERE key = 'pages_total'").fetchone()
+        snapshot.execute("INSERT OR REPLACE INTO metadata VALUES ('build_status', 'partial')")
+        snapshot.commit()
+
+        IngestPipeline().index(snapshot)
+        store_page_checksums(snapshot)
+        if build_similarity_index is not None:
+            build_similarity_index(snapshot, snapshot_path)
+    finally:
+        snapshot.close()
+
+    retries = publish_database(snapshot_path, db_path)
+    return {'pages': page_count, 'pages_total': int(row[0]) if row else page_count, 'retries': retries}
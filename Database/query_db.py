@@ -6,51 +6,161 @@ RH850ハードウェアマニュアルデータベース検索ツール
 """
 
 import sqlite3
-import json
-import time
 import sys
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Iterable, Iterator
+
+from db_publish import GenerationWatcher, connect_immutable, read_generation
+from ingest_pipeline import normalize_query, parse_reference
+from page_store import LazyTables, TextCodec, iter_pages, page_filter_sql
+from query_stats import QueryStats, instrumented, measure
 
 DB_PATH = r"c:/Users/baoma/TRD/RH850F1KMS1_Board.db"
 
-class ManualDatabase:
-    """マニュアルデータベース検索クラス"""
+# 低速クエリとみなす時間（秒）
+SLOW_QUERY_THRESHOLD = 0.1
 
-    def __init__(self, db_path: str):
-        self.db_path = db_path
-        self.conn = sqlite3.connect(db_path)
-        self.conn.row_factory = sqlite3.Row
+# 低速クエリを1行1JSONで追記するファイル（Noneで無効）
+SLOW_QUERY_LOG_PATH = None
 
-    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """全文検索を実行"""
-        start_time = time.time()
+# 終了時に検索の計測値をJSONで書き出すファイル（Noneで無効）
+QUERY_STATS_PATH = None
 
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT
-                p.page_num,
-                p.char_count,
-                snippet(pages_fts, 1, '【', '】', '...', 30) as snippet,
-                rank
-            FROM pages_fts
-            JOIN pages p ON pages_fts.page_num = p.page_num
-            WHERE pages_fts MATCH ?
-            ORDER BY rank
-            LIMIT ?
-        ''', (query, limit))
-
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                'page_num': row['page_num'],
-                'char_count': row['char_count'],
-                'snippet': row['snippet'],
-                'rank': row['rank']
-            })
-
-        elapsed = time.time() - start_time
-        return results, elapsed
+class ManualDatabase:
+    """マニュアルデータベース検索クラス（単一PDFのDB用。コーパスDBは query_helper.QueryHelper を使う）"""
 
+    def __init__(self, db_path: str, immutable: bool = False, stats: QueryStats = None):
+        """stats を渡すと検索を計測する（Noneなら計測しない）"""
+        self.db_path = db_path
+        self.immutable = immutable
+        self.stats = stats
+        self._watcher = GenerationWatcher(db_path)
+        self._connect()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """接続（再構築でDBファイルが差し替えられていれば開き直す）"""
+        if self._watcher.changed():
+            self._connect()
+            print(f"[更新] 再構築されたデータベースを開き直しました（build_time: {self.generation}）")
+        return self._conn
+
+    def _connect(self):
+        """データベースに接続（finalize済みの不変ファイルは immutable=1 で開く）"""
+        self._watcher.reset()
+        conn = connect_immutable(self.db_path) if self.immutable else sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        schema = conn.execute("SELECT value FROM metadata WHERE key = 'schema'").fetchone()
+        if schema is not None and schema[0] == 'corpus':
+            # コーパスDBはページを (doc_id, page_num) で持つため、page_num だけで引くこのクラスでは扱えない
+            conn.close()
+            raise RuntimeError("コーパスDBは query_helper.QueryHelper で検索してください（ManualDatabase は単一PDFのDB専用です）")
+        if self.stats is not None:
+            self.stats.attach(conn)
+        self.codec = TextCodec.from_connection(conn)
+        self.generation = read_generation(conn)
+        self._conn = conn
+
+    def search(self, query: str, limit: int = 10, **filters) -> Tuple[List[Dict[str, Any]], float]:
+        """全文検索を実行（filtersは page_store.page_filter_sql の構造化フィルタ）。(結果, 所要秒数) を返す"""
+        with measure(self.stats, 'search', self.db_path) as call:
+            cursor = self.conn.cursor()
+            query = normalize_query(query)
+            filter_sql, filter_params = page_filter_sql('pages_fts.page_num', **filters)
+            cursor.execute(f'''
+                SELECT
+                    p.page_num,
+                    p.char_count,
+                    snippet(pages_fts, 1, '【', '】', '...', 30) as snippet,
+                    rank
+                FROM pages_fts
+                JOIN pages p ON pages_fts.page_num = p.page_num
+                WHERE pages_fts MATCH ?{filter_sql}
+                ORDER BY rank
+                LIMIT ?
+            ''', (query, *filter_params, limit))
+
+            results = []
+            for row in cursor.fetchall():
+                results.append({
+                    'page_num': row['page_num'],
+                    'char_count': row['char_count'],
+                    'snippet': row['snippet'],
+                    'rank': row['rank']
+                })
+            call.rows = len(results)
+
+        return results, call.elapsed
+
+    def search_chunks(self, query: str, limit: int = 10, **filters) -> Tuple[List[Dict[str, Any]], float]:
+        """段落チャンク検索（chunks_fts、ヒットした段落を【】で強調）。(結果, 所要秒数) を返す"""
+        with measure(self.stats, 'search_chunks', self.db_path) as call:
+            has_chunks = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone()
+            if not has_chunks:
+                raise RuntimeError("このデータベースには段落チャンク索引(chunks_fts)がありません。再構築してください")
+            query = normalize_query(query)
+            filter_sql, filter_params = page_filter_sql('chunks_fts.page_num', **filters)
+            rows = self.conn.execute(f'''
+                SELECT page_num, chunk_index, start_offset, end_offset,
+                       highlight(chunks_fts, 4, '【', '】') AS text, rank
+                FROM chunks_fts
+                WHERE chunks_fts MATCH ?{filter_sql}
+                ORDER BY rank
+                LIMIT ?
+            ''', (query, *filter_params, limit)).fetchall()
+            results = [dict(row) for row in rows]
+            call.rows = len(results)
+
+        return results, call.elapsed
+
+    def _reference_key(self, reference: str) -> Tuple[str, str]:
+        """参照の指定（"Table 5-1" など）を (種類, ラベル) に変換"""
+        if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'xrefs'").fetchone():
+            raise RuntimeError("このデータベースには相互参照の索引(xrefs)がありません。再構築してください")
+        key = parse_reference(reference)
+        if key is None:
+            raise ValueError(f"参照を解釈できません: {reference}（例: Table 5-1, Section 3.2, 図2.4）")
+        return key
+
+    @instrumented
+    def resolve_reference(self, reference: str) -> Dict[str, Any]:
+        """参照先（見出し・図表キャプション）の最初のページを取得。見つからなければNone"""
+        kind, label = self._reference_key(reference)
+        row = self.conn.execute('''
+            SELECT kind, label, page_num, title FROM xref_targets
+            WHERE kind = ? AND label = ?
+            ORDER BY page_num
+            LIMIT 1
+        ''', (kind, label)).fetchone()
+        return dict(row) if row else None
+
+    @instrumented
+    def find_references(self, reference: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """参照元（その見出し・図表を参照している箇所）をページ順に取得"""
+        kind, label = self._reference_key(reference)
+        rows = self.conn.execute('''
+            SELECT page_num, start_offset, text FROM xrefs
+            WHERE kind = ? AND label = ?
+            ORDER BY page_num, start_offset
+            LIMIT ?
+        ''', (kind, label, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    @instrumented
+    def get_page_references(self, page_num: int) -> List[Dict[str, Any]]:
+        """ページ内の参照と、それぞれの参照先のページを取得"""
+        if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'xrefs'").fetchone():
+            raise RuntimeError("このデータベースには相互参照の索引(xrefs)がありません。再構築してください")
+        rows = self.conn.execute('''
+            SELECT x.start_offset, x.text,
+                   (SELECT MIN(t.page_num) FROM xref_targets t
+                    WHERE t.kind = x.kind AND t.label = x.label) AS target_page
+            FROM xrefs x
+            WHERE x.page_num = ?
+            ORDER BY x.start_offset
+        ''', (page_num,)).fetchall()
+        return [dict(row) for row in rows]
+
+    @instrumented
     def get_page(self, page_num: int) -> Dict[str, Any]:
         """特定のページの内容を取得"""
         cursor = self.conn.cursor()
@@ -66,23 +176,43 @@ class ManualDatabase:
         for table_row in cursor.fetchall():
             tables.append({
                 'index': table_row['table_index'],
-                'content': json.loads(table_row['content'])
+                'content': self.codec.decode_json(table_row['content'])
             })
 
         return {
             'page_num': row['page_num'],
-            'text': row['text'],
+            'text': self.codec.decode(row['text']),
             'char_count': row['char_count'],
             'table_count': row['table_count'],
             'tables': tables
         }
 
+    def get_pages(self, page_nums: Iterable[int]) -> Iterator[Dict[str, Any]]:
+        """複数ページの内容をまとめて取得（ストリーミング、テーブルは遅延デコード）"""
+        for row, table_rows in iter_pages(self.conn, page_nums):
+            yield {
+                'page_num': row['page_num'],
+                'text': self.codec.decode(row['text']),
+                'char_count': row['char_count'],
+                'table_count': row['table_count'],
+                'tables': LazyTables(table_rows, self._decode_table_row)
+            }
+
+    def _decode_table_row(self, table_row) -> Dict[str, Any]:
+        """テーブル行を get_page と同じ形式の辞書にデコード"""
+        return {
+            'index': table_row['table_index'],
+            'content': self.codec.decode_json(table_row['content'])
+        }
+
+    @instrumented
     def get_metadata(self) -> Dict[str, str]:
         """メタデータを取得"""
         cursor = self.conn.cursor()
         cursor.execute('SELECT * FROM metadata')
         return {row['key']: row['value'] for row in cursor.fetchall()}
 
+    @instrumented
     def get_statistics(self) -> Dict[str, Any]:
         """データベース統計情報を取得"""
         cursor = self.conn.cursor()
@@ -97,8 +227,8 @@ class ManualDatabase:
 
     def close(self):
         """データベース接続を閉じる"""
-        if self.conn:
-            self.conn.close()
+        if self._conn:
+            self._conn.close()
 
 def print_search_results(results: List[Dict], elapsed: float):
     """検索結果を表示"""
@@ -111,6 +241,19 @@ def print_search_results(results: List[Dict], elapsed: float):
 
     print("\n" + "=" * 80)
 
+def print_chunk_results(results: List[Dict], elapsed: float):
+    """段落チャンクの検索結果を表示"""
+    print(f"\n検索結果: {len(results)}段落 (検索時間: {elapsed*1000:.2f}ms)\n")
+    print("=" * 80)
+
+    for i, result in enumerate(results, 1):
+        print(f"\n[{i}] ページ {result['page_num']} 段落 {result['chunk_index'] + 1} "
+              f"(位置: {result['start_offset']}-{result['end_offset']}, スコア: {result['rank']:.4f})")
+        for line in result['text'].splitlines():
+            print(f"    {line}")
+
+    print("\n" + "=" * 80)
+
 def print_page_content(page_data: Dict):
     """ページ内容を表示"""
     if not page_data:
@@ -150,9 +293,15 @@ def interactive_mode(db: ManualDatabase):
     print("="*80)
     print("\nコマンド:")
     print("  search <キーワード>  : 全文検索")
+    print("  chunks <キーワード>  : 段落単位の検索（ヒットした段落とページ内の位置）")
     print("  page <番号>         : ページ内容を表示")
+    print("  pages <開始>-<終了>  : ページ範囲の内容を表示")
+    print("  goto <参照>         : 参照先（例: Table 5-1, Section 3.2, 図2.4）のページを表示")
+    print("  xref <参照>         : その見出し・図表を参照している箇所を表示")
+    print("  refs <番号>         : ページ内の参照と参照先のページを表示")
     print("  stats               : 統計情報を表示")
     print("  meta                : メタデータを表示")
+    print("  qstats              : 検索の計測（応答時間・全件走査・低速クエリ）を表示")
     print("  quit                : 終了")
     print()
 
@@ -177,6 +326,13 @@ def interactive_mode(db: ManualDatabase):
                 results, elapsed = db.search(query)
                 print_search_results(results, elapsed)
 
+            elif command == "chunks":
+                if len(parts) < 2:
+                    print("使用法: chunks <キーワード>")
+                    continue
+                results, elapsed = db.search_chunks(parts[1])
+                print_chunk_results(results, elapsed)
+
             elif command == "page":
                 if len(parts) < 2:
                     print("使用法: page <番号>")
@@ -188,6 +344,55 @@ def interactive_mode(db: ManualDatabase):
                 except ValueError:
                     print("エラー: ページ番号は数値で指定してください")
 
+            elif command == "pages":
+                if len(parts) < 2:
+                    print("使用法: pages <開始>-<終了>")
+                    continue
+                try:
+                    start, _, end = parts[1].partition("-")
+                    page_range = range(int(start), int(end or start) + 1)
+                    for page_data in db.get_pages(page_range):
+                        print_page_content(page_data)
+                except ValueError:
+                    print("エラー: ページ範囲は <開始>-<終了> の数値で指定してください")
+
+            elif command == "goto":
+                if len(parts) < 2:
+                    print("使用法: goto <参照>（例: goto Table 5-1）")
+                    continue
+                target = db.resolve_reference(parts[1])
+                if target is None:
+                    print(f"参照先が見つかりません: {parts[1]}")
+                    continue
+                print(f"\n→ {target['title']}（ページ {target['page_num']}）")
+                print_page_content(db.get_page(target['page_num']))
+
+            elif command == "xref":
+                if len(parts) < 2:
+                    print("使用法: xref <参照>（例: xref Section 3.2）")
+                    continue
+                references = db.find_references(parts[1])
+                target = db.resolve_reference(parts[1])
+                where = f"ページ {target['page_num']}" if target else "参照先なし"
+                print(f"\n{parts[1]}（{where}）を参照している箇所: {len(references)}件")
+                for reference in references:
+                    print(f"  ページ {reference['page_num']} (位置: {reference['start_offset']}): {reference['text']}")
+
+            elif command == "refs":
+                if len(parts) < 2:
+                    print("使用法: refs <番号>")
+                    continue
+                try:
+                    page_num = int(parts[1])
+                except ValueError:
+                    print("エラー: ページ番号は数値で指定してください")
+                    continue
+                references = db.get_page_references(page_num)
+                print(f"\nページ {page_num} の参照: {len(references)}件")
+                for reference in references:
+                    target = f"ページ {reference['target_page']}" if reference['target_page'] else "参照先なし"
+                    print(f"  {reference['text']} → {target} (位置: {reference['start_offset']})")
+
             elif command == "stats":
                 stats = db.get_statistics()
                 print(f"\n--- データベース統計 ---")
@@ -202,6 +407,15 @@ def interactive_mode(db: ManualDatabase):
                 for key, value in sorted(metadata.items()):
                     print(f"{key}: {value}")
 
+            elif command == "qstats":
+                db.stats.print_report()
+                for entry in list(db.stats.slow_queries)[-3:]:
+                    print(f"\n--- 低速クエリ: {entry['method']} {entry['seconds'] * 1000:.1f}ms ---")
+                    for statement in entry['statements']:
+                        print(f"{statement['seconds'] * 1000:.1f}ms: {' '.join(statement['sql'].split())[:200]}")
+                        for detail in statement['plan'] or []:
+                            print(f"  {detail}")
+
             else:
                 print(f"不明なコマンド: {command}")
 
@@ -237,6 +451,7 @@ def benchmark_mode(db: ManualDatabase):
     avg_time = total_time / len(test_queries)
     print(f"\n平均検索時間: {avg_time*1000:.2f}ms")
     print(f"総検索時間: {total_time*1000:.2f}ms")
+    db.stats.print_report()
 
 def main():
     """メイン関数"""
@@ -246,13 +461,17 @@ def main():
         mode = "interactive"
 
     try:
-        db = ManualDatabase(DB_PATH)
+        db = ManualDatabase(DB_PATH, stats=QueryStats(SLOW_QUERY_THRESHOLD, SLOW_QUERY_LOG_PATH))
 
         if mode == "benchmark":
             benchmark_mode(db)
         else:
             interactive_mode(db)
 
+        if QUERY_STATS_PATH:
+            db.stats.dump(QUERY_STATS_PATH)
+            print(f"[OK] 検索の計測値を保存しました: {QUERY_STATS_PATH}")
+
         db.close()
         print("\n終了しました。")
 
@@ -7,38 +7,120 @@
 
 import sqlite3
 import re
-from typing import List, Dict, Any, Tuple, Optional
+import heapq
+import time
+from typing import List, Dict, Any, Tuple, Optional, Iterable, Iterator
 from pathlib import Path
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait
 import json
 
+from db_publish import GenerationWatcher, connect_immutable, read_generation
+from exporters import (EXPORT_CHUNK_SIZE, EXPORT_WORKERS, export_jsonl, export_sections_markdown,
+                       export_tables_csv, page_markdown)
+from ingest_pipeline import normalize_query, normalize_identifier, is_compound_identifier, parse_reference
+from page_store import LazyTables, TextCodec, iter_pages, json_default, page_filter_sql
+from progressive_build import coverage_ranges
+from query_stats import QueryStats, instrumented
+
 # デフォルトDBパスを修正（Databaseフォルダ内）
 DB_PATH = r"c:/Users/baoma/TRD/Database/RH850_FlashMemory_IF_Fast.db"
 
+# 複数DBの横断検索の既定タイムアウト（秒）
+FEDERATED_TIMEOUT = 5.0
+
+@lru_cache(maxsize=256)
+def _compile_query_pattern(query: str) -> re.Pattern:
+    """検索語（正規化後）をリテラルとして扱う大文字小文字無視のパターンを返す（キャッシュ付き）"""
+    return re.compile(re.escape(normalize_query(query)), re.IGNORECASE)
+
+
 class QueryHelper:
     """データベースクエリヘルパークラス"""
 
-    def __init__(self, db_path: str = DB_PATH):
+    def __init__(self, db_path: str = DB_PATH, immutable: bool = False, stats: Optional[QueryStats] = None):
+        """
+        Args:
+            db_path: データベースファイルパス
+            immutable: finalize済みの不変ファイルとして immutable=1 で開く（ロックなしで最速）
+            stats: 検索の計測先（複数のヘルパーで共有可。Noneなら計測しない）
+        """
         self.db_path = db_path
-        self.conn = None
+        self.immutable = immutable
+        self.stats = stats
+        self.generation = None  # 開いているDBのbuild_time
+        self._conn = None
+        self._similarity_index = None
+        self._watcher = GenerationWatcher(db_path)
         self._connect()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """接続（再構築でDBファイルが差し替えられていれば新しい世代を開き直す）"""
+        if self._watcher.changed():
+            self.reload()
+        return self._conn
+
     def _connect(self):
         """データベースに接続"""
         if not Path(self.db_path).exists():
             raise FileNotFoundError(f"データベースが見つかりません: {self.db_path}")
 
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = sqlite3.Row  # 辞書形式で結果を取得
+        self._watcher.reset()
+        if self.immutable:
+            conn = connect_immutable(self.db_path)
+        else:
+            conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row  # 辞書形式で結果を取得
+        if self.stats is not None:
+            self.stats.attach(conn)
 
         # 読み取り専用最適化
-        cursor = self.conn.cursor()
+        cursor = conn.cursor()
         cursor.execute('PRAGMA query_only=ON')
         cursor.execute('PRAGMA cache_size=-64000')  # 64MB
 
+        # 圧縮格納されたDBの本文・テーブルを透過的に展開（SQL関数 decode_text も登録）
+        self.codec = TextCodec.from_connection(conn)
+        self.codec.register(conn)
+        self._conn = conn
+        self.generation = read_generation(conn)
+
+        # 近似重複ページのリンクと識別子索引（新しいビルダーで作成したDBのみ）
+        self.has_duplicates = self._table_exists('page_duplicates')
+        self.has_identifiers = self._table_exists('idents_fts')
+        self.has_chunks = self._table_exists('chunks_fts')
+        self.has_xrefs = self._table_exists('xrefs')
+
+        # 複数文書を (doc_id, page_num) で持つコーパスDB（corpus_builder.py で作成）
+        row = conn.execute("SELECT value FROM metadata WHERE key = 'schema'").fetchone()
+        self.is_corpus = row is not None and row[0] == 'corpus'
+
+    def reload(self) -> bool:
+        """
+        DBを開き直して最新の世代に切り替える
+
+        旧接続は明示的に閉じず、実行中のジェネレータ（get_pages等）が
+        使い終わって参照が無くなった時点で閉じられる。
+
+        Returns:
+            世代（build_time）が変わった場合True
+        """
+        previous = self.generation
+        self._connect()
+        self._similarity_index = None
+        return self.generation != previous
+
+    def _table_exists(self, name: str) -> bool:
+        """テーブル（仮想テーブルを含む）が存在するか"""
+        sql = "SELECT 1 FROM sqlite_master WHERE name = ? AND type IN ('table', 'view')"
+        return self._conn.execute(sql, (name,)).fetchone() is not None
+
     def close(self):
         """接続を閉じる"""
-        if self.conn:
-            self.conn.close()
+        if self._conn:
+            self._conn.close()
 
     def __enter__(self):
         return self
@@ -48,70 +130,208 @@ class QueryHelper:
 
     # ========== 基本検索 ==========
 
-    def search_fts(self, query: str, limit: int = 10) -> List[Dict]:
+    @instrumented
+    def search_fts(self, query: str, limit: int = 10, collapse_duplicates: bool = True, **filters) -> List[Dict]:
         """
         FTS全文検索
 
+        クエリはインジェスト時と同じ規則（NFKC等）で正規化してから検索する。
+        フィルタはMATCHと同じ1本のSQLに組み込まれる（Python側での後処理なし）。
+        例: search_fts('FACI', has_tables=True)
+
+        近似重複ページはSQL内で代表ページごとにまとめ、最上位のページだけを返す。
+        同じグループの他のページは 'duplicates' に入る。
+
+        TAUJ0.CMOR0 や 0xFFE50000 のような複合識別子・16進リテラル1語のクエリは
+        識別子索引（search_identifier）で検索する。
+
+        コーパスDBでは search_corpus で全文書を検索する（documents= で文書を絞り込める）。
+
         Args:
             query: 検索クエリ
             limit: 結果の最大数
+            collapse_duplicates: 近似重複ページを1件にまとめる
+            **filters: 構造化フィルタ（page_range, has_tables, min_chars, max_chars, section）
+                       詳細は page_store.page_filter_sql を参照
 
         Returns:
             検索結果のリスト
         """
-        cursor = self.conn.cursor()
+        if self.is_corpus:
+            return self.search_corpus(query, limit=limit, collapse_duplicates=collapse_duplicates, **filters)
 
-        sql = '''
-            SELECT p.page_num, p.text, p.char_count, p.table_count
-            FROM pages_fts fts
-            JOIN pages p ON fts.page_num = p.page_num
-            WHERE fts.text MATCH ?
-            ORDER BY rank
+        cursor = self.conn.cursor()
+        query = normalize_query(query)
+
+        if self.has_identifiers and is_compound_identifier(query):
+            return self.search_identifier(query, limit=limit, **filters)
+
+        hits_sql, hits_params = self._hits_sql('pages_fts', 'f.text', query, filters)
+
+        if not (collapse_duplicates and self.has_duplicates):
+            sql = f'''
+                WITH hits AS ({hits_sql})
+                SELECT p.page_num, decode_text(p.text) AS text, p.char_count, p.table_count, hits.rank AS rank
+                FROM hits
+                JOIN pages p ON hits.page_num = p.page_num
+                ORDER BY rank
+                LIMIT ?
+            '''
+            results = cursor.execute(sql, (*hits_params, limit)).fetchall()
+            return [dict(row, duplicates=[]) for row in results]
+
+        # グループ内で最小rankの行のpage_numが選ばれる（SQLiteのMIN()の素の列の規則）
+        sql = f'''
+            WITH matches AS ({hits_sql}), hits AS (
+                SELECT m.page_num, m.rank,
+                       COALESCE(d.canonical_page, m.page_num) AS canonical_page
+                FROM matches m
+                LEFT JOIN page_duplicates d ON d.page_num = m.page_num
+            ), best AS (
+                SELECT page_num, canonical_page, MIN(rank) AS rank
+                FROM hits
+                GROUP BY canonical_page
+            )
+            SELECT p.page_num, decode_text(p.text) AS text, p.char_count, p.table_count,
+                   best.rank AS rank, best.canonical_page
+            FROM best
+            JOIN pages p ON best.page_num = p.page_num
+            ORDER BY best.rank
             LIMIT ?
         '''
+        rows = cursor.execute(sql, (*hits_params, limit)).fetchall()
+
+        # 各グループのメンバーを1回の集合クエリで取得
+        groups: Dict[int, List[int]] = {row['canonical_page']: [row['canonical_page']] for row in rows}
+        if groups:
+            placeholders = ','.join('?' * len(groups))
+            members_sql = f'''
+                SELECT canonical_page, page_num FROM page_duplicates
+                WHERE canonical_page IN ({placeholders})
+                ORDER BY page_num
+            '''
+            for canonical_page, page_num in cursor.execute(members_sql, list(groups)):
+                groups[canonical_page].append(page_num)
 
-        results = cursor.execute(sql, (query, limit)).fetchall()
-        return [dict(row) for row in results]
+        results = []
+        for row in rows:
+            result = dict(row)
+            canonical_page = result.pop('canonical_page')
+            result['duplicates'] = [n for n in groups[canonical_page] if n != result['page_num']]
+            results.append(result)
+        return results
 
-    def search_like(self, query: str, limit: int = 10) -> List[Dict]:
+    @instrumented
+    def search_identifier(self, name: str, prefix: bool = False, limit: int = 10, **filters) -> List[Dict]:
         """
-        LIKE検索（部分一致）
+        レジスタ名・シンボル名・16進リテラルの検索（識別子索引）
+
+        TAUJ0.CMOR0 は全体でも TAUJ0 / CMOR0 の構成要素でも、
+        0xFFE5_0000 と 0FFE50000H・FFE5 0000H は同じ値として見つかる。
+        prefix=True の場合は接頭辞検索（例: 'FLMD' → FLMDCNT）。
 
         Args:
-            query: 検索クエリ
+            name: 識別子
+            prefix: 接頭辞一致で検索する
             limit: 結果の最大数
+            **filters: 構造化フィルタ（page_range, has_tables, min_chars, max_chars, section）
+                       詳細は page_store.page_filter_sql を参照
 
         Returns:
             検索結果のリスト
         """
-        cursor = self.conn.cursor()
-
-        sql = '''
-            SELECT page_num, text, char_count, table_count
-            FROM pages
-            WHERE text LIKE ?
+        if not self.has_identifiers:
+            raise RuntimeError("このデータベースには識別子索引(idents_fts)がありません。再構築してください")
+
+        token = normalize_identifier(normalize_query(name))
+        fts_query = '"' + token.replace('"', '""') + '"' + ('*' if prefix else '')
+        hits_sql, hits_params = self._hits_sql('idents_fts', 'idents_fts', fts_query, filters)
+
+        sql = f'''
+            WITH hits AS ({hits_sql})
+            SELECT p.page_num, decode_text(p.text) AS text, p.char_count, p.table_count, hits.rank AS rank
+            FROM hits
+            JOIN pages p ON hits.page_num = p.page_num
+            ORDER BY hits.rank
             LIMIT ?
         '''
 
-        pattern = f'%{query}%'
-        results = cursor.execute(sql, (pattern, limit)).fetchall()
+        results = self.conn.execute(sql, (*hits_params, limit)).fetchall()
+        return [dict(row, duplicates=[]) for row in results]
+
+    def _hits_sql(self, table: str, match_column: str, fts_query: str, filters: Dict) -> Tuple[str, List[Any]]:
+        """
+        単一PDFのDBでフィルタ付きMATCHのヒット (page_num, rank) を返すSQLとパラメータ
+
+        代表ページと完全に一致する重複ページは索引されないため、フィルタで代表ページが
+        外れた場合は、フィルタに合う重複ページを代表ページのrankでヒットに加える。
+
+        Args:
+            table: FTSテーブル名（f として参照される）
+            match_column: MATCHの左辺（例: 'f.text'）
+            fts_query: MATCHするクエリ
+            filters: 構造化フィルタ（page_store.page_filter_sql の引数）
+        """
+        filter_sql, filter_params = page_filter_sql('f.page_num', **filters)
+        sql = f'SELECT f.page_num, f.rank AS rank FROM {table} f WHERE {match_column} MATCH ?{filter_sql}'
+        params = [fts_query, *filter_params]
+
+        if filter_sql and self.has_duplicates:
+            duplicate_sql, duplicate_params = page_filter_sql('d.page_num', **filters)
+            sql += f'''
+                UNION ALL
+                SELECT d.page_num, f.rank AS rank
+                FROM {table} f
+                JOIN page_duplicates d ON d.canonical_page = f.page_num AND d.distance = 0
+                WHERE {match_column} MATCH ?{duplicate_sql} AND NOT (1{filter_sql})
+            '''
+            params += [fts_query, *duplicate_params, *filter_params]
+        return sql, params
+
+    @instrumented
+    def search_like(self, query: str, limit: int = 10, documents: Optional[Iterable] = None,
+                    **filters) -> List[Dict]:
+        """
+        LIKE検索（部分一致）
+
+        Args:
+            query: 検索クエリ
+            limit: 結果の最大数
+            documents: コーパスDBの対象文書（doc_id または文書名、LIKEパターン可）。Noneで全文書
+            **filters: 構造化フィルタ（page_range, has_tables, min_chars, max_chars, section）
+                       詳細は page_store.page_filter_sql を参照
+
+        Returns:
+            検索結果のリスト（コーパスDBでは 'doc_id', 'document' を含む）
+        """
+        sql, params = self._page_scan_sql(documents, filters)
+        if sql is None:
+            return []
+
+        pattern = f'%{normalize_query(query)}%'
+        results = self.conn.execute(f'{sql} AND decode_text(text) LIKE ? LIMIT ?', (*params, pattern, limit)).fetchall()
         return [dict(row) for row in results]
 
-    def search_regex(self, pattern: str, limit: int = 10) -> List[Dict]:
+    @instrumented
+    def search_regex(self, pattern: str, limit: int = 10, documents: Optional[Iterable] = None,
+                     **filters) -> List[Dict]:
         """
         正規表現検索
 
         Args:
             pattern: 正規表現パターン
             limit: 結果の最大数
+            documents: コーパスDBの対象文書（doc_id または文書名、LIKEパターン可）。Noneで全文書
+            **filters: 構造化フィルタ（page_range, has_tables, min_chars, max_chars, section）
+                       詳細は page_store.page_filter_sql を参照
 
         Returns:
-            検索結果のリスト
+            検索結果のリスト（コーパスDBでは 'doc_id', 'document' を含む）
         """
-        cursor = self.conn.cursor()
-
-        sql = 'SELECT page_num, text, char_count, table_count FROM pages'
-        all_pages = cursor.execute(sql).fetchall()
+        sql, params = self._page_scan_sql(documents, filters)
+        if sql is None:
+            return []
+        all_pages = self.conn.execute(sql, params).fetchall()
 
         regex = re.compile(pattern, re.IGNORECASE)
         results = []
@@ -124,9 +344,30 @@ class QueryHelper:
 
         return results
 
+    def _page_scan_sql(self, documents: Optional[Iterable], filters: Dict) -> Tuple[Optional[str], List[Any]]:
+        """
+        pages を走査する検索（LIKE・正規表現）の "SELECT ... WHERE 1 AND ..." とパラメータ
+
+        条件は末尾に " AND ..." で追加できる。コーパスDBで documents に該当する文書が無ければNone。
+        """
+        if not self.is_corpus:
+            filter_sql, params = page_filter_sql('page_num', **filters)
+            return (f'SELECT page_num, decode_text(text) AS text, char_count, table_count '
+                    f'FROM pages WHERE 1{filter_sql}'), params
+
+        document_sql, document_params = self._document_sql('p', documents)
+        if document_sql is None:
+            return None, []
+        filter_sql, params = self._corpus_filter_sql('p.page_num', **filters)
+        return (f'SELECT p.doc_id, d.name AS document, p.page_num, decode_text(p.text) AS text, '
+                f'p.char_count, p.table_count '
+                f'FROM pages p JOIN documents d ON d.doc_id = p.doc_id '
+                f'WHERE 1{document_sql}{filter_sql}'), document_params + params
+
     # ========== コンテキスト抽出 ==========
 
-    def get_context(self, page_num: int, query: str, context_chars: int = 200) -> List[str]:
+    @instrumented
+    def get_context(self, page_num: int, query: str, context_chars: int = 200, document=None) -> List[str]:
         """
         検索語の前後のコンテキストを抽出
 
@@ -134,23 +375,41 @@ class QueryHelper:
             page_num: ページ番号
             query: 検索語
             context_chars: コンテキストの文字数
+            document: コーパスDBの文書（doc_id または文書名。コーパスDBでは必須）
 
         Returns:
             コンテキストのリスト
         """
         cursor = self.conn.cursor()
 
-        sql = 'SELECT text FROM pages WHERE page_num = ?'
-        result = cursor.execute(sql, (page_num,)).fetchone()
+        doc_id = self._page_document(document)
+        if doc_id is None:
+            sql, params = 'SELECT decode_text(text) AS text FROM pages WHERE page_num = ?', (page_num,)
+        else:
+            sql, params = 'SELECT decode_text(text) AS text FROM pages WHERE doc_id = ? AND page_num = ?', (doc_id, page_num)
+        result = cursor.execute(sql, params).fetchone()
 
         if not result:
             return []
 
-        text = result['text']
+        pattern = _compile_query_pattern(query)
+        return self._extract_contexts(result['text'], pattern, context_chars)
+
+    def _extract_contexts(self, text: str, pattern: re.Pattern, context_chars: int) -> List[str]:
+        """
+        コンパイル済みパターンでテキストからコンテキストを切り出す
+
+        Args:
+            text: ページテキスト
+            pattern: コンパイル済みの検索パターン
+            context_chars: コンテキストの文字数
+
+        Returns:
+            コンテキストのリスト
+        """
         contexts = []
 
         # クエリの出現位置を検索
-        pattern = re.compile(re.escape(query), re.IGNORECASE)
         for match in pattern.finditer(text):
             start = max(0, match.start() - context_chars)
             end = min(len(text), match.end() + context_chars)
@@ -162,74 +421,583 @@ class QueryHelper:
 
         return contexts
 
-    def search_with_context(self, query: str, limit: int = 10, context_chars: int = 150) -> List[Dict]:
+    @instrumented
+    def search_with_context(self, query: str, limit: int = 10, context_chars: int = 150, **filters) -> List[Dict]:
         """
         検索結果とコンテキストを取得
 
+        search_fts が取得済みのページテキストをそのまま使い、
+        パターンのコンパイルも1回だけ行う（ページごとの再SELECTなし）。
+
         Args:
             query: 検索クエリ
             limit: 結果の最大数
             context_chars: コンテキストの文字数
+            **filters: 構造化フィルタ（page_range, has_tables, min_chars, max_chars, section）
+                       詳細は page_store.page_filter_sql を参照
 
         Returns:
             検索結果とコンテキストのリスト
         """
-        results = self.search_fts(query, limit)
+        results = self.search_fts(query, limit, **filters)
+        pattern = _compile_query_pattern(query)
 
         for result in results:
-            contexts = self.get_context(result['page_num'], query, context_chars)
-            result['contexts'] = contexts
+            result['contexts'] = self._extract_contexts(result['text'], pattern, context_chars)
+
+        return results
+
+    @instrumented
+    def search_chunks(self, query: str, limit: int = 10, documents: Optional[Iterable] = None,
+                      **filters) -> List[Dict]:
+        """
+        段落チャンク検索（ページより細かい単位でヒットした段落を返す）
+
+        段落チャンクの索引（chunks_fts）をrank順に検索する。結果はページ全文を含まず、
+        'text' はヒットした語を ** で強調したチャンクそのものなので、コンテキストを切り出すための
+        ページの再読み込み・再走査が要らない。
+
+        Args:
+            query: 検索クエリ
+            limit: 結果の最大数
+            documents: コーパスDBの対象文書（doc_id または文書名、LIKEパターン可）。Noneで全文書
+            **filters: 構造化フィルタ（page_range, has_tables, min_chars, max_chars, section）
+
+        Returns:
+            {'page_num', 'chunk_index', 'start_offset', 'end_offset', 'text', 'rank'} のリスト
+            （オフセットはページテキスト上の文字位置。コーパスDBでは 'doc_id', 'document' を含む）
+        """
+        if not self.has_chunks:
+            raise RuntimeError("このデータベースには段落チャンク索引(chunks_fts)がありません。再構築してください")
+
+        query = normalize_query(query)
+        if not self.is_corpus:
+            filter_sql, filter_params = page_filter_sql('chunks_fts.page_num', **filters)
+            sql = f'''
+                SELECT page_num, chunk_index, start_offset, end_offset,
+                       highlight(chunks_fts, 4, '**', '**') AS text, rank
+                FROM chunks_fts
+                WHERE chunks_fts MATCH ?{filter_sql}
+                ORDER BY rank
+                LIMIT ?
+            '''
+            rows = self.conn.execute(sql, (query, *filter_params, limit)).fetchall()
+            return [dict(row) for row in rows]
+
+        fts_query = f'text : ({query})'
+        if documents is not None:
+            doc_ids = self._document_ids(documents)
+            if not doc_ids:
+                return []
+            fts_query = f"doc : ({' OR '.join(f'd{doc_id}' for doc_id in doc_ids)}) AND {fts_query}"
+
+        filter_sql, filter_params = self._corpus_filter_sql('chunks_fts.page_num', **filters)
+        join_pages = ('JOIN pages p ON p.doc_id = chunks_fts.doc_id AND p.page_num = chunks_fts.page_num'
+                      if filter_sql else '')
+        sql = f'''
+            SELECT chunks_fts.doc_id, d.name AS document, chunks_fts.page_num, chunk_index,
+                   start_offset, end_offset, highlight(chunks_fts, 6, '**', '**') AS text, rank
+            FROM chunks_fts
+            JOIN documents d ON d.doc_id = chunks_fts.doc_id
+            {join_pages}
+            WHERE chunks_fts MATCH ?{filter_sql}
+            ORDER BY rank
+            LIMIT ?
+        '''
+        rows = self.conn.execute(sql, (fts_query, *filter_params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    # ========== 相互参照 ==========
+
+    def _reference_key(self, reference: str) -> Tuple[str, str]:
+        """参照の指定（"Table 5-1" など）を (種類, ラベル) に変換"""
+        if not self.has_xrefs:
+            raise RuntimeError("このデータベースには相互参照の索引(xrefs)がありません。再構築してください")
+        key = parse_reference(reference)
+        if key is None:
+            raise ValueError(f"参照を解釈できません: {reference}（例: 'Table 5-1', 'Section 3.2', '図2.4'）")
+        return key
+
+    def _document_sql(self, alias: str, documents: Optional[Iterable]) -> Tuple[Optional[str], List[Any]]:
+        """コーパスDBの文書の絞り込み（" AND alias.doc_id IN (...)"）。対象が無ければNone"""
+        if not self.is_corpus or documents is None:
+            return '', []
+        doc_ids = self._document_ids(documents)
+        if not doc_ids:
+            return None, []
+        return f" AND {alias}.doc_id IN ({','.join('?' * len(doc_ids))})", doc_ids
+
+    @instrumented
+    def resolve_reference(self, reference: str, documents: Optional[Iterable] = None) -> Optional[Dict]:
+        """
+        参照先（見出し・図表キャプション）を取得（"jump to"）
+
+        例: resolve_reference('Table 5-1') → 表5-1のキャプションがあるページ。
+        同じラベルのキャプションが複数ページにある場合（続きの表など）は最初のページを返す。
+
+        Args:
+            reference: 参照（'Table 5-1', 'Section 3.2', 'Figure 2.4', '表5-1', '3.2節' など）
+            documents: コーパスDBの対象文書（doc_id または文書名、LIKEパターン可）。Noneで全文書
+
+        Returns:
+            {'kind', 'label', 'page_num', 'title'}（コーパスDBでは 'doc_id', 'document' を含む）、
+            見つからない場合はNone
+        """
+        kind, label = self._reference_key(reference)
+        document_sql, document_params = self._document_sql('t', documents)
+        if document_sql is None:
+            return None
+
+        columns = 't.doc_id, d.name AS document, ' if self.is_corpus else ''
+        join = 'JOIN documents d ON d.doc_id = t.doc_id' if self.is_corpus else ''
+        order = 't.doc_id, t.page_num' if self.is_corpus else 't.page_num'
+        sql = f'''
+            SELECT {columns}t.kind, t.label, t.page_num, t.title
+            FROM xref_targets t
+            {join}
+            WHERE t.kind = ? AND t.label = ?{document_sql}
+            ORDER BY {order}
+            LIMIT 1
+        '''
+        row = self.conn.execute(sql, (kind, label, *document_params)).fetchone()
+        return dict(row) if row else None
+
+    @instrumented
+    def find_references(self, reference: str, limit: int = 100, documents: Optional[Iterable] = None) -> List[Dict]:
+        """
+        参照元（本文中でその見出し・図表を参照している箇所）を取得（"where is this referenced"）
+
+        Args:
+            reference: 参照（'Table 5-1', 'Section 3.2' など）
+            limit: 結果の最大数
+            documents: コーパスDBの対象文書（doc_id または文書名、LIKEパターン可）。Noneで全文書
+
+        Returns:
+            {'page_num', 'start_offset', 'text'} のリスト（ページ順。オフセットはページテキスト上の文字位置。
+            コーパスDBでは 'doc_id', 'document' を含む）
+        """
+        kind, label = self._reference_key(reference)
+        document_sql, document_params = self._document_sql('x', documents)
+        if document_sql is None:
+            return []
+
+        columns = 'x.doc_id, d.name AS document, ' if self.is_corpus else ''
+        join = 'JOIN documents d ON d.doc_id = x.doc_id' if self.is_corpus else ''
+        order = 'x.doc_id, x.page_num, x.start_offset' if self.is_corpus else 'x.page_num, x.start_offset'
+        sql = f'''
+            SELECT {columns}x.page_num, x.start_offset, x.text
+            FROM xrefs x
+            {join}
+            WHERE x.kind = ? AND x.label = ?{document_sql}
+            ORDER BY {order}
+            LIMIT ?
+        '''
+        rows = self.conn.execute(sql, (kind, label, *document_params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    @instrumented
+    def get_page_references(self, page_num: int, document=None) -> List[Dict]:
+        """
+        ページ内の参照と、それぞれの参照先のページを取得
+
+        Args:
+            page_num: ページ番号
+            document: コーパスDBの文書（doc_id または文書名。コーパスDBでは必須）
+
+        Returns:
+            {'start_offset', 'text', 'kind', 'label', 'target_page'} のリスト
+            （参照先が見つからない参照の target_page はNone）
+        """
+        if not self.has_xrefs:
+            raise RuntimeError("このデータベースには相互参照の索引(xrefs)がありません。再構築してください")
+
+        doc_id = self._page_document(document)
+        if doc_id is not None:
+            same_document, params = ' AND t.doc_id = x.doc_id', [doc_id, page_num]
+            where = 'x.doc_id = ? AND x.page_num = ?'
+        else:
+            same_document, params = '', [page_num]
+            where = 'x.page_num = ?'
+
+        sql = f'''
+            SELECT x.start_offset, x.text, x.kind, x.label,
+                   (SELECT MIN(t.page_num) FROM xref_targets t
+                    WHERE t.kind = x.kind AND t.label = x.label{same_document}) AS target_page
+            FROM xrefs x
+            WHERE {where}
+            ORDER BY x.start_offset
+        '''
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+    # ========== 類似ページ ==========
+
+    @instrumented
+    def similar_pages(self, page_num: int, k: int = 10) -> List[Dict]:
+        """
+        指定ページに内容が近いページを取得（TF-IDFコサイン類似度）
+
+        ビルド時に作成された .tfidf 索引をメモリマップで読み込む（NumPyが必要）。
+
+        Args:
+            page_num: 基準ページ番号
+            k: 結果の最大数
+
+        Returns:
+            {'page_num', 'score'} の辞書のリスト（スコア降順）
+        """
+        if self._similarity_index is None:
+            from similarity_index import SimilarityIndex, index_path_for
+            self._similarity_index = SimilarityIndex(index_path_for(self.db_path))
+
+        return self._similarity_index.similar_pages(page_num, k)
 
+    # ========== コーパス（複数文書） ==========
+
+    @instrumented
+    def list_documents(self) -> List[Dict]:
+        """
+        コーパスDBの文書一覧を取得
+
+        Returns:
+            {'doc_id', 'name', 'title', 'page_count'} の辞書のリスト
+        """
+        self._require_corpus()
+        sql = 'SELECT doc_id, name, title, page_count FROM documents ORDER BY doc_id'
+        return [dict(row) for row in self.conn.execute(sql).fetchall()]
+
+    @instrumented
+    def search_corpus(self, query: str, limit: int = 10, documents: Optional[Iterable] = None,
+                      page_range: Optional[Tuple[int, int]] = None, has_tables: Optional[bool] = None,
+                      min_chars: Optional[int] = None, max_chars: Optional[int] = None,
+                      section: Optional[str] = None, collapse_duplicates: bool = True) -> List[Dict]:
+        """
+        コーパス全体（または指定文書）を1本のFTSクエリで検索
+
+        文書の絞り込みはpages_ftsのdoc列（文書トークン d<doc_id>）へのMATCHとして
+        FTSのインデックスで評価される。複合識別子・16進リテラル1語のクエリは識別子索引を使う。
+        全文検索では search_fts と同じく、近似重複ページを文書ごとの代表ページでまとめる。
+
+        Args:
+            query: 検索クエリ
+            limit: 結果の最大数
+            documents: 対象文書（doc_id または文書名、LIKEパターン可）。Noneで全文書
+            page_range: (開始, 終了) のページ範囲（各文書内のページ番号）
+            has_tables: True=テーブルを含むページのみ、False=含まないページのみ
+            min_chars: 最小文字数
+            max_chars: 最大文字数
+            section: セクションタイトル（LIKEパターン。各文書の sections で判定）
+            collapse_duplicates: 近似重複ページを1件にまとめる（識別子索引の検索ではまとめない）
+
+        Returns:
+            検索結果のリスト（'doc_id', 'document' を含む、rank昇順。'duplicates' は同じ文書内のページ番号）
+        """
+        self._require_corpus()
+        query = normalize_query(query)
+
+        if is_compound_identifier(query):
+            token = normalize_identifier(query)
+            table = 'idents_fts'
+            fts_query = 'idents : "' + token.replace('"', '""') + '"'
+        else:
+            table = 'pages_fts'
+            fts_query = f'text : ({query})'
+
+        if documents is not None:
+            doc_ids = self._document_ids(documents)
+            if not doc_ids:
+                return []
+            fts_query = f"doc : ({' OR '.join(f'd{doc_id}' for doc_id in doc_ids)}) AND {fts_query}"
+
+        filter_sql, params = self._corpus_filter_sql('f.page_num', page_range, has_tables, min_chars, max_chars,
+                                                     section)
+
+        hits_sql = f'''
+            SELECT f.doc_id, f.page_num, f.rank AS rank
+            FROM {table} f
+            JOIN pages p ON p.doc_id = f.doc_id AND p.page_num = f.page_num
+            WHERE {table} MATCH ?{filter_sql}
+        '''
+        hits_params = [fts_query, *params]
+
+        if filter_sql and self.has_duplicates:
+            # 索引されない完全一致の重複ページは、代表ページがフィルタで外れた場合にヒットとして加える
+            duplicate_sql, duplicate_params = self._corpus_filter_sql('dup.page_num', page_range, has_tables,
+                                                                      min_chars, max_chars, section)
+            hits_sql += f'''
+                UNION ALL
+                SELECT dup.doc_id, dup.page_num, f.rank AS rank
+                FROM {table} f
+                JOIN page_duplicates dup
+                  ON dup.doc_id = f.doc_id AND dup.canonical_page = f.page_num AND dup.distance = 0
+                JOIN pages p ON p.doc_id = dup.doc_id AND p.page_num = dup.page_num
+                WHERE {table} MATCH ?{duplicate_sql}
+                  AND NOT EXISTS (SELECT 1 FROM pages p
+                                  WHERE p.doc_id = f.doc_id AND p.page_num = f.page_num{filter_sql})
+            '''
+            hits_params += [fts_query, *duplicate_params, *params]
+
+        if not (collapse_duplicates and self.has_duplicates and table == 'pages_fts'):
+            sql = f'''
+                WITH hits AS ({hits_sql})
+                SELECT hits.doc_id, d.name AS document, hits.page_num, decode_text(p.text) AS text,
+                       p.char_count, p.table_count, hits.rank AS rank
+                FROM hits
+                JOIN pages p ON p.doc_id = hits.doc_id AND p.page_num = hits.page_num
+                JOIN documents d ON d.doc_id = hits.doc_id
+                ORDER BY hits.rank
+                LIMIT ?
+            '''
+            results = self.conn.execute(sql, (*hits_params, limit)).fetchall()
+            return [dict(row, duplicates=[]) for row in results]
+
+        # search_fts と同じまとめ方を (doc_id, page_num) で行う
+        sql = f'''
+            WITH matches AS ({hits_sql}), hits AS (
+                SELECT m.doc_id, m.page_num, m.rank,
+                       COALESCE(dup.canonical_page, m.page_num) AS canonical_page
+                FROM matches m
+                LEFT JOIN page_duplicates dup ON dup.doc_id = m.doc_id AND dup.page_num = m.page_num
+            ), best AS (
+                SELECT doc_id, page_num, canonical_page, MIN(rank) AS rank
+                FROM hits
+                GROUP BY doc_id, canonical_page
+            )
+            SELECT best.doc_id, d.name AS document, best.page_num, decode_text(p.text) AS text,
+                   p.char_count, p.table_count, best.rank AS rank, best.canonical_page
+            FROM best
+            JOIN pages p ON p.doc_id = best.doc_id AND p.page_num = best.page_num
+            JOIN documents d ON d.doc_id = best.doc_id
+            ORDER BY best.rank
+            LIMIT ?
+        '''
+        rows = self.conn.execute(sql, (*hits_params, limit)).fetchall()
+
+        groups: Dict[Tuple[int, int], List[int]] = {(row['doc_id'], row['canonical_page']): [row['canonical_page']]
+                                                     for row in rows}
+        if groups:
+            placeholders = ','.join('(?, ?)' for _ in groups)
+            members_sql = f'''
+                SELECT doc_id, canonical_page, page_num FROM page_duplicates
+                WHERE (doc_id, canonical_page) IN (VALUES {placeholders})
+                ORDER BY page_num
+            '''
+            for doc_id, canonical_page, page_num in self.conn.execute(members_sql, [v for key in groups for v in key]):
+                groups[(doc_id, canonical_page)].append(page_num)
+
+        results = []
+        for row in rows:
+            result = dict(row)
+            canonical_page = result.pop('canonical_page')
+            result['duplicates'] = [n for n in groups[(result['doc_id'], canonical_page)] if n != result['page_num']]
+            results.append(result)
         return results
 
+    @instrumented
+    def get_document_page(self, document, page_num: int) -> Optional[Dict]:
+        """
+        コーパスDBから文書・ページ番号を指定してページを取得
+
+        Args:
+            document: doc_id または文書名
+            page_num: 文書内のページ番号
+
+        Returns:
+            ページ情報の辞書、存在しない場合はNone
+        """
+        self._require_corpus()
+        doc_ids = self._document_ids([document])
+        if not doc_ids:
+            return None
+
+        cursor = self.conn.cursor()
+        sql = '''
+            SELECT doc_id, page_num, decode_text(text) AS text, char_count, table_count
+            FROM pages WHERE doc_id = ? AND page_num = ?
+        '''
+        result = cursor.execute(sql, (doc_ids[0], page_num)).fetchone()
+        if not result:
+            return None
+
+        page_data = dict(result)
+        tables_sql = 'SELECT content FROM tables WHERE doc_id = ? AND page_num = ? ORDER BY table_index'
+        tables = cursor.execute(tables_sql, (doc_ids[0], page_num)).fetchall()
+        page_data['tables'] = [self.codec.decode_json(row['content']) for row in tables]
+        return page_data
+
+    @staticmethod
+    def _corpus_filter_sql(page_column: str, page_range: Optional[Tuple[int, int]] = None,
+                           has_tables: Optional[bool] = None, min_chars: Optional[int] = None,
+                           max_chars: Optional[int] = None, section: Optional[str] = None) -> Tuple[str, List[Any]]:
+        """コーパスDBの構造化フィルタ（pages を p として結合したSQL用の " AND ..." 断片とパラメータ）"""
+        conditions = []
+        params: List[Any] = []
+        if page_range is not None:
+            conditions.append(f'{page_column} BETWEEN ? AND ?')
+            params.extend(page_range)
+        if has_tables is not None:
+            conditions.append('p.table_count > 0' if has_tables else 'p.table_count = 0')
+        if min_chars is not None:
+            conditions.append('p.char_count >= ?')
+            params.append(min_chars)
+        if max_chars is not None:
+            conditions.append('p.char_count <= ?')
+            params.append(max_chars)
+        if section is not None:
+            # page_store.page_filter_sql と同じ範囲を、同じ文書のセクションだけで判定する
+            conditions.append('''EXISTS (
+                SELECT 1 FROM sections s
+                WHERE s.doc_id = p.doc_id AND s.title LIKE ?
+                  AND p.page_num >= s.page_num
+                  AND p.page_num < COALESCE(
+                      (SELECT MIN(n.page_num) FROM sections n
+                       WHERE n.doc_id = s.doc_id AND n.level <= s.level AND n.page_num > s.page_num),
+                      p.page_num + 1)
+            )''')
+            params.append(section)
+        return ''.join(f' AND {condition}' for condition in conditions), params
+
+    def _document_ids(self, documents: Iterable) -> List[int]:
+        """doc_id・文書名（LIKEパターン可）の指定をdoc_idのリストに変換"""
+        doc_ids = set()
+        for document in documents:
+            if isinstance(document, int):
+                doc_ids.add(document)
+                continue
+            rows = self.conn.execute('SELECT doc_id FROM documents WHERE name LIKE ?', (document,)).fetchall()
+            doc_ids.update(row[0] for row in rows)
+        return sorted(doc_ids)
+
+    def _page_document(self, document) -> Optional[int]:
+        """
+        ページ番号で引くメソッドの文書指定を doc_id に変換
+
+        コーパスDBではページ番号が文書ごとに重複するため document が必須（無ければValueError）。
+        単一PDFのDBではNoneを返す（document は無視する）。
+        """
+        if not self.is_corpus:
+            return None
+        if document is None:
+            raise ValueError("コーパスDBでは document で文書を指定してください")
+        doc_ids = self._document_ids([document])
+        if not doc_ids:
+            raise ValueError(f"文書が見つかりません: {document}")
+        return doc_ids[0]
+
+    def _require_corpus(self):
+        if not self.is_corpus:
+            raise RuntimeError("このデータベースはコーパスDBではありません（corpus_builder.py で作成してください）")
+
     # ========== 統計・分析 ==========
 
-    def get_statistics(self) -> Dict:
+    @instrumented
+    def get_statistics(self, document=None) -> Dict:
         """
         データベース統計情報を取得
 
+        Args:
+            document: コーパスDBの文書（doc_id または文書名。コーパスDBでは必須）
+
         Returns:
             統計情報の辞書
         """
         cursor = self.conn.cursor()
+        doc_id = self._page_document(document)
+        where, params = (' WHERE doc_id = ?', (doc_id,)) if doc_id is not None else ('', ())
 
         stats = {}
 
         # ページ統計
-        stats['total_pages'] = cursor.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
-        stats['total_chars'] = cursor.execute('SELECT SUM(char_count) FROM pages').fetchone()[0]
-        stats['total_tables'] = cursor.execute('SELECT COUNT(*) FROM tables').fetchone()[0]
+        stats['total_pages'] = cursor.execute(f'SELECT COUNT(*) FROM pages{where}', params).fetchone()[0]
+        stats['total_chars'] = cursor.execute(f'SELECT SUM(char_count) FROM pages{where}', params).fetchone()[0]
+        stats['total_tables'] = cursor.execute(f'SELECT COUNT(*) FROM tables{where}', params).fetchone()[0]
         stats['avg_chars_per_page'] = stats['total_chars'] // stats['total_pages'] if stats['total_pages'] > 0 else 0
 
         # ページ範囲
-        page_range = cursor.execute('SELECT MIN(page_num), MAX(page_num) FROM pages').fetchone()
+        page_range = cursor.execute(f'SELECT MIN(page_num), MAX(page_num) FROM pages{where}', params).fetchone()
         stats['page_range'] = {'min': page_range[0], 'max': page_range[1]}
 
         # 最大文字数のページ
-        max_page = cursor.execute('SELECT page_num, char_count FROM pages ORDER BY char_count DESC LIMIT 1').fetchone()
+        max_page = cursor.execute(f'SELECT page_num, char_count FROM pages{where} ORDER BY char_count DESC LIMIT 1',
+                                  params).fetchone()
         if max_page:
             stats['max_chars_page'] = {'page_num': max_page[0], 'char_count': max_page[1]}
 
         # テーブルが最も多いページ
-        max_tables_page = cursor.execute('SELECT page_num, table_count FROM pages ORDER BY table_count DESC LIMIT 1').fetchone()
+        max_tables_page = cursor.execute(f'SELECT page_num, table_count FROM pages{where} '
+                                         f'ORDER BY table_count DESC LIMIT 1', params).fetchone()
         if max_tables_page:
             stats['max_tables_page'] = {'page_num': max_tables_page[0], 'table_count': max_tables_page[1]}
 
         return stats
 
-    def get_page(self, page_num: int) -> Optional[Dict]:
+    @instrumented
+    def coverage(self, document=None) -> Dict:
+        """
+        構築の進み具合を取得
+
+        段階的な構築の途中で公開されたスナップショットでは、保存済みのページだけが検索対象になる。
+
+        Args:
+            document: コーパスDBの文書（doc_id または文書名。コーパスDBでは必須）
+
+        Returns:
+            {'status': 'partial' / 'complete' など, 'pages_indexed', 'pages_total', 'ratio',
+             'ranges': 収録済みページの連続範囲, 'sections': 最上位セクションごとの収録状況} の辞書
+        """
+        doc_id = self._page_document(document)
+        where, params = (' WHERE doc_id = ?', (doc_id,)) if doc_id is not None else ('', ())
+        metadata = dict(self.conn.execute(
+            "SELECT key, value FROM metadata WHERE key IN ('build_status', 'pages_total')").fetchall())
+        if doc_id is not None:
+            row = self.conn.execute('SELECT page_count FROM documents WHERE doc_id = ?', (doc_id,)).fetchone()
+            metadata['pages_total'] = row[0] if row else None
+        page_nums = [row[0] for row in self.conn.execute(f'SELECT page_num FROM pages{where} ORDER BY page_num',
+                                                         params)]
+        indexed = set(page_nums)
+        pages_total = int(metadata.get('pages_total') or len(page_nums))
+
+        sections = []
+        if self._table_exists('sections'):
+            top_level = self.conn.execute(f'''
+                SELECT title, page_num FROM sections{where}
+                {'AND' if where else 'WHERE'} level = (SELECT MIN(level) FROM sections{where})
+                ORDER BY page_num
+            ''', params * 2).fetchall()
+            for i, (title, start) in enumerate(top_level):
+                end = top_level[i + 1][1] - 1 if i + 1 < len(top_level) else pages_total
+                section_pages = range(start, max(start, end) + 1)
+                done = sum(1 for page_num in section_pages if page_num in indexed)
+                sections.append({'title': title, 'page_num': start,
+                                 'pages_indexed': done, 'pages_total': len(section_pages)})
+
+        return {
+            'status': metadata.get('build_status', 'complete'),
+            'pages_indexed': len(page_nums),
+            'pages_total': pages_total,
+            'ratio': len(page_nums) / pages_total if pages_total else 0.0,
+            'ranges': coverage_ranges(page_nums),
+            'sections': sections,
+        }
+
+    @instrumented
+    def get_page(self, page_num: int, document=None) -> Optional[Dict]:
         """
         特定のページ情報を取得
 
         Args:
             page_num: ページ番号
+            document: コーパスDBの文書（doc_id または文書名。コーパスDBでは必須）
 
         Returns:
             ページ情報の辞書、存在しない場合はNone
         """
+        doc_id = self._page_document(document)
+        if doc_id is not None:
+            return self.get_document_page(doc_id, page_num)
+
         cursor = self.conn.cursor()
 
-        sql = 'SELECT * FROM pages WHERE page_num = ?'
+        sql = 'SELECT page_num, decode_text(text) AS text, char_count, table_count FROM pages WHERE page_num = ?'
         result = cursor.execute(sql, (page_num,)).fetchone()
 
         if not result:
@@ -240,10 +1008,36 @@ class QueryHelper:
         # テーブル情報を追加
         tables_sql = 'SELECT table_index, content FROM tables WHERE page_num = ? ORDER BY table_index'
         tables = cursor.execute(tables_sql, (page_num,)).fetchall()
-        page_data['tables'] = [json.loads(row['content']) for row in tables]
+        page_data['tables'] = [self.codec.decode_json(row['content']) for row in tables]
 
         return page_data
 
+    def get_pages(self, page_nums: Iterable[int], document=None) -> Iterator[Dict]:
+        """
+        複数ページをまとめて取得（ストリーミング）
+
+        pagesとtablesをそれぞれ1本の集合クエリで読むため、
+        ページ数に比例したクエリ往復が発生しない。テーブルはアクセス時にデコードされる。
+
+        Args:
+            page_nums: ページ番号のrange（例: range(1200, 1400)）または任意のイテラブル
+            document: コーパスDBの文書（doc_id または文書名。コーパスDBでは必須）
+
+        Yields:
+            ページ情報の辞書（page_num順、存在しないページは含まない）
+        """
+        # 文書の指定は最初の next() を待たずに確認する
+        return self._iter_pages(page_nums, self._page_document(document))
+
+    def _iter_pages(self, page_nums: Iterable[int], doc_id: Optional[int]) -> Iterator[Dict]:
+        for row, table_rows in iter_pages(self.conn, page_nums, doc_id):
+            page_data = dict(row)
+            page_data['text'] = self.codec.decode(page_data['text'])
+            page_data['tables'] = LazyTables((table_row['content'] for table_row in table_rows),
+                                             self.codec.decode_json)
+            yield page_data
+
+    @instrumented
     def get_pages_with_tables(self) -> List[int]:
         """
         テーブルを含むページ番号のリストを取得
@@ -260,18 +1054,27 @@ class QueryHelper:
 
     # ========== エクスポート ==========
 
-    def export_to_json(self, results: List[Dict], output_path: str):
+    def export_to_json(self, results: Iterable[Dict], output_path: str):
         """
         結果をJSONファイルにエクスポート
 
+        1件ずつ書き出すため、get_pages などのジェネレータを渡せば全件をメモリに載せずに済む。
+
         Args:
-            results: 検索結果
+            results: 検索結果（リストまたはイテラブル）
             output_path: 出力ファイルパス
         """
+        count = 0
         with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+            f.write('[')
+            for result in results:
+                item = json.dumps(result, ensure_ascii=False, indent=2, default=json_default)
+                f.write(',\n  ' if count else '\n  ')
+                f.write(item.replace('\n', '\n  '))
+                count += 1
+            f.write('\n]' if count else ']')
 
-        print(f"[OK] {len(results)}件の結果を {output_path} にエクスポートしました")
+        print(f"[OK] {count}件の結果を {output_path} にエクスポートしました")
 
     def export_to_markdown(self, results: List[Dict], output_path: str, query: str = ""):
         """
@@ -301,10 +1104,214 @@ class QueryHelper:
 
         print(f"[OK] {len(results)}件の結果を {output_path} にエクスポートしました")
 
+    def export_pages_to_markdown(self, page_nums: Iterable[int], output_path: str, title: str = "", document=None):
+        """
+        ページ範囲（章など）をMarkdownファイルにエクスポート
+
+        get_pagesで一括取得したページを順に書き出す。
+
+        Args:
+            page_nums: ページ番号のrangeまたはイテラブル
+            output_path: 出力ファイルパス
+            title: ドキュメントタイトル
+            document: コーパスDBの文書（doc_id または文書名。コーパスDBでは必須）
+        """
+        pages = self.get_pages(page_nums, document)
+        page_count = 0
+        with open(output_path, 'w', encoding='utf-8') as f:
+            if title:
+                f.write(f"# {title}\n\n")
+
+            for page in pages:
+                page_count += 1
+                f.write(page_markdown(page))
+
+        print(f"[OK] {page_count}ページを {output_path} にエクスポートしました")
+
+    def export_jsonl(self, output_path: str, chunk_size: int = EXPORT_CHUNK_SIZE):
+        """
+        全ページをJSONL（1ページ1行）にエクスポート（一定ページ数ずつ読み書きするストリーミング出力）
+
+        Args:
+            output_path: 出力ファイルパス
+            chunk_size: 1回に読むページ数
+        """
+        count = export_jsonl(self.db_path, output_path, self.immutable, chunk_size)
+        print(f"[OK] {count}ページを {output_path} にエクスポートしました")
+
+    def export_sections_markdown(self, output_dir: str, workers: int = EXPORT_WORKERS):
+        """
+        最上位セクションごとのMarkdownファイルと目次（index.md）にエクスポート（章ごとに並列）
+
+        Args:
+            output_dir: 出力ディレクトリ
+            workers: 並列に書き出す章の数
+        """
+        parts = export_sections_markdown(self.db_path, output_dir, workers, self.immutable)
+        pages = sum(part['pages'] for part in parts)
+        print(f"[OK] {pages}ページを{len(parts)}ファイルに分けて {output_dir} にエクスポートしました")
+
+    def export_tables_csv(self, output_path: str):
+        """
+        全テーブルをCSVにエクスポート（1行がテーブルの1行）
+
+        Args:
+            output_path: 出力ファイルパス
+        """
+        count = export_tables_csv(self.db_path, output_path, self.immutable)
+        print(f"[OK] {count}個のテーブルを {output_path} にエクスポートしました")
+
+    # ========== 複数DBの横断検索 ==========
+
+    @staticmethod
+    def federated_search(db_paths: Iterable[str], query: str, limit: int = 10,
+                         timeout: float = FEDERATED_TIMEOUT, **filters) -> List[Dict]:
+        """
+        複数のDBファイルを並列に検索して結果をまとめる（1回限りの検索用）
+
+        繰り返し検索する場合は FederatedSearch を使うと接続を再利用できる。
+
+        Args:
+            db_paths: DBファイルパスのリスト
+            query: 検索クエリ
+            limit: 全体での結果の最大数
+            timeout: 全体のタイムアウト（秒）。間に合わなかったDBの結果は含めない
+            **filters: 各DBの search_fts に渡すフィルタ
+
+        Returns:
+            bm25順の検索結果（'db', 'score' を含む。score は FederatedSearch を参照）
+        """
+        with FederatedSearch(db_paths) as federated:
+            return federated.search(query, limit=limit, timeout=timeout, **filters)
+
+
+class FederatedSearch:
+    """
+    複数のDBファイルへの並列検索
+
+    DBごとに専用スレッドを1本持ち、QueryHelper（接続）をそのスレッドで作って使い回す。
+    1回の検索は全DBへ同時に投げるため、待ち時間は最も遅いDB1つ分程度になる。
+
+    結果は生のbm25（rank）の順にヒープで併合する。bm25は文書集合ごとの統計（IDF・平均文書長）に
+    依存するため厳密には比較できないが、DBごとに最上位で割る正規化では関係の薄いDBの最上位も
+    1.0 になり、別のDBの強い一致と並んでしまう。生のbm25なら一致の強さの差が残る。
+    'score' は全DBの結果を通した最小・最大で 0〜1 にした値（順位は生のbm25と同じ）。
+    """
+
+    def __init__(self, db_paths: Iterable[str], immutable: bool = False, stats: Optional[QueryStats] = None):
+        """
+        Args:
+            db_paths: DBファイルパスのリスト
+            immutable: 各DBを immutable=1 で開く（finalize済みの公開DB向け）
+            stats: 全DBの検索で共有する計測先（Noneなら計測しない）
+        """
+        self.db_paths = [str(path) for path in db_paths]
+        self.immutable = immutable
+        self.stats = stats
+        self._executors = {path: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"federated-{i}")
+                           for i, path in enumerate(self.db_paths)}
+        self._helpers: Dict[str, QueryHelper] = {}
+        self.last_status: Dict[str, Any] = {}
+
+    def _search_one(self, path: str, query: str, limit: int, filters: Dict) -> List[Dict]:
+        """1つのDBを検索（そのDB専用のスレッドで実行）"""
+        helper = self._helpers.get(path)
+        if helper is None:
+            helper = QueryHelper(path, immutable=self.immutable, stats=self.stats)
+            self._helpers[path] = helper
+        return helper.search_fts(query, limit=limit, **filters)
+
+    def search(self, query: str, limit: int = 10, timeout: float = FEDERATED_TIMEOUT,
+               per_db_limit: Optional[int] = None, **filters) -> List[Dict]:
+        """
+        全DBを並列に検索して上位を併合
+
+        タイムアウトしたDBは実行中のクエリを中断し、結果に含めない。
+        DBごとの状況（経過時間・件数・タイムアウト・エラー）は last_status に残る。
+
+        Args:
+            query: 検索クエリ
+            limit: 全体での結果の最大数
+            timeout: 全体のタイムアウト（秒）
+            per_db_limit: 各DBから取得する件数（既定は limit）
+            **filters: 各DBの search_fts に渡すフィルタ
+
+        Returns:
+            bm25順の検索結果（'db', 'score' を含む。score は全DBを通した最小・最大で 0〜1 に正規化）
+        """
+        start_time = time.time()
+        per_db_limit = per_db_limit or limit
+        futures = {self._executors[path].submit(self._search_one, path, query, per_db_limit, filters): path
+                   for path in self.db_paths}
+
+        done, not_done = wait(futures, timeout=timeout)
+
+        # 間に合わなかったDBは実行中のクエリを中断する（接続はそのスレッドで再利用される）
+        for future in not_done:
+            future.cancel()
+            helper = self._helpers.get(futures[future])
+            if helper is not None and helper._conn is not None:
+                helper._conn.interrupt()
+
+        ranked_lists = []
+        status = {'elapsed': 0.0, 'timed_out': [futures[f] for f in not_done], 'errors': {}, 'counts': {}}
+        for future in done:
+            path = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                status['errors'][path] = str(e)
+                continue
+
+            status['counts'][path] = len(results)
+            if not results:
+                continue
+
+            for result in results:
+                result['db'] = path
+            ranked_lists.append(results)
+
+        # bm25（rankは負の値、小さいほど良い）のまま併合し、全DBを通した最小・最大で 0〜1 にする
+        merged = list(islice(heapq.merge(*ranked_lists, key=lambda r: r['rank']), limit))
+        scores = [-result['rank'] for results in ranked_lists for result in results]
+        if scores:
+            low, high = min(scores), max(scores)
+            for result in merged:
+                result['score'] = (-result['rank'] - low) / (high - low) if high > low else 1.0
+        status['elapsed'] = time.time() - start_time
+        self.last_status = status
+        return merged
+
+    def _close_helper(self, path: str):
+        """DBの接続を閉じる（専用スレッドで、実行中・待機中の検索が終わった後に実行）"""
+        helper = self._helpers.pop(path, None)
+        if helper is not None:
+            helper.close()
+
+    def close(self):
+        """
+        各DBの接続を専用スレッドで閉じ、スレッドの終了を待つ
+
+        タイムアウトした検索がまだ実行中なら中断する。その検索が作った接続も、
+        後に続く _close_helper で閉じられる。
+        """
+        for path, executor in self._executors.items():
+            helper = self._helpers.get(path)
+            if helper is not None and helper._conn is not None:
+                helper._conn.interrupt()
+            executor.submit(self._close_helper, path)
+            executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
 
 def main():
     """使用例"""
-    with QueryHelper() as qh:
+    with QueryHelper(stats=QueryStats()) as qh:
         print("=" * 70)
         print("クエリヘルパー デモ")
         print("=" * 70)
@@ -315,6 +1322,13 @@ def main():
         for key, value in stats.items():
             print(f"  {key}: {value}")
 
+        # 構築途中のスナップショットの場合は収録範囲を表示
+        coverage = qh.coverage()
+        if coverage['status'] != 'complete':
+            ranges = ', '.join(f"{start}-{end}" for start, end in coverage['ranges'])
+            print(f"\n■ 構築中: {coverage['pages_indexed']}/{coverage['pages_total']}ページ"
+                  f" ({coverage['ratio']:.0%}) 収録済み: {ranges}")
+
         # FTS検索
         print("\n■ FTS検索 ('flash memory'):")
         results = qh.search_with_context('flash memory', limit=3)
@@ -323,12 +1337,22 @@ def main():
             if result['contexts']:
                 print(f"   コンテキスト: {result['contexts'][0][:100]}...")
 
+        # 段落チャンク検索（ヒットした段落とページ内の位置だけを返す）
+        if qh.has_chunks:
+            print("\n■ 段落チャンク検索 ('flash memory'):")
+            for result in qh.search_chunks('flash memory', limit=3):
+                print(f"  ページ {result['page_num']} [{result['start_offset']}-{result['end_offset']}]: "
+                      f"{result['text'][:100]}...")
+
         # テーブルを含むページ
         print("\n■ テーブルを含むページ:")
         table_pages = qh.get_pages_with_tables()
         print(f"  総数: {len(table_pages)}")
         print(f"  ページ: {table_pages[:10]}..." if len(table_pages) > 10 else f"  ページ: {table_pages}")
 
+        # 検索の計測（メソッド別の応答時間・全件走査・低速クエリ）
+        qh.stats.print_report()
+
         print("\n" + "=" * 70)
 
 if __name__ == "__main__":
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+検索処理の計測
+メソッド別の応答時間ヒストグラム、低速クエリログ（EXPLAIN QUERY PLAN付き）、
+走査量カウンタ、全表走査（フルスキャン）の検出
+"""
+
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from instrumentation import Histogram
+
+# 応答時間のヒストグラムの境界（秒）
+QUERY_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# この時間（秒）以上かかった呼び出しを低速クエリとして記録
+SLOW_QUERY_THRESHOLD = 0.1
+
+# 低速クエリログとして保持する件数
+SLOW_LOG_SIZE = 100
+
+# 低速クエリ1件あたりに記録する文の数（時間の長い順）
+SLOW_LOG_STATEMENTS = 5
+
+# 走査量の計測単位（SQLiteのVM命令数。progress handler の呼び出し間隔）
+VM_STEP_INTERVAL = 100
+
+# 実行計画を保持するSQLの形（リテラルを除いた文）の上限
+MAX_STATEMENT_SHAPES = 256
+
+# 実行計画のうち表の全件走査にあたる行（SCAN t / SCAN t USING COVERING INDEX i /
+# 条件なしのFTS5走査 SCAN t VIRTUAL TABLE INDEX 0:）
+_SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?([^\s(]\S*)(?: VIRTUAL TABLE INDEX \d+:(.*))?')
+
+_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+# SQLite内部の文（仮想テーブルが実行する入れ子の文は "-- " で始まり、
+# FTS5の設定・索引の読み込みは 'main'.'pages_fts_config' のように引用符付きのスキーマ名を使う）
+_INTERNAL_PATTERN = re.compile(r"^(?:--|SELECT .*? FROM '[^']+'\.')", re.DOTALL)
+
+# 全件走査として数えない表（スキーマ表は常に走査される）
+_IGNORED_SCAN_TABLES = ('sqlite_master', 'sqlite_schema', 'sqlite_temp_master')
+
+
+def statement_shape(sql: str) -> str:
+    """文字列・数値リテラルを ? に置き換え、空白を詰めたSQL（同じ形の文をまとめる）"""
+    return ' '.join(_LITERAL_PATTERN.sub('?', sql).split())
+
+
+def full_scan_tables(plan: List[str], known_tables: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    実行計画（EXPLAIN QUERY PLAN の detail 列）から全件走査している表名を返す
+
+    Args:
+        plan: 実行計画
+        known_tables: DBに存在する表名（sqlite_master の name）。渡すとCTE・副問い合わせの別名を除く
+    """
+    known = set(known_tables) if known_tables is not None else None
+    tables = []
+    for detail in plan:
+        match = _SCAN_PATTERN.match(detail)
+        if not match or (match.group(2) or '').strip() or match.group(1) in _IGNORED_SCAN_TABLES:
+            continue
+        if known is None or match.group(1) in known:
+            tables.append(match.group(1))
+    return tables
+
+
+def explain(conn, sql: str) -> Optional[List[str]]:
+    """EXPLAIN QUERY PLAN の結果（detail 列のリスト）。取得できない文はNone"""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    try:
+        return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+    except Exception:
+        return None
+
+
+def _explain_plans(db: str, sqls: Dict[str, str]) -> Dict[str, tuple]:
+    """
+    文の形ごとの (実行計画, 全件走査した表) を、計測対象とは別の読み取り専用接続で取得
+
+    検索に使った接続は別スレッドのものや閉じられたものがあるため使わない。
+    decode_text は実行計画の作成に必要なだけなので、何もしない関数で代用する。
+    """
+    try:
+        conn = sqlite3.connect(f"{Path(db).resolve().as_uri()}?mode=ro", uri=True)
+    except (sqlite3.Error, OSError, ValueError):
+        return {}
+    try:
+        conn.create_function('decode_text', 1, lambda value: value)
+        known = {row[0] for row in conn.execute('SELECT name FROM sqlite_master')}
+        result = {}
+        for shape, sql in sqls.items():
+            plan = explain(conn, sql)
+            result[shape] = (plan, full_scan_tables(plan, known) if plan else [])
+        return result
+    except sqlite3.Error:
+        return {}
+    finally:
+        conn.close()
+
+
+class _Call:
+    """1回のメソッド呼び出しで実行された文と走査量"""
+
+    __slots__ = ('method', 'statements', 'steps', 'rows', 'start', 'elapsed')
+
+    def __init__(self, method: str):
+        self.method = method
+        self.statements: List[List] = []  # [開始時刻, SQL]
+        self.steps = 0
+        self.rows = 0
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+
+    def statement_times(self, end: float) -> List[tuple]:
+        """各文の (SQL, 秒)。次の文が始まるまで（最後は呼び出し終了まで）をその文の時間とみなす"""
+        result = []
+        for i, (start, sql) in enumerate(self.statements):
+            stop = self.statements[i + 1][0] if i + 1 < len(self.statements) else end
+            result.append((sql, stop - start))
+        return result
+
+
+class QueryStats:
+    """
+    検索メソッドの計測値を集める（複数の接続・スレッドで共有可能）
+
+    attach(conn) で接続にトレースコールバックと progress handler を設定し、
+    measure(method) の範囲で実行された文・VM命令数を呼び出し単位で記録する。
+
+    - メソッド別: 呼び出し回数、エラー数、応答時間ヒストグラム、返した行数、
+      VM命令数（走査した行数の近似。Pythonからは sqlite3_stmt_status を取得できないため）、
+      全件走査を含んだ呼び出し数、低速クエリ数
+    - 文の形（リテラルを除いたSQL）別: 実行回数、合計時間、実行計画、全件走査した表
+    - 低速クエリログ: 閾値以上かかった呼び出しと、その中で時間の長い文の実行計画
+
+    実行計画は検索の呼び出し中には取得せず、計測値を参照するとき（snapshot・print_report・dump）に
+    まだ無い文の形の分だけ、別の読み取り専用接続で EXPLAIN QUERY PLAN を実行してキャッシュする。
+    低速クエリだけは記録時（呼び出しの時間を測り終えた後）に取得する。
+    """
+
+    def __init__(self, slow_threshold: float = SLOW_QUERY_THRESHOLD,
+                 slow_log_path: Optional[Union[str, Path]] = None,
+                 slow_log_size: int = SLOW_LOG_SIZE, step_interval: int = VM_STEP_INTERVAL):
+        """
+        Args:
+            slow_threshold: 低速クエリとみなす時間（秒）
+            slow_log_path: 低速クエリを1行1JSONで追記するファイル（Noneで無効）
+            slow_log_size: メモリ上に保持する低速クエリの件数
+            step_interval: progress handler の呼び出し間隔（VM命令数）
+        """
+        self.slow_threshold = slow_threshold
+        self.slow_log_path = Path(slow_log_path) if slow_log_path else None
+        self.step_interval = step_interval
+        self.methods: Dict[str, Dict[str, Any]] = {}
+        self.statements: Dict[str, Dict[str, Any]] = {}
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self.start_time = time.time()
+
+    # ========== 接続への設定 ==========
+
+    def attach(self, conn):
+        """接続にトレースコールバックと progress handler を設定（再接続のたびに呼ぶ）"""
+        local = self._local
+        interval = self.step_interval
+
+        def trace(sql):
+            call = getattr(local, 'call', None)
+            if call is not None and not _INTERNAL_PATTERN.match(sql):
+                call.statements.append([time.perf_counter(), sql])
+
+        def progress():
+            call = getattr(local, 'call', None)
+            if call is not None:
+                call.steps += interval
+            return 0  # 0以外を返すと実行中の文が中断される
+
+        conn.set_trace_callback(trace)
+        conn.set_progress_handler(progress, interval)
+
+    # ========== 計測 ==========
+
+    @contextmanager
+    def measure(self, method: str, db: Optional[str] = None):
+        """
+        メソッド呼び出し1回を計測（with文）
+
+        入れ子の呼び出し（search_with_context 内の search_fts など）は外側の呼び出しにまとめ、Noneを返す。
+        yield する _Call の rows（返した行数）は呼び出し側で設定する。
+        """
+        local = self._local
+        if getattr(local, 'call', None) is not None:
+            yield None
+            return
+
+        call = local.call = _Call(method)
+        error = False
+        try:
+            yield call
+        except BaseException:
+            error = True
+            raise
+        finally:
+            end = time.perf_counter()
+            call.elapsed = end - call.start
+            local.call = None
+            self._record(call, end, error, db)
+
+    def _record(self, call: _Call, end: float, error: bool, db: Optional[str]):
+        """呼び出しの計測値を集計し、閾値を超えていれば低速クエリとして記録"""
+        statements = []
+        for sql, seconds in call.statement_times(end):
+            shape = statement_shape(sql)
+            statements.append((sql, seconds, shape, self._statement_info(shape, sql, db)))
+
+        # 全件走査の判定は実行計画が揃う参照時に行うため、呼び出しが実行した文の形の組を数えておく
+        shapes = frozenset(shape for _, _, shape, info in statements if info is not None)
+        slow = call.elapsed >= self.slow_threshold
+
+        with self._lock:
+            stats = self.methods.get(call.method)
+            if stats is None:
+                stats = self.methods[call.method] = {
+                    'calls': 0, 'errors': 0, 'rows': 0, 'vm_steps': 0, 'statements': 0,
+                    'slow_calls': 0, 'latency': Histogram(QUERY_TIME_BUCKETS), 'shape_sets': Counter(),
+                }
+            stats['calls'] += 1
+            stats['errors'] += int(error)
+            stats['rows'] += call.rows
+            stats['vm_steps'] += call.steps
+            stats['statements'] += len(statements)
+            stats['slow_calls'] += int(slow)
+            stats['latency'].observe(call.elapsed)
+            stats['shape_sets'][shapes] += 1
+            for _, seconds, _, info in statements:
+                if info is not None:
+                    info['count'] += 1
+                    info['seconds'] += seconds
+
+        if slow:
+            self._log_slow(call, statements, error, db)
+
+    def _statement_info(self, shape: str, sql: str, db: Optional[str]) -> Optional[Dict[str, Any]]:
+        """文の形ごとの集計（実行計画は後で取得する。上限を超えた新しい形はNone）"""
+        with self._lock:
+            info = self.statements.get(shape)
+            if info is None and len(self.statements) < MAX_STATEMENT_SHAPES:
+                info = self.statements[shape] = {'count': 0, 'seconds': 0.0, 'plan': None, 'full_scan': [],
+                                                 'pending': (db, sql) if db else None}
+            return info
+
+    def _resolve_plans(self, shapes: Optional[Iterable[str]] = None):
+        """実行計画がまだ無い文の形（shapes を渡せばそのうちの分）の実行計画を取得"""
+        pending: Dict[str, Dict[str, str]] = {}
+        with self._lock:
+            for shape in (self.statements if shapes is None else shapes):
+                info = self.statements.get(shape)
+                if info is not None and info['pending']:
+                    db, sql = info['pending']
+                    pending.setdefault(db, {})[shape] = sql
+        for db, sqls in pending.items():
+            plans = _explain_plans(db, sqls)
+            with self._lock:
+                for shape in sqls:
+                    info = self.statements[shape]
+                    info['plan'], info['full_scan'] = plans.get(shape, (None, []))
+                    info['pending'] = None
+
+    def _log_slow(self, call: _Call, statements: List[tuple], error: bool, db: Optional[str]):
+        """低速クエリを記録（時間の長い文から順に、実行計画付きで）"""
+        self._resolve_plans({shape for _, _, shape, info in statements if info is not None})
+        scanned = sorted({table for _, _, _, info in statements if info for table in info['full_scan']})
+        slowest = sorted(statements, key=lambda item: -item[1])[:SLOW_LOG_STATEMENTS]
+        entry = {
+            'time': datetime.now().isoformat(),
+            'method': call.method,
+            'db': db,
+            'seconds': round(call.elapsed, 6),
+            'rows': call.rows,
+            'vm_steps': call.steps,
+            'error': error,
+            'full_scan': scanned,
+            'statements': [{
+                'sql': sql,
+                'seconds': round(seconds, 6),
+                'plan': info['plan'] if info else None,
+            } for sql, seconds, _, info in slowest],
+        }
+        with self._lock:
+            self.slow_queries.append(entry)
+            if self.slow_log_path:
+                try:
+                    self.slow_log_path.parent.mkdir(parents=True, exist_ok=True)
+                    with open(self.slow_log_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                except OSError as e:
+                    print(f"[警告] 低速クエリログを書き込めません: {e}")
+
+    # ========== 参照・出力 ==========
+
+    def snapshot(self) -> Dict[str, Any]:
+        """現時点の計測値（まだ無い実行計画はここで取得する）"""
+        self._resolve_plans()
+        with self._lock:
+            methods = {}
+            full_scans: Dict[str, int] = {}  # 表名 -> 全件走査した呼び出し数
+            for name, stats in self.methods.items():
+                methods[name] = {key: value for key, value in stats.items() if key not in ('latency', 'shape_sets')}
+                methods[name]['latency'] = stats['latency'].to_dict()
+                full_scan_calls = 0
+                for shapes, count in stats['shape_sets'].items():
+                    scanned = {table for shape in shapes for table in self.statements[shape]['full_scan']}
+                    full_scan_calls += count if scanned else 0
+                    for table in scanned:
+                        full_scans[table] = full_scans.get(table, 0) + count
+                methods[name]['full_scan_calls'] = full_scan_calls
+            statements = [
+                {'sql': shape, 'count': info['count'], 'seconds': round(info['seconds'], 6),
+                 'full_scan': info['full_scan'], 'plan': info['plan']}
+                for shape, info in sorted(self.statements.items(), key=lambda item: -item[1]['seconds'])
+            ]
+            return {
+                'elapsed': round(time.time() - self.start_time, 3),
+                'slow_threshold': self.slow_threshold,
+                'methods': methods,
+                'full_scans': full_scans,
+                'statements': statements,
+                'slow_queries': list(self.slow_queries),
+            }
+
+    def dump(self, path: Union[str, Path]):
+        """計測値をJSONファイルに書き出す（一時ファイルからのrenameで置き換える）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        tmp_path.write_text(json.dumps(self.snapshot(), ensure_ascii=False, indent=2), encoding='utf-8')
+        os.replace(tmp_path, path)
+
+    def print_report(self, statements: int = 5):
+        """メソッド別の応答時間と、全件走査・時間の長い文を表示"""
+        snapshot = self.snapshot()
+        if not snapshot['methods']:
+            print("[計測] 検索の記録はありません")
+            return
+
+        print(f"\n[計測] 検索メソッド別の応答時間（低速クエリの閾値 {self.slow_threshold * 1000:.0f}ms）:")
+        print(f"  {'メソッド':<22}{'回数':>7}{'p50':>9}{'p95':>9}{'最大':>10}{'行数':>9}{'VM命令':>12}"
+              f"{'全件走査':>8}{'低速':>6}")
+        for name, stats in sorted(snapshot['methods'].items(), key=lambda item: -item[1]['latency']['sum']):
+            latency = stats['latency']
+            print(f"  {name:<22}{stats['calls']:>7,}{_ms(latency['p50']):>9}{_ms(latency['p95']):>9}"
+                  f"{_ms(latency['max']):>10}{stats['rows']:>9,}{stats['vm_steps']:>12,}"
+                  f"{stats['full_scan_calls']:>8,}{stats['slow_calls']:>6,}")
+
+        if snapshot['full_scans']:
+            print("[計測] 全件走査された表: " +
+                  ', '.join(f"{table} {count}回" for table, count in
+                            sorted(snapshot['full_scans'].items(), key=lambda item: -item[1])))
+
+        if snapshot['statements'] and statements:
+            print(f"[計測] 合計時間の長い文（上位{min(statements, len(snapshot['statements']))}件）:")
+            for info in snapshot['statements'][:statements]:
+                mark = f" [全件走査: {', '.join(info['full_scan'])}]" if info['full_scan'] else ''
+                print(f"  {info['seconds'] * 1000:.1f}ms / {info['count']}回{mark}: {info['sql'][:120]}")
+
+        if snapshot['slow_queries']:
+            print(f"[計測] 低速クエリ: {len(snapshot['slow_queries'])}件（最新: "
+                  f"{snapshot['slow_queries'][-1]['method']} {snapshot['slow_queries'][-1]['seconds'] * 1000:.1f}ms）")
+
+
+@contextmanager
+def measure(stats: Optional[QueryStats], method: str, db: Optional[str] = None):
+    """
+    stats.measure と同じ（with文）。stats がNoneなら記録せず、経過時間（elapsed）だけを測る
+
+    入れ子の呼び出しでも記録しない _Call を返すため、呼び出し側は常に rows・elapsed を使える。
+    接続に attach していない場合でも、(結果, 所要秒数) を返すメソッドで使える。
+    """
+    with (stats.measure(method, db) if stats is not None else nullcontext()) as recorded:
+        call = recorded if recorded is not None else _Call(method)
+        try:
+            yield call
+        finally:
+            if recorded is None:
+                call.elapsed = time.perf_counter() - call.start
+
+
+def _ms(seconds: Optional[float]) -> str:
+    return '-' if seconds is None else f"{seconds * 1000:.1f}ms"
+
+
+def instrumented(method):
+    """
+    検索メソッドを self.stats で計測するデコレータ
+
+    対象のクラスは stats（QueryStats、Noneなら計測しない）と db_path を持つこと。
+    戻り値がリストなら件数、それ以外は結果の有無（0/1）を返した行数として記録する。
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.stats is None:
+            return method(self, *args, **kwargs)
+        with self.stats.measure(name, self.db_path) as call:
+            if call is None:
+                return method(self, *args, **kwargs)
+            result = method(self, *args, **kwargs)
+            call.rows = len(result) if isinstance(result, list) else int(result is not None)
+            return result
+
+    return wrapper
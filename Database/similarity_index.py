@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+類似ページ検索用のTF-IDF索引
+ページ×語の疎行列をNumPy配列としてDBの隣に保存し、検索時はメモリマップで読み込む
+"""
+
+import json
+import re
+import sqlite3
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Union
+
+import numpy as np
+
+from page_store import TextCodec
+
+INDEX_SUFFIX = '.tfidf'
+INDEX_VERSION = 1
+
+# 語の抽出（英字で始まる2文字以上の英数字列、レジスタ名・略語を含む）
+TOKEN_PATTERN = re.compile(r'[A-Za-z][A-Za-z0-9_]+')
+
+# ほぼ全ページに出る語は類似度に寄与しないため除外する文書頻度の上限（割合）
+MAX_DOC_FREQ_RATIO = 0.5
+
+# 行（ページ）方向と列（語）方向の両方のCSR表現を保存する
+ARRAY_NAMES = ('page_nums', 'row_indptr', 'row_terms', 'row_weights',
+               'col_indptr', 'col_rows', 'col_weights')
+
+
+def index_path_for(db_path: Union[str, Path]) -> Path:
+    """DBファイルに対応する索引ディレクトリのパスを返す"""
+    return Path(db_path).with_suffix(INDEX_SUFFIX)
+
+
+def tokenize(text: str) -> List[str]:
+    """テキストを小文字の語に分割"""
+    return [token.lower() for token in TOKEN_PATTERN.findall(text or '')]
+
+
+def build_similarity_index(conn: sqlite3.Connection, db_path: Union[str, Path]) -> Path:
+    """
+    pagesテーブルからTF-IDF索引を構築して保存
+
+    重みは (1 + log tf) * log(N / df)、各ページベクトルはL2正規化するため
+    内積がそのままコサイン類似度になる。
+
+    Args:
+        conn: データベース接続
+        db_path: DBファイルパス（索引はその隣の .tfidf ディレクトリに保存）
+
+    Returns:
+        索引ディレクトリのパス
+    """
+    codec = TextCodec.from_connection(conn)
+    page_nums = []
+    page_counts = []
+    doc_freq = Counter()
+
+    for page_num, text in conn.execute('SELECT page_num, text FROM pages ORDER BY page_num'):
+        counts = Counter(tokenize(codec.decode(text)))
+        page_nums.append(page_num)
+        page_counts.append(counts)
+        doc_freq.update(counts.keys())
+
+    total_pages = len(page_nums)
+    max_df = max(2, int(total_pages * MAX_DOC_FREQ_RATIO))
+    vocab = {term: term_id for term_id, term in enumerate(
+        sorted(term for term, df in doc_freq.items() if 2 <= df <= max_df))}
+    idf = np.zeros(len(vocab), dtype=np.float32)
+    for term, term_id in vocab.items():
+        idf[term_id] = np.log(total_pages / doc_freq[term])
+
+    # 行方向（ページ→語）のCSR
+    row_indptr = np.zeros(total_pages + 1, dtype=np.int64)
+    row_terms_list = []
+    row_tf_list = []
+    for row, counts in enumerate(page_counts):
+        terms = [(vocab[term], tf) for term, tf in counts.items() if term in vocab]
+        terms.sort()
+        row_indptr[row + 1] = row_indptr[row] + len(terms)
+        row_terms_list.extend(term_id for term_id, _ in terms)
+        row_tf_list.extend(tf for _, tf in terms)
+
+    row_terms = np.asarray(row_terms_list, dtype=np.int32)
+    row_weights = (1.0 + np.log(np.asarray(row_tf_list, dtype=np.float32))) * idf[row_terms]
+
+    # L2正規化
+    row_ids = np.repeat(np.arange(total_pages), np.diff(row_indptr))
+    norms = np.sqrt(np.bincount(row_ids, weights=row_weights ** 2, minlength=total_pages))
+    norms[norms == 0] = 1.0
+    row_weights = (row_weights / norms[row_ids]).astype(np.float32)
+
+    # 列方向（語→ページ）のCSR
+    order = np.argsort(row_terms, kind='stable')
+    col_rows = row_ids[order].astype(np.int32)
+    col_weights = row_weights[order]
+    col_indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_terms, minlength=len(vocab)), out=col_indptr[1:])
+
+    arrays = {
+        'page_nums': np.asarray(page_nums, dtype=np.int64),
+        'row_indptr': row_indptr,
+        'row_terms': row_terms,
+        'row_weights': row_weights,
+        'col_indptr': col_indptr,
+        'col_rows': col_rows,
+        'col_weights': col_weights,
+    }
+
+    index_dir = index_path_for(db_path)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    for name in ARRAY_NAMES:
+        np.save(index_dir / f'{name}.npy', arrays[name])
+
+    meta = {
+        'version': INDEX_VERSION,
+        'page_count': total_pages,
+        'vocab_size': len(vocab),
+        'nnz': int(len(row_terms)),
+    }
+    (index_dir / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+
+    return index_dir
+
+
+class SimilarityIndex:
+    """メモリマップしたTF-IDF索引に対するコサイン類似度検索"""
+
+    def __init__(self, index_dir: Union[str, Path]):
+        self.index_dir = Path(index_dir)
+        meta_path = self.index_dir / 'meta.json'
+        if not meta_path.exists():
+            raise FileNotFoundError(f"類似ページ索引が見つかりません: {self.index_dir}")
+
+        self.meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        for name in ARRAY_NAMES:
+            setattr(self, name, np.load(self.index_dir / f'{name}.npy', mmap_mode='r'))
+
+        self._row_of = {int(page_num): row for row, page_num in enumerate(self.page_nums)}
+
+    def similar_pages(self, page_num: int, k: int = 10) -> List[Dict]:
+        """
+        指定ページに類似したページを返す
+
+        ページの語ごとに列方向の転置リストをまとめて取り出し、
+        np.bincountで全ページとの内積を一度に計算する。
+
+        Args:
+            page_num: 基準ページ番号
+            k: 返すページ数
+
+        Returns:
+            {'page_num', 'score'} の辞書のリスト（スコア降順、基準ページ自身は除く）
+        """
+        row = self._row_of.get(page_num)
+        if row is None:
+            return []
+
+        start, end = self.row_indptr[row], self.row_indptr[row + 1]
+        terms = np.asarray(self.row_terms[start:end])
+        weights = np.asarray(self.row_weights[start:end])
+        if len(terms) == 0:
+            return []
+
+        # 各語の転置リスト [col_indptr[t], col_indptr[t+1]) を連結したインデックスを作る
+        starts = np.asarray(self.col_indptr[terms])
+        lengths = np.asarray(self.col_indptr[terms + 1]) - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        postings = offsets + np.arange(lengths.sum())
+
+        rows = np.asarray(self.col_rows[postings])
+        values = np.asarray(self.col_weights[postings]) * np.repeat(weights, lengths)
+        scores = np.bincount(rows, weights=values, minlength=len(self.page_nums))
+        scores[row] = 0.0
+
+        k = min(k, int(np.count_nonzero(scores > 0)))
+        if k <= 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{'page_num': int(self.page_nums[i]), 'score': float(scores[i])} for i in top]
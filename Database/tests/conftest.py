@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Database/ 直下のモジュールをスクリプトと同じ名前で import できるようにする"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
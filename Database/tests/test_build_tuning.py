@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""build_tuning.BatchTuner の調整手順のテスト"""
+
+from build_tuning import MAX_COMMIT_SECONDS, BatchTuner
+
+
+def _warm_up(tuner: BatchTuner):
+    assert tuner.observe(100, 1.0, 0.0) == []
+
+
+def test_warmup_batch_is_ignored():
+    tuner = BatchTuner(batch_size=100, workers=4)
+    assert tuner.observe(100, 1.0, 0.5) == []
+    assert (tuner.batch_size, tuner.workers) == (100, 4)
+
+
+def test_initial_values_are_clamped():
+    tuner = BatchTuner(batch_size=10_000, workers=0, max_batch_size=500, max_workers=8)
+    assert (tuner.batch_size, tuner.workers) == (500, 1)
+    assert BatchTuner(batch_size=100, workers=2, min_workers=2, max_workers=2).settled
+
+
+def test_batch_size_doubles_when_commits_dominate():
+    tuner = BatchTuner(batch_size=100, workers=4, max_batch_size=300)
+    _warm_up(tuner)
+    assert tuner.observe(100, 1.0, 0.2)  # コミットが20%
+    assert tuner.batch_size == 200
+    tuner.observe(200, 2.0, 0.4)
+    assert tuner.batch_size == 300  # 上限で止まる
+
+
+def test_batch_size_halves_and_stays_below_slow_commit():
+    tuner = BatchTuner(batch_size=400, workers=4)
+    _warm_up(tuner)
+    tuner.observe(400, 10.0, MAX_COMMIT_SECONDS + 0.5)
+    assert tuner.batch_size == 200
+    # コミットの割合が大きくても、長すぎたサイズには戻さない
+    for _ in range(5):
+        tuner.observe(200, 1.0, 0.5)
+        assert tuner.batch_size == 200
+
+
+def test_workers_climb_while_rate_improves_then_revert():
+    tuner = BatchTuner(batch_size=100, workers=2, max_workers=8)
+    _warm_up(tuner)
+    assert tuner.observe(100, 1.0, 0.0) == ['ワーカー数 2→3（100.0ページ/秒）']
+    tuner.observe(100, 0.8, 0.0)   # 125ページ/秒: 改善したので同じ向きに進める
+    assert tuner.workers == 4
+    tuner.observe(100, 0.79, 0.0)  # 改善が MIN_GAIN 未満: 戻して固定
+    assert tuner.workers == 3
+    assert tuner.settled
+    assert tuner.settings()['pages_per_sec'] == 125.0
+    assert tuner.observe(100, 0.5, 0.0) == []
+    assert tuner.workers == 3
+
+
+def test_workers_reverse_once_when_first_step_does_not_help():
+    tuner = BatchTuner(batch_size=100, workers=4, max_workers=8)
+    _warm_up(tuner)
+    tuner.observe(100, 1.0, 0.0)
+    assert tuner.workers == 5
+    tuner.observe(100, 1.0, 0.0)   # 5で改善しない: 逆向きに1回試す
+    assert tuner.workers == 3
+    assert not tuner.settled
+    tuner.observe(100, 1.0, 0.0)   # 3でも改善しない: 元に戻して固定
+    assert tuner.workers == 4
+    assert tuner.settled
+
+
+def test_workers_step_down_from_upper_limit():
+    tuner = BatchTuner(batch_size=100, workers=8, max_workers=8)
+    _warm_up(tuner)
+    tuner.observe(100, 1.0, 0.0)
+    assert tuner.workers == 7
+
+
+def test_batch_size_frozen_while_evaluating_workers():
+    tuner = BatchTuner(batch_size=100, workers=2, max_workers=8)
+    _warm_up(tuner)
+    tuner.observe(100, 1.0, 0.0)
+    assert tuner.workers == 3
+    # ワーカー数の評価中はコミットの割合が大きくてもバッチサイズを変えない
+    assert tuner.observe(100, 0.8, 0.2) == ['ワーカー数 3→4（125.0ページ/秒）']
+    assert tuner.batch_size == 100
+    # 評価が終わって固定された後はバッチサイズを調整する
+    tuner.observe(100, 0.8, 0.0)
+    assert tuner.settled
+    tuner.observe(100, 1.0, 0.2)
+    assert tuner.batch_size == 200
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""exporters の Markdown 出力と instrumentation の Prometheus テキスト形式のテスト"""
+
+from exporters import page_markdown
+from instrumentation import BuildMetrics, PrometheusTextExporter
+
+
+# ========== Markdown ==========
+
+def test_page_markdown_table_has_separator_after_header():
+    page = {'page_num': 12, 'text': 'FLMDCNT register', 'tables': [
+        [['Bit', 'Name'], ['0', 'FLMDPUP'], ['1', None]],
+    ]}
+    assert page_markdown(page) == (
+        '## ページ 12\n\n'
+        'FLMDCNT register\n\n'
+        '### テーブル 1\n\n'
+        '| Bit | Name |\n'
+        '| --- | --- |\n'
+        '| 0 | FLMDPUP |\n'
+        '| 1 |  |\n'
+        '\n'
+        '---\n\n'
+    )
+
+
+def test_page_markdown_flattens_cell_newlines_and_numbers_tables():
+    page = {'page_num': 1, 'text': '', 'tables': [[['a\nb']], [['x', 'y', 'z']]]}
+    markdown = page_markdown(page)
+    assert '| a b |\n| --- |\n' in markdown
+    assert '### テーブル 2\n\n| x | y | z |\n| --- | --- | --- |\n' in markdown
+
+
+def test_page_markdown_without_tables():
+    assert page_markdown({'page_num': 3, 'text': 'text', 'tables': []}) == '## ページ 3\n\ntext\n\n---\n\n'
+
+
+# ========== Prometheus ==========
+
+def test_prometheus_render(tmp_path):
+    metrics = BuildMetrics('manual', labels={'builder': 'ultra "fast"'})
+    with metrics.stage('extract'):
+        pass
+    metrics.incr('pages', 3)
+    metrics.set_gauge('db_size_bytes', 4096)
+    metrics.observe('page_extract_seconds', 0.02)
+    metrics.observe('page_extract_seconds', 0.3)
+    metrics.observe('page_extract_seconds', 20.0)
+
+    text = PrometheusTextExporter(tmp_path / 'build.prom').render(metrics)
+    lines = text.splitlines()
+    labels = 'build="manual",builder="ultra \\"fast\\""'
+
+    assert text.endswith('\n')
+    assert '# TYPE pdf_build_stage_seconds gauge' in lines
+    assert any(line.startswith(f'pdf_build_stage_seconds{{{labels},stage="extract"}} ') for line in lines)
+    assert lines[lines.index('# TYPE pdf_build_pages_total counter') + 1] == f'pdf_build_pages_total{{{labels}}} 3'
+    assert lines[lines.index('# TYPE pdf_build_db_size_bytes gauge') + 1] == f'pdf_build_db_size_bytes{{{labels}}} 4096'
+    assert '# TYPE pdf_build_elapsed_seconds gauge' in lines
+
+    # ヒストグラムは累積件数（le は境界以下）
+    assert '# TYPE pdf_build_page_extract_seconds histogram' in lines
+    assert f'pdf_build_page_extract_seconds_bucket{{{labels},le="0.01"}} 0' in lines
+    assert f'pdf_build_page_extract_seconds_bucket{{{labels},le="0.025"}} 1' in lines
+    assert f'pdf_build_page_extract_seconds_bucket{{{labels},le="0.5"}} 2' in lines
+    assert f'pdf_build_page_extract_seconds_bucket{{{labels},le="10.0"}} 2' in lines
+    assert f'pdf_build_page_extract_seconds_bucket{{{labels},le="+Inf"}} 3' in lines
+    assert f'pdf_build_page_extract_seconds_sum{{{labels}}} 20.32' in lines
+    assert f'pdf_build_page_extract_seconds_count{{{labels}}} 3' in lines
+
+
+def test_prometheus_exporter_rewrites_file_on_progress(tmp_path):
+    path = tmp_path / 'metrics' / 'build.prom'
+    metrics = BuildMetrics('manual')
+    metrics.add_exporter(PrometheusTextExporter(path))
+    metrics.incr('pages')
+    metrics.event('page')
+    assert not path.exists()
+    metrics.event('progress')
+    assert 'pdf_build_pages_total{build="manual"} 1' in path.read_text(encoding='utf-8')
+    assert not path.with_name('build.prom.tmp').exists()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""ingest_pipeline の識別子抽出（複合識別子・16進リテラル）のテスト"""
+
+import pytest
+
+from ingest_pipeline import _HEX_LITERAL, extract_identifiers, is_compound_identifier, normalize_identifier
+
+
+@pytest.mark.parametrize('token, expected', [
+    ('0xFFE5_0000', '0xffe50000'),
+    ('0XAB', '0xab'),
+    ('0x0', '0x0'),
+    ('0FFH', '0xff'),
+    ('000H', '0x0'),
+    ('0FFE50000H', '0xffe50000'),
+    ('12_34H', '0x1234'),
+    ('FFE5 0000H', '0xffe50000'),
+])
+def test_hex_literal_accepted(token, expected):
+    assert _HEX_LITERAL.fullmatch(token)
+    assert normalize_identifier(token) == expected
+    assert is_compound_identifier(token)
+
+
+@pytest.mark.parametrize('token', [
+    'BEACH',       # 英単語（H付きは数字で始まる形だけ）
+    'DEADH',
+    'FFE5H',
+    '0FFh',        # 小文字の h
+    '0x_1',        # 0x の直後の区切り
+    'ffe5 0000H',  # 空白区切りは大文字の4桁ずつ
+    'FFE5 000H',
+])
+def test_hex_literal_rejected(token):
+    assert not _HEX_LITERAL.fullmatch(token)
+    assert normalize_identifier(token) == token
+
+
+def test_normalize_identifier_strips_whitespace():
+    assert normalize_identifier('  0FFH ') == '0xff'
+    assert normalize_identifier(' TAUJ0.CMOR0 ') == 'TAUJ0.CMOR0'
+
+
+@pytest.mark.parametrize('token', ['TAUJ0.CMOR0', 'ABC_DEF', 'a.b', 'RLN3x.RLN3nLMDn'])
+def test_compound_identifier(token):
+    assert is_compound_identifier(token)
+
+
+@pytest.mark.parametrize('token', ['FLMDCNT', 'register', '.CMOR0', '0.5', 'BEACH'])
+def test_not_compound_identifier(token):
+    assert not is_compound_identifier(token)
+
+
+def test_extract_identifiers():
+    text = ('Set TAUJ0.CMOR0 and FLMDCNT to 0FFH at FFE5 0000H.\n'
+            'BEACH DEADH 0xFFE5_0000 ABC_DEF a.b')
+    identifiers = extract_identifiers(text)
+
+    # 複合識別子は全体と2文字以上の構成要素
+    assert {'TAUJ0.CMOR0', 'TAUJ0', 'CMOR0', 'ABC_DEF', 'ABC', 'DEF', 'a.b'} <= identifiers
+    assert 'a' not in identifiers
+    # 大文字の略語・レジスタ名はそのまま（H で終わる英単語も16進にはしない）
+    assert {'FLMDCNT', 'BEACH', 'DEADH'} <= identifiers
+    # 16進リテラルは正規化した形だけ
+    assert {'0xff', '0xffe50000'} <= identifiers
+    assert not {'0FFH', '0xFFE5_0000', '0xbeac', '0xdead'} & identifiers
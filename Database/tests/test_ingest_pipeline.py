@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""ingest_pipeline の近似重複検出・段落チャンク・相互参照抽出のテスト"""
+
+import pytest
+
+from ingest_pipeline import NearDuplicateIndex, extract_xrefs, parse_reference, simhash, split_chunks
+
+
+def _flip(signature: int, *bits: int) -> int:
+    for bit in bits:
+        signature ^= 1 << bit
+    return signature
+
+
+# ========== SimHash / NearDuplicateIndex ==========
+
+def test_simhash_is_order_and_case_insensitive():
+    text = 'Flash memory erase command sequencer status register'
+    assert simhash(text) == simhash(text.upper())
+    assert simhash(text) == simhash(' '.join(reversed(text.split())))
+    assert simhash('') == 0
+
+
+def test_simhash_similar_pages_are_close():
+    words = [f'word{i}' for i in range(200)]
+    page = ' '.join(words)
+    edited = ' '.join(words[:-1] + ['changed'])
+    other = ' '.join(f'other{i}' for i in range(200))
+    assert bin(simhash(page) ^ simhash(edited)).count('1') <= NearDuplicateIndex().max_distance
+    assert bin(simhash(page) ^ simhash(other)).count('1') > 10
+
+
+def test_near_duplicate_index_first_page_is_canonical():
+    index = NearDuplicateIndex()
+    assert index.add(1, 0x0123456789ABCDEF) is None
+    assert index.add(2, 0x0123456789ABCDEF) == (1, 0)
+
+
+@pytest.mark.parametrize('bits, expected', [
+    ((0,), (1, 1)),
+    ((0, 17), (1, 2)),
+    ((0, 17, 34), (1, 3)),  # 3つのバンドが変わっても残る1つで候補になる
+    ((0, 17, 34, 51), None),
+    ((0, 1, 2, 3), None),   # 同じバンド内でも距離4は重複にしない
+])
+def test_near_duplicate_index_distance_threshold(bits, expected):
+    signature = 0x0123456789ABCDEF
+    index = NearDuplicateIndex(max_distance=3)
+    index.add(1, signature)
+    assert index.add(2, _flip(signature, *bits)) == expected
+
+
+def test_near_duplicate_index_picks_closest_canonical():
+    signature = 0x0123456789ABCDEF
+    index = NearDuplicateIndex(max_distance=3)
+    index.add(1, signature)
+    index.add(2, _flip(signature, 0, 1, 2, 3, 4, 5, 6, 7))  # 1とは別の代表ページ
+    assert index.add(3, _flip(signature, 0, 1, 2, 3, 4, 5, 6)) == (2, 1)
+
+
+def test_near_duplicate_index_duplicates_do_not_become_canonical():
+    signature = 0x0123456789ABCDEF
+    index = NearDuplicateIndex(max_distance=3)
+    index.add(1, signature)
+    assert index.add(2, _flip(signature, 0, 1, 2)) == (1, 3)
+    # 2 は代表ページにならないため、2から距離1でも1から距離4なら重複にしない
+    assert index.add(3, _flip(signature, 0, 1, 2, 3)) is None
+
+
+# ========== split_chunks ==========
+
+PAGE = '\n'.join([
+    'RH850/F1KM Hardware Manual',
+    '3.2 Flash Memory',
+    'The flash memory is erased in blocks. ' * 4,
+    'Each block can be protected.',
+    '3.3 Registers',
+    'FLMDCNT controls the mode. ' * 30,
+    'Page 10 of 98',
+])
+
+
+def test_split_chunks_offsets_map_back_into_text():
+    chunks = split_chunks(PAGE, max_chars=200, min_chars=50)
+    assert len(chunks) > 2
+    for start, end, chunk in chunks:
+        assert PAGE[start:end] == chunk
+        assert 0 < len(chunk) <= 200
+    starts = [start for start, _, _ in chunks]
+    assert starts == sorted(starts)
+    for (_, previous_end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        assert start >= previous_end  # 重ならない
+
+
+def test_split_chunks_breaks_before_headings():
+    chunks = split_chunks(PAGE, max_chars=600, min_chars=50)
+    assert any(chunk.startswith('3.2 Flash Memory') for _, _, chunk in chunks)
+    assert any(chunk.startswith('3.3 Registers') for _, _, chunk in chunks)
+
+
+def test_split_chunks_line_range_skips_header_and_footer():
+    lines = PAGE.split('\n')
+    chunks = split_chunks(PAGE, line_range=(1, len(lines) - 1), max_chars=200, min_chars=50)
+    assert chunks[0][0] == len(lines[0]) + 1
+    assert all('Hardware Manual' not in chunk and 'Page 10' not in chunk for _, _, chunk in chunks)
+    assert all(PAGE[start:end] == chunk for start, end, chunk in chunks)
+
+
+def test_split_chunks_empty_text():
+    assert split_chunks('') == []
+    assert split_chunks(None) == []
+
+
+# ========== 相互参照 ==========
+
+@pytest.mark.parametrize('text, expected', [
+    ('Table 5-1', ('table', '5.1')),
+    ('see Section 3.2', ('section', '3.2')),
+    ('Fig. 2.4', ('figure', '2.4')),
+    ('図2.4', ('figure', '2.4')),
+    ('表5-1', ('table', '5.1')),
+    ('3.2節', ('section', '3.2')),
+    ('第3章', ('section', '3')),
+    ('3.2', ('section', '3.2')),
+    ('flash memory', None),
+])
+def test_parse_reference(text, expected):
+    assert parse_reference(text) == expected
+
+
+def test_extract_xrefs_targets_and_references():
+    text = '\n'.join([
+        '3.2 Flash Memory',
+        'Table 5-1 Register List',
+        'For the timing, see Section 4.1 and Figure 2-3.',
+        'Table 5-1 lists the registers.',
+        '3.3 Registers ........ 45',
+    ])
+    targets, references = extract_xrefs(text)
+
+    assert ('section', '3.2', '3.2 Flash Memory') in targets
+    assert ('table', '5.1', 'Table 5-1 Register List') in targets
+    assert not any(label == '3.3' for _, label, _ in targets)  # 目次の行
+
+    assert [(kind, label) for _, kind, label, _ in references] == [
+        ('section', '4.1'), ('figure', '2.3'), ('table', '5.1')]
+    for offset, _, _, raw in references:
+        assert text[offset:offset + len(raw)] == raw
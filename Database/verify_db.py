@@ -2,80 +2,455 @@
 # -*- coding: utf-8 -*-
 """
 データベース検証スクリプト
+構築時に保存したページ単位のチェックサム（page_checksums）で pages・tables・pages_fts・元PDFの一致を確認し、
+FTS5の integrity-check を実行する。複数のDBは並列に検証し、
+増分モードでは基準のDB（前回検証済み・公開中のDB）の page_checksums と差分を取り、
+チェックサムが変わったページ・全文検索の行と、変わった文書の元PDFだけを確認する。
+
+使い方:
+    python verify_db.py [DB ...] [--pdf PDFまたはディレクトリ] [--incremental 基準DB] [--sources]
+                        [--no-fts-check] [--json 出力先]
 """
 
+import json
 import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from db_publish import fts5_tables
+from extraction_cache import file_sha256
+from page_checksums import (CHECKSUM_VERSION, SINGLE_DOC_ID, compute_page_checksums, is_corpus,
+                            load_page_checksums, source_page_digests)
+
+# 引数なしで実行したときに検証するDB
+DB_PATHS = [
+    r"c:/Users/baoma/TRD/RH850F1KMS1_Board.db",
+    r"c:/Users/baoma/TRD/RH850_FlashMemory_IF.db",
+    r"c:/Users/baoma/TRD/RH850_FlashMemory_IF_Fast.db",
+]
+MAX_WORKERS = 4   # 並列に検証するDBの数（プロセス）
+REPORT_LIMIT = 10  # 問題のあるページとして表示する件数
+
+
+def _pages_label(keys: Iterable, corpus: bool) -> str:
+    """(doc_id, page_num) のリストを表示用に整形（先頭 REPORT_LIMIT 件）"""
+    keys = sorted(keys)
+    labels = [f"{doc_id}:p.{page_num}" if corpus else f"p.{page_num}" for doc_id, page_num in keys[:REPORT_LIMIT]]
+    more = f" ほか{len(keys) - REPORT_LIMIT}件" if len(keys) > REPORT_LIMIT else ''
+    return ', '.join(labels) + more
+
+
+class _Report:
+    """1つのDBの検証結果（問題・警告・工程ごとの時間）"""
+
+    def __init__(self, db_path: str, mode: str):
+        self.data = {'db': db_path, 'mode': mode, 'ok': False, 'problems': [], 'warnings': [],
+                     'pages': 0, 'checked_pages': 0, 'skipped_pages': 0, 'skipped_documents': 0,
+                     'timings': {}, 'seconds': 0.0}
+
+    def problem(self, message: str):
+        self.data['problems'].append(message)
+
+    def warning(self, message: str):
+        self.data['warnings'].append(message)
+
+    def timed(self, name: str, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.data['timings'][name] = round(time.perf_counter() - start, 3)
+
+
+def verify_database(db_path: Union[str, Path], pdf_path: Optional[Union[str, Path]] = None,
+                    reference: Optional[Union[str, Path]] = None, fts_check: bool = True,
+                    check_sources: bool = False) -> Dict[str, Any]:
+    """
+    1つのDBを検証
+
+    1. PRAGMA quick_check
+    2. 構造: ページ数（元PDFのページ数・pages_total・文書ごとのページ数）、
+       どのページにも属さないテーブル・全文検索の行、全文検索の行の重複・欠落
+    3. チェックサム: 本文・テーブル・全文検索の行を読み直してダイジェストを比較
+    4. FTS5の integrity-check（全てのFTS5テーブル）
+    5. 元PDF: pdf_path（単一PDFのDB）または documents.path（コーパスDB、check_sources=True）との一致。
+       ファイル全体のハッシュが一致すれば全ページ一致とみなし、違えばページ単位で比較する。
+
+    reference を渡すと増分モードになる。保存済みのチェックサムが基準DBと同じページは読み直さず
+    （skipped_pages に数える）、全文検索の行のチェックサムが1つも変わっていなければ integrity-check も省略する。
+    コーパスの文書のうち基準DBと同じハッシュで記録され、サイズ・更新時刻も構築時と同じPDFは
+    比較を省略する（skipped_documents に数える）。基準DBにチェックサムが無い場合は全体を検証する。
+
+    integrity-check は読み取り専用の接続では実行できないため、通常の接続で開く（書き込みはしない）。
+
+    Args:
+        db_path: 検証するDB
+        pdf_path: 元PDF（Noneなら元PDFとの比較はしない）
+        reference: 増分モードの基準DB（前回検証済みのDB。Noneなら全体を検証）
+        fts_check: FTS5の integrity-check を実行する
+        check_sources: コーパスDBで documents.path の各PDFと比較する
+
+    Returns:
+        {'db', 'mode', 'ok', 'problems', 'warnings', 'pages', 'checked_pages', 'skipped_pages',
+         'skipped_documents', 'timings', 'seconds'} の辞書
+    """
+    start = time.perf_counter()
+    report = _Report(str(db_path), 'full')
+
+    if not Path(db_path).exists():
+        report.problem(f"DBファイルが見つかりません: {db_path}")
+        return report.data
+
+    conn = sqlite3.connect(str(db_path))
+    try:
+        result = report.timed('quick_check', lambda: conn.execute('PRAGMA quick_check').fetchone()[0])
+        if result != 'ok':
+            report.problem(f"quick_check: {result}")
+            return report.data
+
+        corpus = is_corpus(conn)
+        metadata = dict(conn.execute('SELECT key, value FROM metadata').fetchall())
+        report.timed('structure', _check_structure, conn, corpus, metadata, report)
+
+        stored = load_page_checksums(conn)
+        previous = None
+        if stored is None:
+            report.warning("ページチェックサム（page_checksums）がありません。再構築すると作成されます")
+        else:
+            if metadata.get('checksum_version') != str(CHECKSUM_VERSION):
+                report.warning(f"チェックサムのバージョンが異なります: {metadata.get('checksum_version')}")
+            elif reference:
+                previous = _reference_checksums(reference, report)
+            if previous is not None:
+                report.data['mode'] = 'incremental'
+            report.timed('checksums', _check_checksums, conn, corpus, stored, report, previous)
+
+        if fts_check and not (previous is not None and _fts_unchanged(stored, previous)):
+            report.timed('fts_integrity', _check_fts_integrity, conn, report)
+
+        if pdf_path and not corpus:
+            report.timed('source', _check_source_pdf, Path(pdf_path), metadata, stored, report)
+        elif check_sources and corpus:
+            verified = _reference_documents(reference, report) if reference else None
+            if verified is not None:
+                report.data['mode'] = 'incremental'
+            report.timed('source', _check_corpus_sources, conn, verified, report)
+    except sqlite3.DatabaseError as e:
+        report.problem(f"検証中にエラー: {e}")
+    finally:
+        conn.close()
+        report.data['ok'] = not report.data['problems']
+        report.data['seconds'] = round(time.perf_counter() - start, 3)
+    return report.data
+
+
+def _check_structure(conn: sqlite3.Connection, corpus: bool, metadata: Dict[str, str], report: _Report):
+    """ページ数と、pages・tables・pages_fts の対応を確認"""
+    doc_column = 'doc_id' if corpus else str(SINGLE_DOC_ID)
+    page_keys = set(conn.execute(f'SELECT {doc_column}, page_num FROM pages').fetchall())
+    report.data['pages'] = len(page_keys)
+    if not page_keys:
+        report.problem("ページが1件もありません")
+        return
+
+    # ページ数（構築途中のスナップショットは途中までのページしか持たない）
+    if metadata.get('build_status', 'complete') == 'complete':
+        expected = metadata.get('source_pages') or metadata.get('pages_total')
+        if not corpus and expected and int(expected) != len(page_keys):
+            report.problem(f"ページ数が元PDFと一致しません（期待: {int(expected):,}, 実際: {len(page_keys):,}）")
+        if corpus:
+            for doc_id, name, page_count, actual in conn.execute('''
+                SELECT d.doc_id, d.name, d.page_count, COUNT(p.page_num)
+                FROM documents d LEFT JOIN pages p ON p.doc_id = d.doc_id
+                GROUP BY d.doc_id
+            '''):
+                if page_count is not None and page_count != actual:
+                    report.problem(f"{name}: ページ数が一致しません（期待: {page_count:,}, 実際: {actual:,}）")
+
+    # どのページにも属さないテーブル
+    join = 'p.doc_id = t.doc_id AND p.page_num = t.page_num' if corpus else 'p.page_num = t.page_num'
+    orphans = conn.execute(f'SELECT COUNT(*) FROM tables t LEFT JOIN pages p ON {join} '
+                           f'WHERE p.page_num IS NULL').fetchone()[0]
+    if orphans:
+        report.problem(f"どのページにも属さないテーブルが{orphans:,}件あります")
+
+    # 全文検索の行（1ページ1行。完全に重複するページは索引しない）
+    fts_keys = [(int(doc_id), int(page_num)) for doc_id, page_num in
+                conn.execute(f'SELECT {doc_column}, page_num FROM pages_fts')]
+    fts_key_set = set(fts_keys)
+    if len(fts_key_set) != len(fts_keys):
+        report.problem(f"全文検索の行が重複しています（{len(fts_keys) - len(fts_key_set):,}行）")
+    extra = fts_key_set - page_keys
+    if extra:
+        report.problem(f"どのページにも属さない全文検索の行があります: {_pages_label(extra, corpus)}")
+
+    missing = page_keys - fts_key_set
+    if missing:
+        exact_duplicates = set()
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'page_duplicates'").fetchone():
+            exact_duplicates = set(conn.execute(
+                f'SELECT {doc_column}, page_num FROM page_duplicates WHERE distance = 0').fetchall())
+        missing -= exact_duplicates
+        if missing:
+            report.problem(f"全文検索の索引に無いページがあります: {_pages_label(missing, corpus)}")
+
+
+def _check_checksums(conn: sqlite3.Connection, corpus: bool, stored: Dict, report: _Report,
+                     previous: Optional[Dict] = None):
+    """
+    保存済みのチェックサムと、本文・テーブル・全文検索の行を読み直したダイジェストを比較
 
-DB_PATH = r"c:/Users/baoma/TRD/RH850F1KMS1_Board.db"
+    previous（基準DBのチェックサム）を渡すと、保存済みのチェックサムが基準と同じページは読み直さない。
+    """
+    doc_column = 'doc_id' if corpus else str(SINGLE_DOC_ID)
+    page_keys = set(conn.execute(f'SELECT {doc_column}, page_num FROM pages').fetchall())
+    if set(stored) != page_keys:
+        missing, extra = page_keys - set(stored), set(stored) - page_keys
+        if missing:
+            report.problem(f"チェックサムの無いページがあります: {_pages_label(missing, corpus)}")
+        if extra:
+            report.problem(f"存在しないページのチェックサムがあります: {_pages_label(extra, corpus)}")
 
-def verify_database():
-    """データベースの整合性を検証"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    targets = page_keys & set(stored)
+    if previous is not None:
+        unchanged = {key for key in targets if previous.get(key) == stored[key]}
+        report.data['skipped_pages'] = len(unchanged)
+        targets -= unchanged
+    targets = sorted(targets)
+    report.data['checked_pages'] = len(targets)
+    if not targets:
+        return
+
+    computed = compute_page_checksums(conn, keys=targets if previous is not None else None)
+    for index, kind in enumerate(('text', 'tables', 'fts')):
+        mismatched = [key for key in targets if computed.get(key, {}).get(kind) != stored[key][index]]
+        if mismatched:
+            label = {'text': '本文', 'tables': 'テーブル', 'fts': '全文検索の行'}[kind]
+            report.problem(f"{label}のチェックサムが一致しません（{len(mismatched):,}ページ）: "
+                           f"{_pages_label(mismatched, corpus)}")
+
+
+def _reference_checksums(reference: Union[str, Path], report: _Report) -> Optional[Dict]:
+    """増分モードの基準DBのチェックサム（無い・計算方法が異なる場合はNoneを返し、全ページを確認する）"""
+    if not Path(reference).exists():
+        report.warning(f"基準DBが無いため全ページを確認します: {reference}")
+        return None
+    conn = sqlite3.connect(f"{Path(reference).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        previous = load_page_checksums(conn)
+        row = conn.execute("SELECT value FROM metadata WHERE key = 'checksum_version'").fetchone()
+    except sqlite3.DatabaseError:
+        previous, row = None, None
+    finally:
+        conn.close()
+    if previous is None or row is None or row[0] != str(CHECKSUM_VERSION):
+        report.warning(f"基準DBに同じ方法のチェックサムが無いため全ページを確認します: {reference}")
+        return None
+    return previous
+
+
+def _fts_unchanged(stored: Dict, previous: Dict) -> bool:
+    """全文検索の行のチェックサムが基準DBと全て同じか（同じなら integrity-check を省略する）"""
+    return (set(stored) == set(previous)
+            and all(values[2] == previous[key][2] for key, values in stored.items()))
+
+
+def _reference_documents(reference: Union[str, Path], report: _Report) -> Optional[set]:
+    """増分モードの基準DBに記録された文書の (path, sha256, file_size, file_mtime)（読めなければ全て比較する）"""
+    if not Path(reference).exists():
+        report.warning(f"基準DBが無いため全ての元PDFを比較します: {reference}")
+        return None
+    conn = sqlite3.connect(f"{Path(reference).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        documents = set(conn.execute('SELECT path, sha256, file_size, file_mtime FROM documents').fetchall())
+    except sqlite3.DatabaseError:
+        documents = None
+    finally:
+        conn.close()
+    if documents is None:
+        report.warning(f"基準DBに文書の記録が無いため全ての元PDFを比較します: {reference}")
+    return documents
+
+
+def _check_fts_integrity(conn: sqlite3.Connection, report: _Report):
+    """全てのFTS5テーブルで integrity-check を実行（索引と内容の不一致を検出）"""
+    for table in fts5_tables(conn):
+        try:
+            conn.execute(f"INSERT INTO {table}({table}) VALUES ('integrity-check')")
+        except sqlite3.DatabaseError as e:
+            report.problem(f"{table} の integrity-check に失敗しました: {e}")
+
+
+def _check_source_pdf(pdf_path: Path, metadata: Dict[str, str], stored: Optional[Dict], report: _Report):
+    """元PDFとの一致（ファイル全体のSHA-256、違えばページごとのコンテンツのダイジェスト）"""
+    if pdf_path.is_dir():
+        if not metadata.get('source_name'):
+            report.warning("元PDFの名前（source_name）が記録されていないため、元PDFとは比較しません")
+            return
+        pdf_path = pdf_path / metadata['source_name']
+    if not pdf_path.exists():
+        report.problem(f"元PDFが見つかりません: {pdf_path}")
+        return
+
+    expected = metadata.get('source_sha256')
+    if expected is None:
+        report.warning("元PDFのハッシュ（source_sha256）が記録されていないため、元PDFとは比較しません")
+        return
+    if file_sha256(pdf_path) == expected:
+        return
+
+    sources = {page_num: values[3] for (_, page_num), values in (stored or {}).items() if values[3]}
+    if not sources:
+        report.problem(f"元PDFが構築時と異なります: {pdf_path.name}")
+        return
+    current = source_page_digests(pdf_path)
+    changed = [(SINGLE_DOC_ID, page_num) for page_num, value in sources.items() if current.get(page_num) != value]
+    added = [(SINGLE_DOC_ID, page_num) for page_num in current if page_num not in sources]
+    if changed or added:
+        report.problem(f"元PDFが構築時と異なります: {pdf_path.name}（内容が変わったページ {len(changed):,}、"
+                       f"増えたページ {len(added):,}）: {_pages_label(changed + added, False)}")
+    else:
+        report.warning(f"元PDFのファイルは構築時と異なりますが、全ページの内容は一致しています: {pdf_path.name}")
+
+
+def _check_corpus_sources(conn: sqlite3.Connection, verified: Optional[set], report: _Report):
+    """
+    コーパスの各文書と documents.path のPDFの一致
+
+    増分モード（verified が基準DBの文書の記録）では、基準DBと同じハッシュで記録され、
+    サイズ・更新時刻も記録と同じPDFはハッシュを計算しない（省略した文書数を skipped_documents に数える）。
+    """
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(documents)')}
+    has_stat = {'file_size', 'file_mtime'} <= columns
+    select = 'name, path, sha256' + (', file_size, file_mtime' if has_stat else ', NULL, NULL')
+    for name, path, sha256, size, mtime in conn.execute(f'SELECT {select} FROM documents').fetchall():
+        record = (path, sha256, size, mtime)
+        path = Path(path)
+        if not path.exists():
+            report.problem(f"{name}: 元PDFが見つかりません: {path}")
+            continue
+        stat = path.stat()
+        if (verified is not None and has_stat and record in verified
+                and size == stat.st_size and mtime == stat.st_mtime_ns):
+            report.data['skipped_documents'] += 1
+            continue
+        if file_sha256(path) != sha256:
+            report.problem(f"{name}: 元PDFが構築時と異なります（再構築または corpus_builder.py --watch で更新してください）")
+
+
+def verify_databases(db_paths: Iterable[Union[str, Path]], pdf_path: Optional[Union[str, Path]] = None,
+                     reference: Optional[Union[str, Path]] = None, fts_check: bool = True,
+                     check_sources: bool = False, max_workers: int = MAX_WORKERS) -> List[Dict[str, Any]]:
+    """
+    複数のDBを並列に検証（DBごとに別プロセス）
+
+    Args:
+        db_paths: 検証するDBのリスト
+        pdf_path: 元PDF、または元PDFを置いたディレクトリ（DBごとに metadata の source_name で探す）
+        reference: 増分モードの基準DB（DBが1つの場合のみ）
+        fts_check, check_sources: verify_database を参照
+        max_workers: 並列に検証するDBの数
+
+    Returns:
+        検証結果のリスト（db_paths の順）
+    """
+    db_paths = [str(path) for path in db_paths]
+    if reference and len(db_paths) > 1:
+        raise ValueError("増分モードの基準DBは、検証するDBが1つの場合のみ指定できます")
+    if pdf_path and len(db_paths) > 1 and not Path(pdf_path).is_dir():
+        raise ValueError("複数のDBを検証する場合、--pdf には元PDFを置いたディレクトリを指定してください")
+
+    if len(db_paths) == 1:
+        return [verify_database(db_paths[0], pdf_path, reference, fts_check, check_sources)]
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(db_paths))) as executor:
+        future_to_path = {executor.submit(verify_database, path, pdf_path, None, fts_check, check_sources): path
+                          for path in db_paths}
+        for future in as_completed(future_to_path):
+            path = future_to_path[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                results[path] = {'db': path, 'mode': 'full', 'ok': False, 'problems': [f"検証中にエラー: {e}"],
+                                 'warnings': [], 'pages': 0, 'checked_pages': 0, 'skipped_pages': 0,
+                                 'skipped_documents': 0, 'timings': {}, 'seconds': 0.0}
+    return [results[path] for path in db_paths]
+
+
+def print_report(report: Dict[str, Any]):
+    """検証結果を表示"""
+    mode = '増分' if report['mode'] == 'incremental' else '全体'
+    timings = ', '.join(f"{name} {seconds:.2f}秒" for name, seconds in report['timings'].items())
+    print(f"\n■ {report['db']}（{mode}検証, {report['seconds']:.2f}秒）")
+    print(f"  ページ数: {report['pages']:,}（確認 {report['checked_pages']:,} / "
+          f"変更なしで省略 {report['skipped_pages']:,}）")
+    if report['skipped_documents']:
+        print(f"  元PDFとの比較を省略した文書: {report['skipped_documents']:,}")
+    if timings:
+        print(f"  工程: {timings}")
+    for warning in report['warnings']:
+        print(f"  [警告] {warning}")
+    for problem in report['problems']:
+        print(f"  [ERROR] {problem}")
+    if report['ok']:
+        print("  [OK] 問題は見つかりませんでした")
+
+
+def main():
+    """メイン関数"""
+    args = sys.argv[1:]
+    db_paths, pdf_path, reference, output_path = [], None, None, None
+    fts_check, check_sources = True, False
+    i = 0
+    while i < len(args):
+        if args[i] == '--pdf' and i + 1 < len(args):
+            pdf_path = args[i + 1]
+            i += 1
+        elif args[i] == '--incremental' and i + 1 < len(args):
+            reference = args[i + 1]
+            i += 1
+        elif args[i] == '--json' and i + 1 < len(args):
+            output_path = args[i + 1]
+            i += 1
+        elif args[i] == '--no-fts-check':
+            fts_check = False
+        elif args[i] == '--sources':
+            check_sources = True
+        else:
+            db_paths.append(args[i])
+        i += 1
+    db_paths = db_paths or DB_PATHS
 
     print("=" * 60)
     print("データベース検証レポート")
-    print("=" * 60 + "\n")
-
-    # 基本統計
-    page_count = cursor.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
-    table_count = cursor.execute('SELECT COUNT(*) FROM tables').fetchone()[0]
-    metadata_count = cursor.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
-    fts_count = cursor.execute('SELECT COUNT(*) FROM pages_fts').fetchone()[0]
-
-    print(f"[1] 基本統計:")
-    print(f"    ページ数: {page_count}")
-    print(f"    テーブル数: {table_count}")
-    print(f"    メタデータ数: {metadata_count}")
-    print(f"    FTS5レコード数: {fts_count}")
-
-    # 整合性チェック
-    print(f"\n[2] 整合性チェック:")
-    if page_count == 32:
-        print(f"    [OK] ページ数が正しい (32ページ)")
-    else:
-        print(f"    [ERROR] ページ数が不正 (期待: 32, 実際: {page_count})")
+    print("=" * 60)
+
+    try:
+        reports = verify_databases(db_paths, pdf_path, reference, fts_check, check_sources)
+    except ValueError as e:
+        print(f"エラー: {e}")
+        sys.exit(2)
+
+    for report in reports:
+        print_report(report)
+
+    if output_path:
+        Path(output_path).write_text(json.dumps(reports, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"\n[OK] 検証結果を保存しました: {output_path}")
 
-    if page_count == fts_count:
-        print(f"    [OK] FTS5インデックスが完全")
+    failed = [report['db'] for report in reports if not report['ok']]
+    print("\n" + "=" * 60)
+    if failed:
+        print(f"[ERROR] {len(failed)}/{len(reports)}個のDBで問題が見つかりました")
     else:
-        print(f"    [ERROR] FTS5インデックスが不完全")
-
-    # サンプル検索テスト
-    print(f"\n[3] サンプル検索テスト:")
-    test_queries = ["RH850", "starter", "kit", "motor", "LED"]
-
-    for query in test_queries:
-        cursor.execute('''
-            SELECT COUNT(*) FROM pages_fts WHERE pages_fts MATCH ?
-        ''', (query,))
-        count = cursor.fetchone()[0]
-        print(f"    '{query}': {count}件")
-
-    # テーブル抽出検証
-    print(f"\n[4] テーブル抽出検証:")
-    cursor.execute('SELECT page_num, COUNT(*) as cnt FROM tables GROUP BY page_num ORDER BY cnt DESC LIMIT 5')
-    print(f"    テーブルが最も多いページ:")
-    for row in cursor.fetchall():
-        print(f"      ページ {row[0]}: {row[1]}個のテーブル")
-
-    # メタデータ検証
-    print(f"\n[5] メタデータ検証:")
-    cursor.execute("SELECT value FROM metadata WHERE key = 'Title'")
-    title = cursor.fetchone()
-    if title:
-        print(f"    タイトル: {title[0]}")
-
-    cursor.execute("SELECT value FROM metadata WHERE key = 'Author'")
-    author = cursor.fetchone()
-    if author:
-        print(f"    著者: {author[0]}")
-
-    print(f"\n" + "=" * 60)
-    print("[OK] データベース検証完了")
+        print(f"[OK] {len(reports)}個のDBの検証が完了しました")
     print("=" * 60)
+    sys.exit(1 if failed else 0)
 
-    conn.close()
 
 if __name__ == "__main__":
-    verify_database()
+    main()